@@ -1,13 +1,17 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.utils.html import format_html, format_html_join
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib.admin import display
 from django import forms
 from django.contrib.admin.widgets import FilteredSelectMultiple
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.contrib.postgres.search import SearchQuery
 from django.forms.models import BaseInlineFormSet
-from datetime import timedelta
+from datetime import datetime, time, timedelta
+from django.conf import settings
 import os
 import requests
 from .models import Project, GroupProfile, TgGroup, User, Role, Department, ProjectMember, Task, TopicRole, ForumTopic, TopicBinding, DepartmentMember
@@ -124,9 +128,14 @@ def clone_department_tree(dep: Department, project: Project, parent: Department
 
 
 # ===================== Админка проекта =====================
+def _hours(seconds: float) -> str:
+    return f"{seconds / 86400:.1f} дн." if seconds >= 86400 else f"{seconds / 3600:.1f} ч"
+
+
 @admin.register(Project)
 class ProjectAdmin(admin.ModelAdmin):
     form = ProjectAttachForm
+    readonly_fields = ("flow_summary",)
     list_display = ("name", "status", "groups_count", "members_count", "departments_count", "created_at")
     list_filter = ("status", "created_at")
     search_fields = ("name",)
@@ -144,6 +153,34 @@ class ProjectAdmin(admin.ModelAdmin):
         return Department.objects.filter(project=obj).count()
     departments_count.short_description = "Департаменты"
 
+    def flow_summary(self, obj):
+        """Поток задач за 30 дней по task_flow_daily (миграция 0016): вход/выход и среднее время в статусе"""
+        if not obj.pk:
+            return "—"
+        try:
+            with connection.cursor() as cur:
+                cur.execute("""
+                    SELECT status, SUM(entered), SUM(exited), SUM(seconds_in), SUM(cycle_seconds)
+                    FROM task_flow_daily
+                    WHERE project_id = %s AND day >= %s
+                    GROUP BY status
+                """, [obj.pk, timezone.localdate() - timedelta(days=29)])
+                rows = {r[0]: r[1:] for r in cur.fetchall()}
+        except Exception:
+            return "—"
+        if not rows:
+            return "—"
+        items = format_html_join("", "<li>{}: вошло {} · вышло {} · в статусе ≈ {}</li>", (
+            (status, entered, exited, _hours(seconds_in / exited) if exited else "—")
+            for status, (entered, exited, seconds_in, _) in sorted(rows.items())
+        ))
+        done = rows.get("DONE", (0, 0, 0, 0))
+        return format_html(
+            "Закрыто за 30 дн.: <b>{}</b> · cycle time ≈ <b>{}</b><ul>{}</ul>",
+            done[0], _hours(done[3] / done[0]) if done[0] else "—", items,
+        )
+    flow_summary.short_description = "Поток задач (30 дн.)"
+
     def save_model(self, request, obj, form, change):
         super().save_model(request, obj, form, change)
         if not form.is_valid():
@@ -199,7 +236,7 @@ class ForumTopicInline(admin.TabularInline):
 
 
 # ===================== Админка TgGroup =====================
-from django.db import transaction, connection
+from django.db import transaction, connection, ProgrammingError
 
 @admin.register(TgGroup)
 class TgGroupAdmin(admin.ModelAdmin):
@@ -209,32 +246,21 @@ class TgGroupAdmin(admin.ModelAdmin):
     )
     fields = (
         "title", "telegram_id", "project", "profile",
-        "members_link", "departments_link", "topics_count", "created_at"
+        "members_link", "departments_link", "topics_count", "activity_summary", "created_at"
     )
-    readonly_fields = ("members_link", "departments_link", "topics_count", "created_at")
+    readonly_fields = ("members_link", "departments_link", "topics_count", "activity_summary", "created_at")
     autocomplete_fields = ("project", "profile")
     list_filter = ("project", "profile", "created_at")
     search_fields = ("title", "telegram_id")
     inlines = [ForumTopicInline]
-    actions = ["sync_members_from_logs"]
+    actions = ["sync_members"]
     
-    def sync_members_from_logs(self, request, queryset):
-        """Ручная синхронизация участников из логов"""
-        total_synced = 0
-        for group in queryset:
-            if group.project_id and group.telegram_id:
-                default_role, _ = Role.objects.get_or_create(
-                    name="Member",
-                    defaults={'can_assign': False, 'can_close': False}
-                )
-                count = self._sync_project_members_from_logs(
-                    project_id=group.project_id,
-                    chat_ids=[group.telegram_id],
-                    default_role=default_role
-                )
-                total_synced += count
-        self.message_user(request, f"Синхронизировано {total_synced} участников")
-    sync_members_from_logs.short_description = "Синхронизировать участников из логов"
+    def sync_members(self, request, queryset):
+        """Сверка ProjectMember с составом групп (tg_chat_member, миграция 0018) — один запрос на все выбранные"""
+        chat_ids = list(queryset.filter(project__isnull=False).values_list("telegram_id", flat=True))
+        present, added = self._reconcile_members(chat_ids)
+        self.message_user(request, f"Участников в группах: {present}, добавлено в проекты: {added}")
+    sync_members.short_description = "Синхронизировать участников с проектом"
 
     def profile_badge(self, obj):
         return str(obj.profile) if obj.profile else "—"
@@ -265,79 +291,87 @@ class TgGroupAdmin(admin.ModelAdmin):
         url = reverse("admin:core_department_changelist") + f"?project__id__exact={obj.project_id}"
         return format_html('<a href="{}">Открыть ({} шт.)</a>', url, self.departments_count(obj))
     departments_link.short_description = "Департаменты проекта"
-    
-    def _sync_project_members_from_logs(self, project_id: int, chat_ids: list[int], default_role: Role | None):
-        if not chat_ids:
-            return 0
-        # 1) собрать tg user_id и username из логов
+
+    def activity_summary(self, obj):
+        """Сообщения за 1/7/30 дней и топ топиков — только по сводкам activity_* (миграция 0008)"""
+        if not obj.telegram_id: return "—"
+        today = timezone.localdate()
+        since = {n: today - timedelta(days=n - 1) for n in (1, 7, 30)}
+        bounds = {n: timezone.make_aware(datetime.combine(d, time())) for n, d in since.items()}
         try:
             with connection.cursor() as cur:
                 cur.execute("""
-                    SELECT DISTINCT ru.user_id, ru.username
-                    FROM raw_updates ru
-                    WHERE ru.chat_id = ANY(%s)
-                    AND ru.user_id IS NOT NULL
-                """, (chat_ids,))
-                user_data = cur.fetchall()
+                    WITH a AS (
+                        SELECT topic_id, day AS d, msg_count FROM activity_daily
+                        WHERE chat_id = %(chat)s AND day >= %(d30)s
+                        UNION ALL
+                        SELECT topic_id, (bucket AT TIME ZONE %(tz)s)::date, msg_count FROM activity_hourly
+                        WHERE chat_id = %(chat)s AND bucket >= %(t30)s
+                    )
+                    SELECT topic_id,
+                           COALESCE(SUM(msg_count) FILTER (WHERE d >= %(d1)s), 0),
+                           COALESCE(SUM(msg_count) FILTER (WHERE d >= %(d7)s), 0),
+                           SUM(msg_count)
+                    FROM a GROUP BY topic_id
+                """, {"chat": obj.telegram_id, "tz": settings.TIME_ZONE, "d1": since[1], "d7": since[7],
+                      "d30": since[30], "t30": bounds[30]})
+                rows = cur.fetchall()
         except Exception:
-            # Если таблица raw_updates не существует - пропускаем
-            return 0
-
-        if not user_data:
-            return 0
+            return "—"
+        totals = [sum(r[i] for r in rows) for i in (1, 2, 3)]
+        titles = dict(ForumTopic.objects.filter(group=obj).values_list("topic_id", "title"))
+        top = sorted(rows, key=lambda r: -r[3])[:5]
+        items = format_html_join("", "<li>{} — {}</li>", (
+            ("без топика" if not r[0] else (titles.get(r[0]) or f"#{r[0]}"), r[3]) for r in top
+        ))
+        uniq = self._uniques(obj.telegram_id)
+        return format_html(
+            "Сегодня: <b>{}</b> · 7 дн.: <b>{}</b> · 30 дн.: <b>{}</b> · DAU ≈ <b>{}</b> · WAU ≈ <b>{}</b><ul>{}</ul>",
+            totals[0], totals[1], totals[2], uniq[0], uniq[1], items,
+        )
+    activity_summary.short_description = "Активность"
 
-        # 2) создать или найти пользователей
-        created = 0
-        with transaction.atomic():
-            for tg_user_id, username in user_data:
-                # Найти или создать User
-                user, user_created = User.objects.get_or_create(
-                    telegram_id=tg_user_id,
-                    defaults={
-                        'username': username or f'user_{tg_user_id}',
-                        'status': 'active'
-                    }
-                )
-                
-                # Добавить в ProjectMember (роль обязательна!)
-                if not default_role:
-                    # Если роль не передана - создаем дефолтную
-                    default_role, _ = Role.objects.get_or_create(
-                        name='Member',
-                        defaults={'can_assign': False, 'can_close': False}
-                    )
-                
-                pm, was_created = ProjectMember.objects.get_or_create(
-                    project_id=project_id,
-                    user_id=user.id,
-                    role=default_role,
-                    defaults={}
-                )
-                    
-                if was_created:
-                    created += 1
-        return created
+    def _uniques(self, chat_id: int) -> tuple:
+        """Последний снимок DAU/WAU по всему чату (HyperLogLog, миграция 0009)"""
+        try:
+            with connection.cursor() as cur:
+                cur.execute("""
+                    SELECT dau, wau FROM activity_uniques
+                    WHERE chat_id = %s AND topic_id = 0
+                    ORDER BY day DESC LIMIT 1
+                """, (chat_id,))
+                row = cur.fetchone()
+        except Exception:
+            row = None
+        return row or ("—", "—")
+    
+    def _reconcile_members(self, chat_ids: list[int]) -> tuple[int, int]:
+        """
+        SQL-функция tg_members_reconcile (миграция 0019, её же вызывает бот):
+        присутствующие в группах (tg_chat_member, а без апдейтов — user_chat_activity)
+        без роли в проекте получают роль Member. (присутствуют, добавлено)
+        """
+        if not chat_ids:
+            return 0, 0
+        role, _ = Role.objects.get_or_create(name="Member", defaults={'can_assign': False, 'can_close': False})
+        try:
+            with transaction.atomic(), connection.cursor() as cur:
+                cur.execute("SELECT present, added FROM tg_members_reconcile(%s::bigint[], %s)", [chat_ids, role.pk])
+                return cur.fetchone()
+        except ProgrammingError:
+            # миграции 0018/0019 ещё не применены — сверять не с чем
+            return 0, 0
 
     def save_model(self, request, obj: TgGroup, form, change):
-        """Сохранение группы без обращения к несуществующим полям"""
-        # Если есть FK на проект — обычное сохранение
+        """Сохранение группы; при привязке к проекту — сверка участников"""
         super().save_model(request, obj, form, change)
 
-        # После сохранения: если у группы есть проект — подтянуть ProjectMember из логов
-        if obj.project_id and obj.telegram_id:
-            # Базовая роль по умолчанию - создаем если нет
-            default_role, _ = Role.objects.get_or_create(
-                name="Member",
-                defaults={'can_assign': False, 'can_close': False}
-            )
-            created_count = self._sync_project_members_from_logs(
-                project_id=obj.project_id,
-                chat_ids=[obj.telegram_id],
-                default_role=default_role
-            )
-            if created_count > 0:
+        # Состав ведёт бот по chat_member — сверка нужна, только когда поменялся проект
+        if obj.project_id and obj.telegram_id and "project" in form.changed_data:
+            _, added = self._reconcile_members([obj.telegram_id])
+            if added > 0:
                 from django.contrib import messages
-                messages.success(request, f"Синхронизировано {created_count} участников из группы")
+                messages.success(request, f"Добавлено в проект {added} участников группы")
 
 
 # ===================== Инлайны для пользователей =====================
@@ -441,21 +475,21 @@ class UserProjectMemberInline(admin.TabularInline):
 def _groups_for_user_tgid(tg_user_id: int, only_projects: list[int] | None = None):
     """
     Возвращает список групп (id, title, telegram_id, project_id),
-    в которых пользователь писал сообщения (по raw_updates).
+    в которых пользователь писал сообщения (по user_chat_activity).
     """
     if tg_user_id is None:
         return []
     try:
         with connection.cursor() as cur:
-            # 1) получить chat_id, где писал пользователь
+            # 1) получить chat_id, где писал пользователь (PK user_chat_activity)
             cur.execute("""
-                SELECT DISTINCT ru.chat_id
-                FROM raw_updates ru
-                WHERE ru.user_id = %s
+                SELECT a.chat_id
+                FROM user_chat_activity a
+                WHERE a.user_id = %s
             """, [tg_user_id])
             chat_ids = [r[0] for r in cur.fetchall()]
     except Exception:
-        # Если таблица raw_updates не существует
+        # Если таблица user_chat_activity не существует
         return []
 
     if not chat_ids:
@@ -489,6 +523,23 @@ class UserAdmin(admin.ModelAdmin):
     list_filter = ("status",)
     search_fields = ("username", "first_name", "last_name", "telegram_id")  # Важно для автокомплита!
 
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Подстрочный поиск через lower(...) LIKE — попадает в trigram-индексы
+        idx_user_*_trgm (icontains даёт UPPER(...) и сканирует таблицу).
+        Используется и автокомплитом (autocomplete_fields у других админок).
+        """
+        term = search_term.strip().lstrip("@").lower()
+        if not term:
+            return queryset, False
+        q = Q(username_l__contains=term) | Q(first_name_l__contains=term) | Q(last_name_l__contains=term)
+        if term.isdigit():
+            q |= Q(telegram_id=int(term))
+        queryset = queryset.annotate(
+            username_l=Lower("username"), first_name_l=Lower("first_name"), last_name_l=Lower("last_name"),
+        ).filter(q)
+        return queryset, False
+
     def summary_html(self, obj: User):
         # Проекты
         pm = (ProjectMember.objects
@@ -1131,6 +1182,29 @@ class TaskAdmin(admin.ModelAdmin):
     list_filter = ("status", "project", "created_at")
     search_fields = ("title", "description", "responsible_username")
     readonly_fields = ("created_at", "updated_at")
+
+    def get_queryset(self, request):
+        # tsvector нужен только в WHERE — не тащим его в список
+        return super().get_queryset(request).defer("search_tsv")
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Поиск по GIN-индексу search_tsv (russian, websearch-синтаксис) вместо
+        icontains-сканов; @username — точное совпадение ответственного
+        """
+        term = " ".join(search_term.split())
+        if not term:
+            return queryset, False
+        query = SearchQuery(term, config="russian", search_type="websearch")
+        by_user = Q(responsible_username__iexact=term.lstrip("@"))
+        return queryset.filter(Q(search_tsv=query) | by_user), False
+    
+    def save_model(self, request, obj, form, change):
+        # app.actor читает триггер task_events (миграция 0016) — смена статуса из админки подписана
+        with transaction.atomic():
+            with connection.cursor() as cur:
+                cur.execute("SELECT set_config('app.actor', %s, true)", [f"admin:{request.user.get_username()}"])
+            super().save_model(request, obj, form, change)
     
     def responsible_display(self, obj):
         if obj.responsible_user:
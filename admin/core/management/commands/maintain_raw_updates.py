@@ -0,0 +1,31 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = 'Обслуживание секций raw_updates: создать будущие, отцепить/удалить устаревшие'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int,
+                            default=int(os.environ.get('RAW_UPDATES_MONTHS_AHEAD', '2')),
+                            help='Сколько месяцев вперёд держать готовые секции')
+        parser.add_argument('--retention', type=int,
+                            default=int(os.environ.get('RAW_UPDATES_RETENTION_MONTHS', '0')),
+                            help='Хранить N месяцев (0 — хранить всё)')
+        parser.add_argument('--mode', choices=['detach', 'drop'],
+                            default=os.environ.get('RAW_UPDATES_RETENTION_MODE', 'detach'),
+                            help='Что делать с устаревшими секциями')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT action FROM raw_updates_maintain(%s, %s, %s) AS action",
+                [options['ahead'], options['retention'], options['mode']],
+            )
+            actions = [r[0] for r in cursor.fetchall()]
+
+        for action in actions:
+            self.stdout.write(f"  {action}")
+        self.stdout.write(f"Итого действий: {len(actions)}")
@@ -24,20 +24,20 @@ class Command(BaseCommand):
             try:
                 with connection.cursor() as cursor:
                     cursor.execute("""
-                        SELECT DISTINCT user_id, 
-                               payload->>'username' as username
-                        FROM raw_updates 
-                        WHERE chat_id = ANY(%s) 
-                        AND user_id IS NOT NULL
+                        SELECT a.user_id, MAX(u.username) as username
+                        FROM user_chat_activity a
+                        LEFT JOIN core_user u ON u.telegram_id = a.user_id
+                        WHERE a.chat_id = ANY(%s)
+                        GROUP BY a.user_id
                     """, [group_ids])
                     
                     user_data = cursor.fetchall()
             except Exception as e:
-                self.stdout.write(f"  Ошибка чтения raw_updates: {e}")
+                self.stdout.write(f"  Ошибка чтения user_chat_activity: {e}")
                 continue
             
             if not user_data:
-                self.stdout.write(f"  Нет данных в raw_updates для групп проекта")
+                self.stdout.write(f"  Нет активности в группах проекта")
                 continue
             
             # Получить или создать роль по умолчанию
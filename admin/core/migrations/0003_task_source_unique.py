@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+# Старый /checklast мог создать несколько задач по одному сообщению. Перед
+# уникальным ключом оставляем ссылку на сообщение только у самой ранней, у
+# остальных обнуляется source_message_id (NULL в ключе не конфликтует) — задачи
+# не теряются и остаются в своём чате.
+SQL_DEDUP_SOURCES = """
+UPDATE core_task t
+   SET source_message_id = NULL
+  FROM (
+      SELECT id, row_number() OVER (PARTITION BY source_chat_id, source_message_id ORDER BY id) AS rn
+      FROM core_task
+      WHERE source_chat_id IS NOT NULL AND source_message_id IS NOT NULL
+  ) d
+ WHERE t.id = d.id AND d.rn > 1
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_raw_updates_sql'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL_DEDUP_SOURCES, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(fields=('source_chat_id', 'source_message_id'), name='uniq_task_source_message'),
+        ),
+    ]
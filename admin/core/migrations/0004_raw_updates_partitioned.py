@@ -0,0 +1,144 @@
+from django.db import migrations
+
+from ._raw_partitions import ensure_partition_sql
+
+# raw_updates -> декларативное секционирование по месяцам (RANGE по created_at).
+# Границы секций — начало месяца по UTC, имена raw_updates_pYYYYMM.
+# raw_updates_default ловит строки вне существующих секций (страховка, если
+# обслуживание давно не запускалось); raw_updates_maintain() переносит их в
+# нужную секцию при её создании.
+
+SQL_FUNCTIONS = ensure_partition_sql() + r"""
+-- Обслуживание: секции на months_ahead месяцев вперёд + удержание.
+-- retention_months = 0 — хранить всё; mode = 'detach' (секция остаётся отдельной
+-- таблицей для архивации) или 'drop'.
+CREATE OR REPLACE FUNCTION raw_updates_maintain(months_ahead int, retention_months int, mode text DEFAULT 'detach')
+RETURNS SETOF text LANGUAGE plpgsql AS $$
+DECLARE
+    cur    date := date_trunc('month', now() AT TIME ZONE 'UTC')::date;
+    cutoff date;
+    r      record;
+    msg    text;
+BEGIN
+    FOR i IN 0..GREATEST(months_ahead, 0) LOOP
+        msg := raw_updates_ensure_partition((cur + make_interval(months => i))::date);
+        IF msg IS NOT NULL THEN
+            RETURN NEXT msg;
+        END IF;
+    END LOOP;
+
+    IF retention_months IS NULL OR retention_months <= 0 THEN
+        RETURN;
+    END IF;
+    cutoff := (cur - make_interval(months => retention_months))::date;
+    FOR r IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'raw_updates'::regclass
+          AND c.relname ~ '^raw_updates_p[0-9]{6}$'
+          AND to_date(substr(c.relname, 14), 'YYYYMM') < cutoff
+        ORDER BY c.relname
+    LOOP
+        IF mode = 'drop' THEN
+            EXECUTE format('DROP TABLE %I', r.relname);
+            RETURN NEXT 'dropped ' || r.relname;
+        ELSE
+            EXECUTE format('ALTER TABLE raw_updates DETACH PARTITION %I', r.relname);
+            RETURN NEXT 'detached ' || r.relname;
+        END IF;
+    END LOOP;
+END $$;
+"""
+
+SQL_FWD = SQL_FUNCTIONS + r"""
+DO $$
+DECLARE
+    first_month date;
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_class WHERE relname = 'raw_updates' AND relkind = 'p') THEN
+        RETURN;  -- уже секционирована
+    END IF;
+
+    ALTER TABLE raw_updates RENAME TO raw_updates_legacy;
+    -- таблица могла быть создана ботом (ensure_schema) без username
+    ALTER TABLE raw_updates_legacy ADD COLUMN IF NOT EXISTS username VARCHAR(255);
+    ALTER INDEX IF EXISTS raw_updates_pkey RENAME TO raw_updates_legacy_pkey;
+    ALTER INDEX IF EXISTS idx_raw_chat_created RENAME TO idx_raw_legacy_chat_created;
+    ALTER INDEX IF EXISTS idx_raw_chat_msg RENAME TO idx_raw_legacy_chat_msg;
+    ALTER INDEX IF EXISTS idx_raw_created RENAME TO idx_raw_legacy_created;
+
+    -- Ключ секционирования обязан входить в PK; id продолжает ту же последовательность
+    CREATE TABLE raw_updates (
+        id BIGINT NOT NULL DEFAULT nextval('raw_updates_id_seq'),
+        chat_id BIGINT NOT NULL,
+        message_id BIGINT,
+        user_id BIGINT,
+        username VARCHAR(255),
+        text TEXT DEFAULT '',
+        topic_id BIGINT,
+        payload JSONB DEFAULT '{}',
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at);
+    ALTER SEQUENCE raw_updates_id_seq OWNED BY raw_updates.id;
+
+    CREATE INDEX idx_raw_chat_created ON raw_updates (chat_id, created_at);
+    CREATE INDEX idx_raw_chat_msg     ON raw_updates (chat_id, message_id);
+    CREATE INDEX idx_raw_created      ON raw_updates (created_at);
+    CREATE INDEX idx_raw_user_chat    ON raw_updates (user_id, chat_id);
+    CREATE TABLE raw_updates_default PARTITION OF raw_updates DEFAULT;
+
+    -- Секции под существующие данные + текущий и два следующих месяца
+    SELECT date_trunc('month', min(created_at) AT TIME ZONE 'UTC')::date INTO first_month FROM raw_updates_legacy;
+    first_month := COALESCE(first_month, date_trunc('month', now() AT TIME ZONE 'UTC')::date);
+    WHILE first_month < date_trunc('month', now() AT TIME ZONE 'UTC')::date LOOP
+        PERFORM raw_updates_ensure_partition(first_month);
+        first_month := (first_month + interval '1 month')::date;
+    END LOOP;
+    PERFORM raw_updates_maintain(2, 0);
+
+    INSERT INTO raw_updates (id, chat_id, message_id, user_id, username, text, topic_id, payload, created_at)
+    SELECT id, COALESCE(chat_id, 0), message_id, user_id, username, text, topic_id,
+           COALESCE(payload, '{}'::jsonb), COALESCE(created_at, NOW())
+    FROM raw_updates_legacy;
+
+    DROP TABLE raw_updates_legacy;
+END $$;
+"""
+
+SQL_BWD = r"""
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_class WHERE relname = 'raw_updates' AND relkind = 'p') THEN
+        RETURN;
+    END IF;
+
+    CREATE TABLE raw_updates_flat (
+        id BIGINT PRIMARY KEY DEFAULT nextval('raw_updates_id_seq'),
+        chat_id BIGINT NOT NULL,
+        message_id BIGINT,
+        user_id BIGINT,
+        username VARCHAR(255),
+        text TEXT DEFAULT '',
+        topic_id BIGINT,
+        payload JSONB DEFAULT '{}',
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    INSERT INTO raw_updates_flat SELECT id, chat_id, message_id, user_id, username, text, topic_id, payload, created_at FROM raw_updates;
+    ALTER SEQUENCE raw_updates_id_seq OWNED BY raw_updates_flat.id;
+    DROP TABLE raw_updates CASCADE;
+    ALTER TABLE raw_updates_flat RENAME TO raw_updates;
+    ALTER TABLE raw_updates RENAME CONSTRAINT raw_updates_flat_pkey TO raw_updates_pkey;
+    CREATE INDEX idx_raw_chat_created ON raw_updates (chat_id, created_at);
+    CREATE INDEX idx_raw_chat_msg     ON raw_updates (chat_id, message_id);
+    CREATE INDEX idx_raw_created      ON raw_updates (created_at);
+END $$;
+DROP FUNCTION IF EXISTS raw_updates_maintain(int, int, text);
+DROP FUNCTION IF EXISTS raw_updates_ensure_partition(date);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0003_task_source_unique")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
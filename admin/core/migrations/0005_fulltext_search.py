@@ -0,0 +1,47 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+from ._raw_partitions import COLUMNS_0005, ensure_partition_sql
+
+# Полнотекстовый поиск (russian): raw_updates.text_tsv + GIN.
+# raw_updates не управляется Django, поэтому — сырой SQL. Генерируемая колонка
+# переписывает таблицу (все секции) один раз при миграции.
+#
+# raw_updates_ensure_partition() переопределяется (тело — в _raw_partitions):
+# новая секция через LIKE должна наследовать генерируемую колонку (INCLUDING
+# GENERATED), а перенос строк из default — перечислять колонки явно (в
+# генерируемую колонку вставлять нельзя). Откат возвращает версию 0004.
+
+SQL_RAW_FWD = r"""
+ALTER TABLE raw_updates
+    ADD COLUMN IF NOT EXISTS text_tsv tsvector
+    GENERATED ALWAYS AS (to_tsvector('russian'::regconfig, COALESCE(text, ''))) STORED;
+CREATE INDEX IF NOT EXISTS idx_raw_text_tsv ON raw_updates USING GIN (text_tsv);
+
+""" + ensure_partition_sql(COLUMNS_0005)
+
+SQL_RAW_BWD = r"""
+DROP INDEX IF EXISTS idx_raw_text_tsv;
+ALTER TABLE raw_updates DROP COLUMN IF EXISTS text_tsv;
+""" + ensure_partition_sql()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_raw_updates_partitioned'),
+    ]
+
+    operations = [
+        migrations.RunSQL(sql=SQL_RAW_FWD, reverse_sql=SQL_RAW_BWD),
+        migrations.AddField(
+            model_name='task',
+            name='search_tsv',
+            field=models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.CombinedSearchVector(django.contrib.postgres.search.SearchVector('title', config='russian', weight='A'), '||', django.contrib.postgres.search.SearchVector('description', config='russian', weight='B'), django.contrib.postgres.search.SearchConfig('russian')), output_field=django.contrib.postgres.search.SearchVectorField()),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_tsv'], name='idx_task_search_tsv'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+# Сводка «кто где писал»: одна строка на пару (пользователь, чат).
+# Ведётся ботом инкрементально при ingest (log_raw_update), поэтому выборки
+# «группы пользователя» и «участники чата» не сканируют raw_updates.
+# user_id / chat_id — Telegram ID, как в raw_updates.
+
+SQL_FWD = """
+CREATE TABLE IF NOT EXISTS user_chat_activity (
+    user_id    BIGINT NOT NULL,
+    chat_id    BIGINT NOT NULL,
+    first_seen TIMESTAMPTZ NOT NULL,
+    last_seen  TIMESTAMPTZ NOT NULL,
+    msg_count  BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS idx_uca_chat_last_seen ON user_chat_activity (chat_id, last_seen DESC);
+
+-- Разовое заполнение из накопленного журнала
+INSERT INTO user_chat_activity (user_id, chat_id, first_seen, last_seen, msg_count)
+SELECT user_id, chat_id, MIN(created_at), MAX(created_at), COUNT(*)
+FROM raw_updates
+WHERE user_id IS NOT NULL AND chat_id IS NOT NULL
+GROUP BY user_id, chat_id
+ON CONFLICT (user_id, chat_id) DO NOTHING;
+"""
+
+SQL_BWD = """
+DROP TABLE IF EXISTS user_chat_activity;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0006_user_username_indexes")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
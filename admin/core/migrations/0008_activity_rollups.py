@@ -0,0 +1,45 @@
+from django.db import migrations
+
+# Почасовые сводки активности по (чат, топик, пользователь, час) и их суточное
+# уплотнение. Ведутся ботом (services.rollups) от водяного знака по raw_updates.id;
+# /stats и админка читают только эти таблицы.
+# chat_id / user_id — Telegram ID; topic_id = 0 — без топика, user_id = 0 — неизвестен.
+
+SQL_FWD = """
+CREATE TABLE IF NOT EXISTS activity_hourly (
+    chat_id   BIGINT NOT NULL,
+    bucket    TIMESTAMPTZ NOT NULL,
+    topic_id  BIGINT NOT NULL DEFAULT 0,
+    user_id   BIGINT NOT NULL DEFAULT 0,
+    msg_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, bucket, topic_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_activity_hourly_bucket ON activity_hourly (bucket);
+
+CREATE TABLE IF NOT EXISTS activity_daily (
+    chat_id   BIGINT NOT NULL,
+    day       DATE NOT NULL,
+    topic_id  BIGINT NOT NULL DEFAULT 0,
+    user_id   BIGINT NOT NULL DEFAULT 0,
+    msg_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (chat_id, day, topic_id, user_id)
+);
+
+CREATE TABLE IF NOT EXISTS rollup_watermark (
+    name       TEXT PRIMARY KEY,
+    last_id    BIGINT NOT NULL DEFAULT 0,
+    last_ts    TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+SQL_BWD = """
+DROP TABLE IF EXISTS rollup_watermark;
+DROP TABLE IF EXISTS activity_daily;
+DROP TABLE IF EXISTS activity_hourly;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0007_user_chat_activity")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
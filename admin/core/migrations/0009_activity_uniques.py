@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# Снимки приблизительных DAU/WAU (HyperLogLog в Redis, services.uniques).
+# Бот периодически пишет PFCOUNT за вчера и сегодня; админка читает только снимки.
+# chat_id — Telegram ID; topic_id = 0 — весь чат; day — дата в TIMEZONE.
+
+SQL_FWD = """
+CREATE TABLE IF NOT EXISTS activity_uniques (
+    chat_id    BIGINT NOT NULL,
+    topic_id   BIGINT NOT NULL DEFAULT 0,
+    day        DATE NOT NULL,
+    dau        INTEGER NOT NULL DEFAULT 0,
+    wau        INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (chat_id, day, topic_id)
+);
+"""
+
+SQL_BWD = """
+DROP TABLE IF EXISTS activity_uniques;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0008_activity_rollups")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# Полный апдейт Telegram (msgpack + zstd, services.payloads) — отдельно от горячей
+# raw_updates. raw_id = raw_updates.id; dict_id = raw_payload_dicts.id (0 — без словаря).
+# body уже сжат, поэтому STORAGE EXTERNAL: TOAST не тратит CPU на повторное сжатие.
+
+SQL_FWD = """
+CREATE TABLE IF NOT EXISTS raw_payload_dicts (
+    id         SERIAL PRIMARY KEY,
+    dict       BYTEA NOT NULL,
+    samples    INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS raw_payloads (
+    raw_id  BIGINT PRIMARY KEY,
+    dict_id INTEGER NOT NULL DEFAULT 0,
+    body    BYTEA NOT NULL
+);
+ALTER TABLE raw_payloads ALTER COLUMN body SET STORAGE EXTERNAL;
+"""
+
+SQL_BWD = """
+DROP TABLE IF EXISTS raw_payloads;
+DROP TABLE IF EXISTS raw_payload_dicts;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0009_activity_uniques")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
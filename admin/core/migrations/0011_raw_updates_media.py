@@ -0,0 +1,25 @@
+from django.db import migrations
+
+from ._raw_partitions import COLUMNS_0005, COLUMNS_0011, ensure_partition_sql
+
+# Медиа во входящих сообщениях (services.media): raw_updates.media — компактный
+# список вложений [{type, file_unique_id, file_id, size, ...}], подпись идёт в text.
+# Альбом пишется одной строкой: все вложения в media, id сообщений — в payload.album_ids.
+#
+# raw_updates_ensure_partition() переопределяется (тело — в _raw_partitions):
+# перенос строк из default перечисляет колонки явно, и новая колонка должна в
+# нём участвовать. Откат возвращает версию 0005 без media.
+
+SQL_FWD = r"""
+ALTER TABLE raw_updates ADD COLUMN IF NOT EXISTS media jsonb;
+
+""" + ensure_partition_sql(COLUMNS_0011)
+
+SQL_BWD = r"""
+ALTER TABLE raw_updates DROP COLUMN IF EXISTS media;
+""" + ensure_partition_sql(COLUMNS_0005)
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0010_raw_payloads")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
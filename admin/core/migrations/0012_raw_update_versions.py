@@ -0,0 +1,26 @@
+from django.db import migrations
+
+# История правок сообщений (services.edits): в raw_updates — текущая версия,
+# здесь — прежние, по одной строке на правку. version растёт с 1 (исходный текст).
+# Только текст и вложения, без payload — таблица компактная.
+
+SQL_FWD = """
+CREATE TABLE IF NOT EXISTS raw_update_versions (
+    chat_id     BIGINT NOT NULL,
+    message_id  BIGINT NOT NULL,
+    version     INTEGER NOT NULL,
+    text        TEXT,
+    media       JSONB,
+    replaced_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (chat_id, message_id, version)
+);
+"""
+
+SQL_BWD = """
+DROP TABLE IF EXISTS raw_update_versions;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0011_raw_updates_media")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
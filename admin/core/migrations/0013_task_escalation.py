@@ -0,0 +1,32 @@
+# Generated by Django 5.0.4 on 2026-10-19 08:11
+
+from django.db import migrations, models
+
+# Задачи, созданные до эскалации, считаем принятыми: иначе первый reconcile
+# поставит таймер каждой старой TODO-задаче из топика и переназначит их разом.
+SQL_ACK_EXISTING = "UPDATE core_task SET acknowledged_at = created_at WHERE acknowledged_at IS NULL"
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_raw_update_versions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='acknowledged_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Принята'),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='escalation_level',
+            field=models.PositiveSmallIntegerField(db_default=0, default=0, verbose_name='Уровень эскалации'),
+        ),
+        migrations.RunSQL(sql=SQL_ACK_EXISTING, reverse_sql=migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(condition=models.Q(('acknowledged_at__isnull', True), ('source_topic_id__isnull', False), ('status', 'TODO')), fields=['id'], name='idx_task_escalation_open'),
+        ),
+    ]
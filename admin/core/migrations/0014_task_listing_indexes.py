@@ -0,0 +1,71 @@
+# Generated by Django 5.0.4 on 2026-10-19 08:17
+
+from django.db import migrations, models
+
+# Уведомления об изменениях задач для кэшей бота (services.task_changes):
+# INSERT/DELETE и UPDATE видимых полей -> pg_notify('task_changed', {id, old, new}),
+# old/new — [telegram_id ответственного, username, чат, топик, проект, статус].
+# Правки служебных полей (updated_at, acknowledged_at, ...) не шумят.
+
+SQL_FWD = """
+CREATE OR REPLACE FUNCTION core_task_notify() RETURNS trigger AS $$
+DECLARE
+    o json;
+    n json;
+BEGIN
+    IF TG_OP = 'UPDATE' AND (OLD.title, OLD.status, OLD.deadline, OLD.responsible_user_id,
+                             OLD.responsible_username, OLD.project_id, OLD.source_chat_id, OLD.source_topic_id)
+        IS NOT DISTINCT FROM (NEW.title, NEW.status, NEW.deadline, NEW.responsible_user_id,
+                              NEW.responsible_username, NEW.project_id, NEW.source_chat_id, NEW.source_topic_id) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP <> 'INSERT' THEN
+        o := json_build_array((SELECT telegram_id FROM core_user WHERE id = OLD.responsible_user_id),
+                              OLD.responsible_username, OLD.source_chat_id, OLD.source_topic_id,
+                              OLD.project_id, OLD.status);
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        n := json_build_array((SELECT telegram_id FROM core_user WHERE id = NEW.responsible_user_id),
+                              NEW.responsible_username, NEW.source_chat_id, NEW.source_topic_id,
+                              NEW.project_id, NEW.status);
+    END IF;
+    PERFORM pg_notify('task_changed', json_build_object(
+        'id', CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END, 'old', o, 'new', n
+    )::text);
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS core_task_notify ON core_task;
+CREATE TRIGGER core_task_notify
+    AFTER INSERT OR UPDATE OR DELETE ON core_task
+    FOR EACH ROW EXECUTE FUNCTION core_task_notify();
+"""
+
+SQL_BWD = """
+DROP TRIGGER IF EXISTS core_task_notify ON core_task;
+DROP FUNCTION IF EXISTS core_task_notify();
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_task_escalation'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['responsible_user', 'status', 'deadline'], name='idx_task_resp_status_dl'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['project', 'status', 'deadline'], name='idx_task_project_status_dl'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['source_chat_id', 'status', 'deadline'], name='idx_task_chat_status_dl'),
+        ),
+        migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD),
+    ]
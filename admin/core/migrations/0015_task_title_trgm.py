@@ -0,0 +1,19 @@
+# Generated by Django 5.0.4 on 2026-10-19 08:19
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_task_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='task',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Lower('title'), name='gin_trgm_ops'), name='idx_task_title_trgm'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+from django.db import migrations
+
+# Журнал смен статуса задач и суточные сводки потока по проектам.
+# task_events пишет триггер core_task_status_event — один путь для бота и админки:
+# INSERT задачи и UPDATE, реально меняющий status. actor берётся из
+# current_setting('app.actor') (бот — 'tg:<telegram_id>', админка — 'admin:<login>'),
+# для новой задачи по умолчанию — её автор. status_since — когда задача вошла в
+# from_status (предыдущее событие или created_at), чтобы сводка не читала историю.
+# task_flow_daily ведёт services.task_flow от водяного знака по task_events.id
+# (rollup_watermark, name = 'task_flow'); project_id = 0 — без проекта.
+
+SQL_FWD = """
+CREATE TABLE IF NOT EXISTS task_events (
+    id              BIGSERIAL PRIMARY KEY,
+    task_id         BIGINT NOT NULL,
+    project_id      BIGINT,
+    from_status     VARCHAR(16),
+    to_status       VARCHAR(16) NOT NULL,
+    actor           TEXT,
+    ts              TIMESTAMPTZ NOT NULL DEFAULT now(),
+    status_since    TIMESTAMPTZ,
+    task_created_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS idx_task_events_task ON task_events (task_id, id);
+
+CREATE TABLE IF NOT EXISTS task_flow_daily (
+    project_id    BIGINT NOT NULL,
+    day           DATE NOT NULL,
+    status        VARCHAR(16) NOT NULL,
+    entered       BIGINT NOT NULL DEFAULT 0,
+    exited        BIGINT NOT NULL DEFAULT 0,
+    seconds_in    DOUBLE PRECISION NOT NULL DEFAULT 0,
+    cycle_seconds DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (project_id, day, status)
+);
+
+CREATE OR REPLACE FUNCTION core_task_status_event() RETURNS trigger AS $$
+DECLARE
+    who text := NULLIF(current_setting('app.actor', true), '');
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO task_events (task_id, project_id, from_status, to_status, actor, task_created_at)
+        VALUES (NEW.id, NEW.project_id, NULL, NEW.status,
+                COALESCE(who, (SELECT 'tg:' || telegram_id FROM core_user WHERE id = NEW.author_user_id)),
+                NEW.created_at);
+    ELSIF OLD.status IS DISTINCT FROM NEW.status THEN
+        INSERT INTO task_events (task_id, project_id, from_status, to_status, actor, status_since, task_created_at)
+        VALUES (NEW.id, NEW.project_id, OLD.status, NEW.status, who,
+                COALESCE((SELECT ts FROM task_events WHERE task_id = NEW.id ORDER BY id DESC LIMIT 1), OLD.created_at),
+                NEW.created_at);
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS core_task_status_event ON core_task;
+CREATE TRIGGER core_task_status_event
+    AFTER INSERT OR UPDATE OF status ON core_task
+    FOR EACH ROW EXECUTE FUNCTION core_task_status_event();
+"""
+
+SQL_BWD = """
+DROP TRIGGER IF EXISTS core_task_status_event ON core_task;
+DROP FUNCTION IF EXISTS core_task_status_event();
+DROP TABLE IF EXISTS task_flow_daily;
+DROP TABLE IF EXISTS task_events;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0015_task_title_trgm")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
@@ -0,0 +1,71 @@
+from django.db import migrations
+
+# Транзакционный outbox событий задач для внешних систем (services.outbox).
+# Строку пишет триггер core_task_outbox в той же транзакции, что и изменение
+# core_task: откат задачи откатывает и событие, коммит — гарантирует доставку.
+# События: task.created (INSERT), task.closed (status -> DONE), task.status_changed.
+# Реле удаляет строку после доставки во все приёмники; при ошибке — attempts + 1
+# и next_attempt_at с экспоненциальной паузой. Порядок по задаче держит реле:
+# событие не уходит, пока более раннее событие той же задачи ждёт повтора
+# (индекс (task_id, id)).
+
+SQL_FWD = """
+CREATE TABLE IF NOT EXISTS task_outbox (
+    id              BIGSERIAL PRIMARY KEY,
+    task_id         BIGINT NOT NULL,
+    event           VARCHAR(32) NOT NULL,
+    payload         JSONB NOT NULL,
+    created_at      TIMESTAMPTZ NOT NULL DEFAULT now(),
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_error      TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_task_outbox_task ON task_outbox (task_id, id);
+
+CREATE OR REPLACE FUNCTION core_task_outbox() RETURNS trigger AS $$
+DECLARE
+    kind text;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        kind := 'task.created';
+    ELSIF OLD.status IS NOT DISTINCT FROM NEW.status THEN
+        RETURN NULL;
+    ELSIF NEW.status = 'DONE' THEN
+        kind := 'task.closed';
+    ELSE
+        kind := 'task.status_changed';
+    END IF;
+    INSERT INTO task_outbox (task_id, event, payload)
+    VALUES (NEW.id, kind, jsonb_build_object(
+        'task_id', NEW.id,
+        'title', NEW.title,
+        'status', NEW.status,
+        'from_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END,
+        'project_id', NEW.project_id,
+        'chat_id', NEW.source_chat_id,
+        'topic_id', NEW.source_topic_id,
+        'responsible_username', NEW.responsible_username,
+        'deadline', NEW.deadline,
+        'actor', NULLIF(current_setting('app.actor', true), ''),
+        'ts', now()
+    ));
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS core_task_outbox ON core_task;
+CREATE TRIGGER core_task_outbox
+    AFTER INSERT OR UPDATE OF status ON core_task
+    FOR EACH ROW EXECUTE FUNCTION core_task_outbox();
+"""
+
+SQL_BWD = """
+DROP TRIGGER IF EXISTS core_task_outbox ON core_task;
+DROP FUNCTION IF EXISTS core_task_outbox();
+DROP TABLE IF EXISTS task_outbox;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0016_task_events")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
@@ -0,0 +1,29 @@
+from django.db import migrations
+
+# Состав групп по апдейтам chat_member / my_chat_member (services.membership):
+# одна строка на пару (чат, пользователь) с последним статусом Telegram.
+# user_id / chat_id — Telegram ID, как в user_chat_activity. updated_at — дата
+# апдейта: запоздавший апдейт не перетирает более новый статус.
+# /syncmembers и действие админки сверяют ProjectMember с этой таблицей одним
+# INSERT ... SELECT; пока по пользователю не было апдейтов, присутствие берётся
+# из user_chat_activity.
+
+SQL_FWD = """
+CREATE TABLE IF NOT EXISTS tg_chat_member (
+    chat_id    BIGINT NOT NULL,
+    user_id    BIGINT NOT NULL,
+    status     VARCHAR(16) NOT NULL,
+    is_bot     BOOLEAN NOT NULL DEFAULT false,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (chat_id, user_id)
+);
+"""
+
+SQL_BWD = """
+DROP TABLE IF EXISTS tg_chat_member;
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0017_task_outbox")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
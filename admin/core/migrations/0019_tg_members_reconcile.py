@@ -0,0 +1,54 @@
+from django.db import migrations
+
+# Сверка ProjectMember с составом групп — одна SQL-функция на бота
+# (services.membership.reconcile, /syncmembers) и админку (действие «Синхронизировать
+# участников»), чтобы запрос и список «активных» статусов не расходились.
+# present — кто в группах проекта: статус из tg_chat_member, иначе — писал в чат
+# (user_chat_activity). Отсутствующие в core_user заводятся, присутствующие без
+# роли в проекте получают role_id (Member). Статусы — как
+# services.membership.ACTIVE_STATUSES.
+
+SQL_FWD = r"""
+CREATE OR REPLACE FUNCTION tg_members_reconcile(chat_ids bigint[], role_id bigint)
+RETURNS TABLE (present bigint, added bigint) LANGUAGE sql AS $$
+WITH chats AS (
+    SELECT telegram_id AS chat_id, project_id FROM core_tggroup
+    WHERE telegram_id = ANY($1) AND project_id IS NOT NULL
+), present AS (
+    SELECT c.project_id, m.user_id AS tg
+    FROM chats c JOIN tg_chat_member m ON m.chat_id = c.chat_id
+    WHERE m.status IN ('creator', 'administrator', 'member', 'restricted') AND NOT m.is_bot
+    UNION
+    SELECT c.project_id, a.user_id
+    FROM chats c JOIN user_chat_activity a ON a.chat_id = c.chat_id
+    WHERE NOT EXISTS (SELECT 1 FROM tg_chat_member m WHERE m.chat_id = a.chat_id AND m.user_id = a.user_id)
+), new_users AS (
+    INSERT INTO core_user (telegram_id, username, first_name, last_name, status, created_at)
+    SELECT DISTINCT tg, '', '', '', 'active', now() FROM present
+    ON CONFLICT (telegram_id) DO NOTHING
+    RETURNING id, telegram_id
+), pairs AS (
+    SELECT DISTINCT p.project_id, COALESCE(u.id, n.id) AS user_id
+    FROM present p
+    LEFT JOIN core_user u ON u.telegram_id = p.tg
+    LEFT JOIN new_users n ON n.telegram_id = p.tg
+), added AS (
+    INSERT INTO core_projectmember (project_id, user_id, role_id, created_at)
+    SELECT project_id, user_id, $2, now() FROM pairs
+    WHERE NOT EXISTS (SELECT 1 FROM core_projectmember pm
+                      WHERE pm.project_id = pairs.project_id AND pm.user_id = pairs.user_id)
+    ON CONFLICT (project_id, user_id, role_id) WHERE department_id IS NULL DO NOTHING
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM pairs), (SELECT count(*) FROM added)
+$$;
+"""
+
+SQL_BWD = r"""
+DROP FUNCTION IF EXISTS tg_members_reconcile(bigint[], bigint);
+"""
+
+
+class Migration(migrations.Migration):
+    dependencies = [("core", "0018_tg_chat_member")]
+    operations = [migrations.RunSQL(sql=SQL_FWD, reverse_sql=SQL_BWD)]
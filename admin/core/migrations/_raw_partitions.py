@@ -0,0 +1,51 @@
+"""
+Тело raw_updates_ensure_partition() для миграций 0004, 0005 и 0011.
+
+Функция переносит строки из raw_updates_default в новую секцию, поэтому
+зависит от набора колонок raw_updates и переопределяется каждой миграцией,
+которая его меняет; откат такой миграции возвращает предыдущую версию.
+Загрузчик миграций Django пропускает модули с «_» в начале имени.
+"""
+
+# колонки raw_updates, кроме генерируемой text_tsv (в неё вставлять нельзя)
+COLUMNS_0005 = ("id", "chat_id", "message_id", "user_id", "username", "text", "topic_id", "payload", "created_at")
+COLUMNS_0011 = COLUMNS_0005[:-1] + ("media", "created_at")
+
+
+def ensure_partition_sql(columns: tuple[str, ...] | None = None) -> str:
+    """
+    CREATE OR REPLACE FUNCTION raw_updates_ensure_partition(date).
+    columns=None — версия 0004: перенос через SELECT *, без генерируемых колонок.
+    """
+    if columns is None:
+        declare, like = "", "INCLUDING DEFAULTS"
+        move = ("'WITH moved AS (DELETE FROM raw_updates_default WHERE created_at >= $1 AND created_at < $2 RETURNING *)\n"
+                "             INSERT INTO %I SELECT * FROM moved', part")
+    else:
+        declare = f"\n    cols text := '{', '.join(columns)}';"
+        like = "INCLUDING DEFAULTS INCLUDING GENERATED"
+        move = ("'WITH moved AS (DELETE FROM raw_updates_default WHERE created_at >= $1 AND created_at < $2 RETURNING %s)\n"
+                "             INSERT INTO %I (%s) SELECT %s FROM moved', cols, part, cols, cols")
+    return r"""
+CREATE OR REPLACE FUNCTION raw_updates_ensure_partition(month_start date)
+RETURNS text LANGUAGE plpgsql AS $$
+DECLARE
+    lo   timestamptz := date_trunc('month', month_start::timestamp) AT TIME ZONE 'UTC';
+    hi   timestamptz := (date_trunc('month', month_start::timestamp) + interval '1 month') AT TIME ZONE 'UTC';
+    part text := 'raw_updates_p' || to_char(month_start, 'YYYYMM');""" + declare + r"""
+BEGIN
+    IF to_regclass(part) IS NOT NULL THEN
+        RETURN NULL;
+    END IF;
+    IF EXISTS (SELECT 1 FROM raw_updates_default WHERE created_at >= lo AND created_at < hi) THEN
+        -- секцию нельзя создать, пока в default лежат её строки: переносим их
+        EXECUTE format('CREATE TABLE %I (LIKE raw_updates """ + like + r""")', part);
+        EXECUTE format(
+            """ + move + r""") USING lo, hi;
+        EXECUTE format('ALTER TABLE raw_updates ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)', part, lo, hi);
+    ELSE
+        EXECUTE format('CREATE TABLE %I PARTITION OF raw_updates FOR VALUES FROM (%L) TO (%L)', part, lo, hi);
+    END IF;
+    RETURN 'created ' || part;
+END $$;
+"""
@@ -1,4 +1,8 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.db import models, transaction
+from django.db.models import Q
+from django.db.models.functions import Lower
 
 
 class Project(models.Model):
@@ -116,6 +120,14 @@ class User(models.Model):
         verbose_name = "Пользователь"
         verbose_name_plural = "Пользователи"
         ordering = ['-created_at']
+        indexes = [
+            # бот ищет строго lower(username) = $1
+            models.Index(Lower("username"), name="idx_user_username_lower"),
+            # подстрочный поиск в админке/автокомплите: lower(...) LIKE '%...%'
+            GinIndex(OpClass(Lower("username"), name="gin_trgm_ops"), name="idx_user_username_trgm"),
+            GinIndex(OpClass(Lower("first_name"), name="gin_trgm_ops"), name="idx_user_first_name_trgm"),
+            GinIndex(OpClass(Lower("last_name"), name="gin_trgm_ops"), name="idx_user_last_name_trgm"),
+        ]
 
     def _full_name(self) -> str:
         return " ".join(p for p in [self.first_name, self.last_name] if p).strip()
@@ -378,6 +390,19 @@ class Task(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Создано")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Обновлено")
+    # Эскалация по TopicBinding.priority: пока задачу не приняли и она в TODO,
+    # ответственность переходит по цепочке привязок топика
+    acknowledged_at = models.DateTimeField(null=True, blank=True, verbose_name="Принята")
+    escalation_level = models.PositiveSmallIntegerField(default=0, db_default=0, verbose_name="Уровень эскалации")
+    # Полнотекстовый поиск (russian): заголовок весомее описания
+    search_tsv = models.GeneratedField(
+        expression=(
+            SearchVector("title", weight="A", config="russian")
+            + SearchVector("description", weight="B", config="russian")
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
 
     class Meta:
         verbose_name = "Задача"
@@ -386,6 +411,25 @@ class Task(models.Model):
         indexes = [
             models.Index(fields=['status', 'deadline']),
             models.Index(fields=['responsible_username']),
+            # Списки /mytasks и /tasks (services.listings): область + статус, порядок по дедлайну
+            models.Index(fields=['responsible_user', 'status', 'deadline'], name='idx_task_resp_status_dl'),
+            models.Index(fields=['project', 'status', 'deadline'], name='idx_task_project_status_dl'),
+            models.Index(fields=['source_chat_id', 'status', 'deadline'], name='idx_task_chat_status_dl'),
+            GinIndex(fields=['search_tsv'], name='idx_task_search_tsv'),
+            # Inline-поиск по подстроке заголовка: lower(title) LIKE '%…%' (pg_trgm, миграция 0006)
+            GinIndex(OpClass(Lower("title"), name="gin_trgm_ops"), name="idx_task_title_trgm"),
+            # Сверка таймеров эскалации: только непринятые задачи в TODO из топиков
+            models.Index(
+                fields=['id'], name='idx_task_escalation_open',
+                condition=Q(status='TODO', acknowledged_at__isnull=True, source_topic_id__isnull=False),
+            ),
+        ]
+        constraints = [
+            # Идемпотентность создания: одна задача на сообщение-источник
+            models.UniqueConstraint(
+                fields=['source_chat_id', 'source_message_id'],
+                name='uniq_task_source_message',
+            ),
         ]
 
     def __str__(self):
@@ -528,7 +572,11 @@ class DepartmentMember(models.Model):
 
 
 class RawUpdate(models.Model):
-    """Логирование сырых обновлений от Telegram (таблица создается ботом)"""
+    """
+    Логирование сырых обновлений от Telegram (таблица создается ботом).
+    С миграции 0004 — секционирована по месяцам (created_at), PK (id, created_at).
+    media (0011) — вложения сообщения/альбома, подпись хранится в text.
+    """
     chat_id = models.BigIntegerField()
     message_id = models.BigIntegerField(null=True, blank=True)
     user_id = models.BigIntegerField(null=True, blank=True)
@@ -536,6 +584,7 @@ class RawUpdate(models.Model):
     text = models.TextField(blank=True, default="")
     topic_id = models.BigIntegerField(null=True, blank=True)
     payload = models.JSONField(default=dict, blank=True)
+    media = models.JSONField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -545,6 +594,7 @@ class RawUpdate(models.Model):
             models.Index(fields=['chat_id', 'created_at'], name='idx_raw_chat_created'),
             models.Index(fields=['chat_id', 'message_id'], name='idx_raw_chat_msg'),
             models.Index(fields=['created_at'], name='idx_raw_created'),
+            models.Index(fields=['user_id', 'chat_id'], name='idx_raw_user_chat'),
         ]
         ordering = ['-created_at']
         verbose_name = "Raw Update"
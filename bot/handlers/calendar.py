@@ -1,117 +1,150 @@
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+from functools import lru_cache
 from zoneinfo import ZoneInfo
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+from pydantic import ConfigDict
 import calendar
 
 
-def build_calendar_kb(current_date: datetime) -> InlineKeyboardMarkup:
+# Готовые клавиатуры переиспользуются между запросами, поэтому они неизменяемые
+class FrozenButton(InlineKeyboardButton):
+    model_config = ConfigDict(frozen=True)
+
+
+class FrozenMarkup(InlineKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+
+def _render_calendar_kb(year: int, month: int, today: date) -> FrozenMarkup:
     """
     Создает клавиатуру календаря для выбора даты
     Не показывает дни < сегодня
     """
     kb_rows = []
-    
+    first = date(year, month, 1)
+    ym = first.strftime('%Y-%m')
+
     # Заголовок с месяцем и годом
-    month_year = current_date.strftime("%B %Y")
+    month_year = first.strftime("%B %Y")
     kb_rows.append([
-        InlineKeyboardButton(text="◀", callback_data=f"cal:prev:{current_date.strftime('%Y-%m')}"),
-        InlineKeyboardButton(text=month_year, callback_data="cal:ignore"),
-        InlineKeyboardButton(text="▶", callback_data=f"cal:next:{current_date.strftime('%Y-%m')}")
+        FrozenButton(text="◀", callback_data=f"cal:prev:{ym}"),
+        FrozenButton(text=month_year, callback_data="cal:ignore"),
+        FrozenButton(text="▶", callback_data=f"cal:next:{ym}")
     ])
-    
+
     # Дни недели
     weekdays = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
     kb_rows.append([
-        InlineKeyboardButton(text=day, callback_data="cal:ignore")
+        FrozenButton(text=day, callback_data="cal:ignore")
         for day in weekdays
     ])
-    
-    # Получаем сегодняшнюю дату
-    today = datetime.now(current_date.tzinfo).date()
-    
+
     # Создаем календарь на текущий месяц
-    cal = calendar.monthcalendar(current_date.year, current_date.month)
-    
+    cal = calendar.monthcalendar(year, month)
+
     for week in cal:
         week_row = []
         for day in week:
             if day == 0:
                 # Пустая ячейка
-                week_row.append(InlineKeyboardButton(text=" ", callback_data="cal:ignore"))
+                week_row.append(FrozenButton(text=" ", callback_data="cal:ignore"))
             else:
                 # Создаем дату для проверки
-                date_obj = datetime(current_date.year, current_date.month, day).date()
-                
+                date_obj = date(year, month, day)
+
                 if date_obj < today:
                     # Прошедшие дни недоступны
-                    week_row.append(InlineKeyboardButton(text="·", callback_data="cal:ignore"))
+                    week_row.append(FrozenButton(text="·", callback_data="cal:ignore"))
                 elif date_obj == today:
                     # Сегодня выделяем
-                    week_row.append(InlineKeyboardButton(
+                    week_row.append(FrozenButton(
                         text=f"[{day}]",
-                        callback_data=f"cal:{date_obj.strftime('%Y-%m-%d')}"
+                        callback_data=f"cal:{date_obj.isoformat()}"
                     ))
                 else:
                     # Будущие дни доступны
-                    week_row.append(InlineKeyboardButton(
+                    week_row.append(FrozenButton(
                         text=str(day),
-                        callback_data=f"cal:{date_obj.strftime('%Y-%m-%d')}"
+                        callback_data=f"cal:{date_obj.isoformat()}"
                     ))
         kb_rows.append(week_row)
-    
+
     # Быстрые кнопки
     kb_rows.append([
-        InlineKeyboardButton(text="📅 Сегодня", callback_data=f"cal:{today.strftime('%Y-%m-%d')}"),
-        InlineKeyboardButton(text="📆 Завтра", callback_data=f"cal:{(today + timedelta(days=1)).strftime('%Y-%m-%d')}")
+        FrozenButton(text="📅 Сегодня", callback_data=f"cal:{today.isoformat()}"),
+        FrozenButton(text="📆 Завтра", callback_data=f"cal:{(today + timedelta(days=1)).isoformat()}")
     ])
-    
+
     # Отмена
     kb_rows.append([
-        InlineKeyboardButton(text="❌ Отмена", callback_data="cal:cancel")
+        FrozenButton(text="❌ Отмена", callback_data="cal:cancel")
     ])
-    
-    return InlineKeyboardMarkup(inline_keyboard=kb_rows)
 
+    return FrozenMarkup(inline_keyboard=kb_rows)
 
-def build_time_kb(step_minutes: int = 30) -> InlineKeyboardMarkup:
+
+@lru_cache(maxsize=128)
+def _calendar_kb_cached(year: int, month: int, today: date, tz_key: str | None) -> FrozenMarkup:
+    # tz_key участвует только в ключе: "сегодня" в разных зонах — разные клавиатуры
+    return _render_calendar_kb(year, month, today)
+
+
+def build_calendar_kb(current_date: datetime) -> InlineKeyboardMarkup:
+    """
+    Календарь на месяц current_date (из кэша).
+    Ключ — (год, месяц, сегодня, зона): после локальной полуночи ключ меняется,
+    и клавиатура перестраивается сама.
+    """
+    today = datetime.now(current_date.tzinfo).date()
+    tz_key = str(current_date.tzinfo) if current_date.tzinfo else None
+    return _calendar_kb_cached(current_date.year, current_date.month, today, tz_key)
+
+
+def _render_time_kb(step_minutes: int = 30) -> FrozenMarkup:
     """
     Создает клавиатуру для выбора времени
     """
     kb_rows = []
-    
+
     # Генерируем времена с заданным шагом
     times = []
     current_hour = 0
     current_minute = 0
-    
+
     while current_hour < 24:
         times.append(f"{current_hour:02d}:{current_minute:02d}")
         current_minute += step_minutes
         if current_minute >= 60:
             current_minute = 0
             current_hour += 1
-    
+
     # Разбиваем на строки по 4 кнопки
     for i in range(0, len(times), 4):
         row = []
         for time_str in times[i:i+4]:
-            row.append(InlineKeyboardButton(
+            row.append(FrozenButton(
                 text=time_str,
                 callback_data=f"time:{time_str}"
             ))
         kb_rows.append(row)
-    
+
     # Популярные времена
     kb_rows.append([
-        InlineKeyboardButton(text="🌅 09:00", callback_data="time:09:00"),
-        InlineKeyboardButton(text="☀️ 12:00", callback_data="time:12:00"),
-        InlineKeyboardButton(text="🌇 18:00", callback_data="time:18:00"),
-        InlineKeyboardButton(text="🌙 23:59", callback_data="time:23:59")
+        FrozenButton(text="🌅 09:00", callback_data="time:09:00"),
+        FrozenButton(text="☀️ 12:00", callback_data="time:12:00"),
+        FrozenButton(text="🌇 18:00", callback_data="time:18:00"),
+        FrozenButton(text="🌙 23:59", callback_data="time:23:59")
     ])
-    
+
     # Отмена
     kb_rows.append([
-        InlineKeyboardButton(text="❌ Отмена", callback_data="cal:cancel")
+        FrozenButton(text="❌ Отмена", callback_data="cal:cancel")
     ])
-    
-    return InlineKeyboardMarkup(inline_keyboard=kb_rows)
\ No newline at end of file
+
+    return FrozenMarkup(inline_keyboard=kb_rows)
+
+
+@lru_cache(maxsize=8)
+def build_time_kb(step_minutes: int = 30) -> InlineKeyboardMarkup:
+    """Клавиатура выбора времени (из кэша: сетка зависит только от шага)"""
+    return _render_time_kb(step_minutes)
@@ -3,10 +3,29 @@ from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.filters import Command, CommandObject
-from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-import asyncpg, datetime, json
+from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, InlineQuery, ChatMemberUpdated
+import asyncpg, datetime, html, json
 import redis.asyncio as aioredis
-from services.datetime import parse_deadline
+from services.datetime import find_deadline, strip_deadline
+from services.tasks import MAX_BULK, Created, TaskService, NewTask, StatusResult, parse_task_ids
+from services.state import StateStore, RedisTier
+from services.partitions import maintenance_loop, month_start
+from services.rollups import ChatStats, chat_stats, rollup_loop
+from services.task_flow import flow_loop
+from services.outbox import OutboxRelay, sinks_from_env
+from services import uniques
+from services.payloads import codec as payload_codec, message_to_dict
+from services.media import MEDIA_TYPES, AlbumBuffer, extract_media, media_summary
+from services.edits import EditBuffer, apply_edit
+from services import digest, escalation, inline, listings, membership, reminders
+from services.task_changes import TaskChangeListener
+from services.boards import BoardManager
+from services.search import SearchPage, normalize_query, search
+from services.users import normalize_username, users
+from services.redis_client import (
+    ClientSideCache, create_redis, report_metrics,
+    get_many as redis_get_many, set_many as redis_set_many,
+)
 from handlers.calendar import build_calendar_kb, build_time_kb
 from zoneinfo import ZoneInfo
 
@@ -16,18 +35,63 @@ TIMEZONE = os.getenv("TIMEZONE", "Europe/Moscow")
 bot = Bot(BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher()
 _redis_client: aioredis.Redis | None = None
+_client_cache: ClientSideCache | None = None
+REDIS_CLIENT_CACHE = os.getenv("REDIS_CLIENT_CACHE", "false").lower() in ("1", "true", "yes")
 
 def get_redis() -> aioredis.Redis:
+    """Общий клиент: пул с лимитом, таймаутами и ретраями (см. services.redis_client)"""
     global _redis_client
     if _redis_client is None:
-        _redis_client = aioredis.Redis(
-            host=os.getenv("REDIS_HOST", "redis"),
-            port=int(os.getenv("REDIS_PORT", "6379")),
-            db=int(os.getenv("REDIS_DB", "0")),
-            decode_responses=True,
-        )
+        _redis_client = create_redis()
     return _redis_client
 
+def get_client_cache() -> ClientSideCache | None:
+    """Клиентский кэш горячих ключей (responsible:*, perm:*), если включён REDIS_CLIENT_CACHE"""
+    global _client_cache
+    if _client_cache is None and REDIS_CLIENT_CACHE:
+        _client_cache = ClientSideCache(
+            get_redis(), max_items=int(os.getenv("REDIS_CLIENT_CACHE_SIZE", "10000"))
+        )
+    return _client_cache
+
+async def _cache_get_many(keys: list[str]) -> list[str | None]:
+    """MGET горячих ключей (через клиентский кэш, если он активен). Ошибки Redis = промах"""
+    try:
+        cache = get_client_cache()
+        if cache is not None and cache.active:
+            return await cache.get_many(keys)
+        return await redis_get_many(get_redis(), keys)
+    except Exception as e:
+        print(f"Redis cache read error: {e}")
+        return [None] * len(keys)
+
+async def _cache_set_many(mapping: dict[str, str], ttl: int) -> None:
+    """Запись нескольких ключей одним пайплайном"""
+    try:
+        await redis_set_many(get_redis(), mapping, ttl)
+    except Exception as e:
+        print(f"Redis cache write error: {e}")
+
+async def _cache_delete(*keys: str) -> None:
+    if not keys:
+        return
+    try:
+        await get_redis().delete(*keys)
+    except Exception as e:
+        print(f"Redis cache delete error: {e}")
+
+_state: StateStore | None = None
+
+def get_state() -> StateStore:
+    """Состояние диалогов: L1 в процессе + Redis (write-through), переживает сбои Redis"""
+    global _state
+    if _state is None:
+        _state = StateStore(
+            l2=RedisTier(get_redis),
+            timeout=float(os.getenv("STATE_REDIS_TIMEOUT", "0.25")),
+        )
+    return _state
+
 # === Helper функции ====================================================
 def format_task_created_response(count: int, ids: list[int] | None = None) -> str:
     if count <= 1 and ids:
@@ -57,7 +121,13 @@ async def get_conn():
         port=5432,
     )
 
-async def log_raw_update(msg: Message):
+async def log_raw_update(msg: Message, album: list[Message] | None = None):
+    """
+    Журнал входящего сообщения. album — все сообщения одного media_group_id
+    (msg — первое из них): пишутся одной строкой, вложения — списком в media.
+    """
+    items = album or [msg]
+    text = next((m.text or m.caption for m in items if m.text or m.caption), None) or ""
     try:
         compact = {
             "chat_id": msg.chat.id if msg.chat else None,
@@ -67,6 +137,9 @@ async def log_raw_update(msg: Message):
             "date": (getattr(msg, "date", None).isoformat() if getattr(msg, "date", None) else None),
             "has_text": bool(msg.text),
         }
+        if album:
+            compact["media_group_id"] = msg.media_group_id
+            compact["album_ids"] = [m.message_id for m in album]
         conn = await get_conn()
         # Try to upsert Telegram group metadata for per-group settings
         # НЕ создаем проект автоматически - только обновляем название если группа уже существует
@@ -88,21 +161,21 @@ async def log_raw_update(msg: Message):
             print(f"TG_GROUP_UPSERT_WARN: {e}")
         # upsert core_user по входящему сообщению
         if msg.from_user and not msg.from_user.is_bot:
-            def _norm(u): 
-                return (u or "").lstrip("@").strip().lower()
-            await conn.execute("""
+            user_row = await conn.fetchrow("""
                 INSERT INTO core_user (telegram_id, username, first_name, last_name, status, created_at)
                 VALUES ($1, $2, $3, $4, 'active', NOW())
                 ON CONFLICT (telegram_id) DO UPDATE
                    SET username = COALESCE(NULLIF(EXCLUDED.username, ''), core_user.username),
                        first_name = COALESCE(EXCLUDED.first_name, core_user.first_name),
                        last_name  = COALESCE(EXCLUDED.last_name,  core_user.last_name)
+                RETURNING id, username, telegram_id
             """,
             msg.from_user.id,
-            _norm(msg.from_user.username),
+            normalize_username(msg.from_user.username),
             msg.from_user.first_name or "",
             msg.from_user.last_name or "",
             )
+            users.put_record(user_row)  # каталог username <-> пользователь всегда свежий
         
         # Обработка топиков для супергрупп с форумами
         if msg.chat and msg.chat.type == "supergroup":
@@ -139,28 +212,63 @@ async def log_raw_update(msg: Message):
                     """, msg.chat.id, tid, title_hint)
                 except Exception as e:
                     print(f"FORUMTOPIC_UPSERT_WARN: {e}")
+        # Вложения (services.media) и полный апдейт — msgpack+zstd в raw_payloads (services.payloads)
+        media = [m for item in items for m in extract_media(item)]
+        try:
+            full = message_to_dict(msg)
+            if album:
+                full["album"] = [message_to_dict(m) for m in album[1:]]
+            dict_id, body = payload_codec.encode(full)
+        except Exception as e:
+            print(f"RAW_PAYLOAD_WARN: {e}")
+            dict_id, body = 0, None
+        # Журнал + полный апдейт + сводка активности (user_chat_activity) одним запросом
         await conn.execute(
             """
-            INSERT INTO raw_updates (chat_id, message_id, user_id, text, payload, topic_id)
-            VALUES ($1, $2, $3, $4, $5::jsonb, $6)
+            WITH ins AS (
+                INSERT INTO raw_updates (chat_id, message_id, user_id, text, payload, topic_id, media)
+                VALUES ($1, $2, $3, $4, $5::jsonb, $6, $9::jsonb)
+                RETURNING id, chat_id, user_id, created_at
+            ), pl AS (
+                INSERT INTO raw_payloads (raw_id, dict_id, body)
+                SELECT id, $7::int, $8::bytea FROM ins WHERE $8::bytea IS NOT NULL
+            )
+            INSERT INTO user_chat_activity (user_id, chat_id, first_seen, last_seen, msg_count)
+            SELECT user_id, chat_id, created_at, created_at, 1 FROM ins WHERE user_id IS NOT NULL
+            ON CONFLICT (user_id, chat_id) DO UPDATE
+               SET last_seen = GREATEST(user_chat_activity.last_seen, EXCLUDED.last_seen),
+                   msg_count = user_chat_activity.msg_count + 1
             """,
             compact["chat_id"],
             compact["message_id"],
             compact["from_id"],
-            msg.text or "",
+            text,
             json.dumps(compact, ensure_ascii=False, default=str),
             compact["topic_id"],
+            dict_id,
+            body,
+            json.dumps(media, ensure_ascii=False) if media else None,
         )
         await conn.close()
         print(f"RAW_LOG_OK chat={compact['chat_id']} msg={compact['message_id']}")
     except Exception as e:
         print(f"RAW_LOG_ERR: {e}")
+
+    # DAU/WAU: отправитель -> HyperLogLog дня (чат и топик)
+    if msg.chat.type in ("group", "supergroup") and msg.from_user and not msg.from_user.is_bot:
+        try:
+            day = uniques.local_day(getattr(msg, "date", None), TIMEZONE)
+            await uniques.record(get_redis(), msg.chat.id, getattr(msg, "message_thread_id", None),
+                                 msg.from_user.id, day)
+        except Exception as e:
+            print(f"UNIQUES_WARN: {e}")
     
     # попытка маршрутизации (shadow для клиента соблюдается — в клиентский чат не пишем)
-    try:
-        await _maybe_route_to_forward(msg)
-    except Exception as _e:
-        print(f"route skip: {_e}")
+    for item in items:
+        try:
+            await _maybe_route_to_forward(item)
+        except Exception as _e:
+            print(f"route skip: {_e}")
 
 async def _maybe_route_to_forward(msg: Message) -> None:
     # только группы/супергруппы
@@ -208,34 +316,23 @@ async def _maybe_route_to_forward(msg: Message) -> None:
         print(f"forward failed: {e}")
 
 async def _update_raw_on_edit(msg: Message) -> None:
-    """Обновляет запись в raw_updates при редактировании сообщения"""
-    txt = (msg.text or msg.caption or "")[:4096]
-    topic_id = getattr(msg, "message_thread_id", None)
+    """Применяет правку (последнюю из серии) к raw_updates; прежний текст — в raw_update_versions"""
     conn = await get_conn()
-    res = await conn.execute(
-        """
-        UPDATE raw_updates
-           SET text = $1,
-               topic_id = COALESCE($4, topic_id)
-         WHERE chat_id = $2 AND message_id = $3
-        """,
-        txt, msg.chat.id, msg.message_id, topic_id
-    )
-    # если вдруг строки нет (бот перезапускался) — создадим
-    if res == "UPDATE 0":
-        await conn.execute(
-            """
-            INSERT INTO raw_updates (chat_id, message_id, user_id, text, topic_id, payload)
-            VALUES ($1,$2,$3,$4,$5,$6::jsonb)
-            """,
-            msg.chat.id,
-            msg.message_id,
-            (msg.from_user.id if msg.from_user else None),
-            txt,
-            topic_id,
-            json.dumps({"message_type": "text"}, ensure_ascii=False),
-        )
-    await conn.close()
+    try:
+        await apply_edit(conn, msg)
+    finally:
+        await conn.close()
+
+edit_buffer = EditBuffer(_update_raw_on_edit)
+membership_buffer = membership.MembershipBuffer(get_conn)
+task_changes = TaskChangeListener(get_conn)
+task_changes.subscribe(lambda changes: listings.invalidate(get_redis(), changes))
+boards = BoardManager(
+    get_redis, get_conn, lambda chat_id, message_id, text: bot.edit_message_text(text, chat_id=chat_id, message_id=message_id),
+)
+task_changes.subscribe(boards.on_changes)
+outbox_relay = OutboxRelay(get_conn, sinks_from_env(get_redis))
+task_changes.subscribe(outbox_relay.on_changes)
 
 async def _is_shadow_for_chat(chat_id: int) -> bool | None:
     if not chat_id:
@@ -280,6 +377,36 @@ async def safe_reply(msg: Message, text: str, **kwargs):
             **kwargs,
         )
 
+async def safe_send(chat_id: int, topic_id: int | None, text: str, shadow: bool | None = None, **kwargs):
+    """
+    Сообщение в чат/топик вне ответа на апдейт (напоминания и т.п.) — с учётом shadow-режима.
+    shadow=None — определить по группе; рассылки, уже отфильтровавшие shadow-группы, передают False
+    """
+    if shadow is None:
+        shadow_override = await _is_shadow_for_chat(chat_id)
+        shadow = SHADOW_MODE if shadow_override is None else shadow_override
+    if shadow:
+        return None
+    return await bot.send_message(chat_id=chat_id, text=text, message_thread_id=topic_id or None, **kwargs)
+
+async def _schedule_followups(conn, task_ids: list[int]) -> None:
+    """Таймеры новых задач: напоминания о дедлайне и эскалация в топике; сбой Redis не мешает созданию"""
+    try:
+        await reminders.schedule_tasks(conn, get_redis(), task_ids, TIMEZONE, extra=(escalation.initial_timers,))
+    except Exception as e:
+        print(f"REMINDER_WARN: {e}")
+
+def _ack_markup(task_id: int | None, topic_id: int | None) -> InlineKeyboardMarkup | None:
+    """Кнопка «Принял» — только там, где задача может эскалироваться (топик)"""
+    return escalation.ack_keyboard(task_id) if task_id and topic_id is not None else None
+
+def _created_reply(result: Created | None, topic_id: int | None) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Ответ на создание одной задачи; повтор по тому же сообщению — без новой кнопки «Принял»"""
+    if result and not result.created:
+        return f"ℹ️ Уже задача #{result.id}", None
+    task_id = result.id if result else None
+    return format_task_created_response(1, [task_id] if task_id else None), _ack_markup(task_id, topic_id)
+
 # === /checklast helpers ====================================================
 def _parse_count_arg(command_text: str | None, default_count: int, max_count: int) -> int:
     if not command_text:
@@ -296,21 +423,26 @@ def _parse_count_arg(command_text: str | None, default_count: int, max_count: in
         return default_count
 
 async def fetch_raw_updates_for_chat(chat_id: int, topic_id: int | None, limit: int):
-    conn = await get_conn()
-    rows = await conn.fetch(
-        """
-        SELECT id, chat_id, message_id, user_id, text, created_at
+    """
+    Последние сообщения чата. Сначала смотрим только текущую и прошлую месячные
+    секции raw_updates (partition pruning); всю историю — только если их не хватило.
+    """
+    sql = """
+        SELECT id, chat_id, message_id, user_id, text, media, created_at
         FROM raw_updates
         WHERE chat_id = $1
           AND ($2::bigint IS NULL OR topic_id = $2)
           AND (text IS NOT NULL AND LEFT(text,1) <> '/')
+          AND ($4::timestamptz IS NULL OR created_at >= $4)
         ORDER BY created_at DESC
         LIMIT $3
-        """,
-        chat_id,
-        topic_id,
-        limit,
-    )
+    """
+    # начало прошлого месяца
+    since = month_start(month_start(datetime.datetime.now(datetime.timezone.utc)) - datetime.timedelta(days=1))
+    conn = await get_conn()
+    rows = await conn.fetch(sql, chat_id, topic_id, limit, since)
+    if len(rows) < limit:
+        rows = await conn.fetch(sql, chat_id, topic_id, limit, None)
     await conn.close()
     return rows
 
@@ -357,46 +489,6 @@ def build_checklast_kb(rows: list[dict], selected: set[int]) -> InlineKeyboardMa
     ])
     return InlineKeyboardMarkup(inline_keyboard=kb_rows)
 
-async def _create_task_minimal(
-    title: str,
-    description: str | None,
-    responsible_user_id: int | None,
-    responsible_username: str | None,
-    author_user_id: int | None = None,
-    project_id: int | None = None,
-    source_chat_id: int | None = None,
-    source_message_id: int | None = None,
-    source_topic_id: int | None = None,
-):
-    conn = await get_conn()
-    
-    # Гарантируем, что responsible_username не NULL
-    responsible_username = responsible_username or "unknown"
-    
-    result = await conn.fetchval(
-        """
-        INSERT INTO core_task (
-            title, description, responsible_user_id, responsible_username,
-            author_user_id, project_id,
-            status, created_at, updated_at,
-            source_chat_id, source_message_id, source_topic_id
-        )
-        VALUES ($1::varchar, $2::text, $3, $4::varchar, $5, $6, 'TODO', NOW(), NOW(), $7, $8, $9)
-        RETURNING id
-        """,
-        title[:256],
-        description or "",
-        responsible_user_id,
-        responsible_username,
-        author_user_id,
-        project_id,
-        source_chat_id,
-        source_message_id,
-        source_topic_id,
-    )
-    await conn.close()
-    return result
-
 async def ensure_schema():
     try:
         conn = await get_conn()
@@ -414,8 +506,21 @@ async def ensure_schema():
             """
         )
         await conn.execute("ALTER TABLE raw_updates ADD COLUMN IF NOT EXISTS topic_id bigint;")
+        await conn.execute("ALTER TABLE raw_updates ADD COLUMN IF NOT EXISTS media jsonb;")
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS user_chat_activity (
+                user_id bigint NOT NULL,
+                chat_id bigint NOT NULL,
+                first_seen timestamptz NOT NULL,
+                last_seen timestamptz NOT NULL,
+                msg_count bigint NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, chat_id)
+            );
+            """
+        )
         await conn.close()
-        print("DB schema ensured (raw_updates)")
+        print("DB schema ensured (raw_updates, user_chat_activity)")
     except Exception as e:
         print(f"DB_SCHEMA_WARN: {e}")
 
@@ -453,13 +558,28 @@ async def _role_flags_for_user(telegram_id: int) -> tuple[bool, bool]:
     await conn.close()
     return (bool(row["can_assign"]), bool(row["can_close"])) if row else (False, False)
 
+PERM_TTL = 60  # сек; /setrole сбрасывает ключи сразу, правки из админки доживают до TTL
+
+def _perm_key(telegram_id: int, chat_id: int) -> str:
+    return f"perm:{telegram_id}:{chat_id}"
+
+async def _role_flags(telegram_id: int, chat_id: int) -> tuple[bool, bool]:
+    """(can_assign, can_close) в чате: роль в проекте чата, иначе последняя роль пользователя. Кэш в Redis"""
+    key = _perm_key(telegram_id, chat_id)
+    cached = (await _cache_get_many([key]))[0]
+    if cached and len(cached) == 3:
+        return cached[0] == "1", cached[2] == "1"
+    scoped = await _role_flags_for_user_in_chat(telegram_id, chat_id)
+    flags = scoped if scoped is not None else await _role_flags_for_user(telegram_id)
+    await _cache_set_many({key: f"{int(flags[0])}:{int(flags[1])}"}, PERM_TTL)
+    return flags
+
 async def _require_can_assign_msg(msg: Message) -> bool:
     telegram_id = msg.from_user.id if msg.from_user else None
     if not telegram_id:
         await safe_reply(msg, "🔒 Недостаточно прав")
         return False
-    scoped = await _role_flags_for_user_in_chat(telegram_id, msg.chat.id)
-    can_assign, _ = scoped if scoped is not None else await _role_flags_for_user(telegram_id)
+    can_assign, _ = await _role_flags(telegram_id, msg.chat.id)
     if not can_assign:
         await safe_reply(msg, "🔒 Недостаточно прав")
         return False
@@ -470,8 +590,7 @@ async def _require_can_close_msg(msg: Message) -> bool:
     if not telegram_id:
         await safe_reply(msg, "🔒 Недостаточно прав")
         return False
-    scoped = await _role_flags_for_user_in_chat(telegram_id, msg.chat.id)
-    _, can_close = scoped if scoped is not None else await _role_flags_for_user(telegram_id)
+    _, can_close = await _role_flags(telegram_id, msg.chat.id)
     if not can_close:
         await safe_reply(msg, "🔒 Недостаточно прав")
         return False
@@ -482,8 +601,7 @@ async def _require_can_assign_cb(cb: CallbackQuery) -> bool:
     if not telegram_id:
         await cb.answer("🔒 Недостаточно прав", show_alert=True)
         return False
-    scoped = await _role_flags_for_user_in_chat(telegram_id, cb.message.chat.id)
-    can_assign, _ = scoped if scoped is not None else await _role_flags_for_user(telegram_id)
+    can_assign, _ = await _role_flags(telegram_id, cb.message.chat.id)
     if not can_assign:
         await cb.answer("🔒 Недостаточно прав", show_alert=True)
         return False
@@ -498,38 +616,66 @@ async def _get_project_id_by_chat(chat_id: int) -> int | None:
     await conn.close()
     return row["project_id"] if row else None
 
+RESPONSIBLE_TTL = 300  # 5 минут
+
+def _responsible_key(chat_id: int, topic_id: int) -> str:
+    return f"responsible:{chat_id}:{topic_id}"
+
+def _decode_responsible(cached: str | None):
+    """'id:username' из кэша -> (user_id, username); None — промах"""
+    if not cached:
+        return None
+    parts = cached.split(":", 1)
+    if len(parts) != 2:
+        return None
+    user_id = int(parts[0]) if parts[0] != "None" else None
+    username = parts[1] if parts[1] != "None" else None
+    return user_id, username
+
 async def _resolve_responsible(conn, chat_id: int, topic_id: int | None, explicit_username: str | None):
     """Единый резолвер для определения ответственного через TopicBinding. Возвращает (user_id, username)"""
     
     # 1) Явный исполнитель через @username
     if explicit_username:
-        row = await conn.fetchrow(
-            "SELECT id, username, telegram_id FROM core_user WHERE LOWER(username) = $1", 
-            explicit_username.lower()
-        )
+        row = await users.lookup(conn, explicit_username)
         if row:
-            uname = row["username"] or f"id:{row['telegram_id']}"
-            return row["id"], uname
+            return row.id, row.display
         return None, None
 
     # 2) Автоназначение через TopicBinding с кэшированием
     if topic_id is None:
         return None, None
-    
-    # Пробуем получить из кэша Redis (TTL 5 минут)
-    cache_key = f"responsible:{chat_id}:{topic_id}"
-    try:
-        redis_client = get_redis()
-        cached = await redis_client.get(cache_key)
-        if cached:
-            parts = cached.split(":", 1)
-            if len(parts) == 2:
-                user_id = int(parts[0]) if parts[0] != "None" else None
-                username = parts[1] if parts[1] != "None" else None
-                return user_id, username
-    except Exception as e:
-        print(f"Redis cache read error: {e}")
-        
+    resolved = await _resolve_responsible_many(conn, chat_id, [topic_id])
+    return resolved[topic_id]
+
+async def _resolve_responsible_many(conn, chat_id: int, topic_ids) -> dict:
+    """
+    Ответственные для нескольких топиков чата: один MGET по кэшу,
+    промахи резолвятся через БД и пишутся одним пайплайном (TTL 5 минут).
+    """
+    topics = list(dict.fromkeys(t for t in topic_ids if t is not None))
+    result = {None: (None, None)}
+    if not topics:
+        return result
+    keys = [_responsible_key(chat_id, t) for t in topics]
+    misses = {}
+    for topic_id, key, cached in zip(topics, keys, await _cache_get_many(keys)):
+        hit = _decode_responsible(cached)
+        if hit is not None:
+            result[topic_id] = hit
+        else:
+            misses[topic_id] = key
+    to_cache = {}
+    for topic_id, key in misses.items():
+        user_id, uname = await _resolve_by_bindings(conn, chat_id, topic_id)
+        result[topic_id] = (user_id, uname)
+        # Сохраняем результат в кэш (даже если None)
+        to_cache[key] = f"{user_id}:{uname}"
+    await _cache_set_many(to_cache, RESPONSIBLE_TTL)
+    return result
+
+async def _resolve_by_bindings(conn, chat_id: int, topic_id: int):
+    """Ответственный по привязкам топика (только БД, без кэша)"""
     # Находим привязки топика, отсортированные по приоритету
     bindings = await conn.fetch("""
         SELECT tb.user_id, tb.role_id, tb.department_id, tb.priority
@@ -553,13 +699,6 @@ async def _resolve_responsible(conn, chat_id: int, topic_id: int | None, explici
             )
             if row:
                 uname = row["username"] or f"id:{row['telegram_id']}"
-                # Сохраняем в кэш
-                try:
-                    redis_client = get_redis()
-                    cache_value = f"{row['id']}:{uname}"
-                    await redis_client.setex(cache_key, 300, cache_value)  # TTL 5 минут
-                except Exception as e:
-                    print(f"Redis cache write error: {e}")
                 return row["id"], uname
 
         # 2b) Назначение через роль в проекте
@@ -577,12 +716,6 @@ async def _resolve_responsible(conn, chat_id: int, topic_id: int | None, explici
                 )
                 if row:
                     uname = row["username"] or f"id:{row['telegram_id']}"
-                    # Сохраняем в кэш
-                    try:
-                        cache_value = f"{row['id']}:{uname}"
-                        await redis_client.setex(cache_key, 300, cache_value)  # TTL 5 минут
-                    except Exception as e:
-                        print(f"Redis cache write error: {e}")
                     return row["id"], uname
 
         # 2c) Назначение через департамент (берем первого члена с is_lead или is_tech)
@@ -622,22 +755,8 @@ async def _resolve_responsible(conn, chat_id: int, topic_id: int | None, explici
                 )
                 if row:
                     uname = row["username"] or f"id:{row['telegram_id']}"
-                    # Сохраняем в кэш
-                    try:
-                        cache_value = f"{row['id']}:{uname}"
-                        await redis_client.setex(cache_key, 300, cache_value)  # TTL 5 минут
-                    except Exception as e:
-                        print(f"Redis cache write error: {e}")
                     return row["id"], uname
 
-    # Сохраняем результат в кэш (даже если None)
-    try:
-        redis_client = get_redis()
-        cache_value = f"{None}:{None}"
-        await redis_client.setex(cache_key, 300, cache_value)  # TTL 5 минут
-    except Exception as e:
-        print(f"Redis cache write error: {e}")
-    
     return None, None
 
 # === /start (smoke test #1) ============================================
@@ -646,10 +765,41 @@ async def start(msg: Message):
     await log_raw_update(msg)
     await safe_reply(msg, "✅ Бот на связи. Доступно: /whoami, /ping, /checklast N, /syncmembers")
 
-# === /syncmembers - синхронизация участников группы ===================
+# === Состав групп: chat_member / my_chat_member =======================
+async def _sync_chat_members(chat_id: int, date: datetime.datetime) -> tuple[int, int] | None:
+    """Админы из API (могли быть назначены до бота) + сверка ProjectMember; None — группа без проекта"""
+    try:
+        admins = await bot.get_chat_administrators(chat_id)
+    except Exception as e:
+        print(f"MEMBERSHIP_WARN admins chat={chat_id}: {e}")
+        admins = []
+    conn = await get_conn()
+    try:
+        group = await conn.fetchrow("SELECT project_id FROM core_tggroup WHERE telegram_id = $1", chat_id)
+        # админы, впервые попавшие в проект, добавляются уже здесь — reconcile их не посчитает
+        admins_added = await membership.apply_events(conn, [membership.event_from_member(chat_id, a, date) for a in admins])
+        if not group or not group["project_id"]:
+            return None
+        present, added = await membership.reconcile(conn, [chat_id])
+        return present, added + admins_added
+    finally:
+        await conn.close()
+
+@dp.chat_member()
+async def on_chat_member(event: ChatMemberUpdated):
+    membership_buffer.add(membership.event_from_update(event))
+
+@dp.my_chat_member()
+async def on_my_chat_member(event: ChatMemberUpdated):
+    """Бота добавили/повысили — подтянуть админов и сверить; с правами админа пойдут и chat_member"""
+    membership_buffer.add(membership.event_from_update(event))
+    if event.chat.type in ("group", "supergroup") and membership.member_status(event.new_chat_member) in ("member", "administrator"):
+        _spawn(_sync_chat_members(event.chat.id, event.date))
+
+# === /syncmembers - сверка участников группы с проектом ===============
 @dp.message(Command("syncmembers", ignore_mention=True))
 async def sync_members(msg: Message):
-    """Синхронизация участников группы с ProjectMember"""
+    """Сверка ProjectMember с составом группы (tg_chat_member ведётся по апдейтам chat_member)"""
     await log_raw_update(msg)
     
     if msg.chat.type == "private":
@@ -657,126 +807,21 @@ async def sync_members(msg: Message):
         return
     
     try:
-        # Проверяем права администратора
         member = await bot.get_chat_member(msg.chat.id, msg.from_user.id)
         if member.status not in ["creator", "administrator"]:
             await safe_reply(msg, "Только администраторы могут синхронизировать участников")
             return
-        
-        conn = await get_conn()
-        
-        # Получаем группу и проект
-        group = await conn.fetchrow(
-            "SELECT id, project_id FROM core_tggroup WHERE telegram_id = $1",
-            msg.chat.id
-        )
-        if not group or not group["project_id"]:
+        result = await _sync_chat_members(msg.chat.id, msg.date)
+        if result is None:
             await safe_reply(msg, "Группа не привязана к проекту")
-            await conn.close()
             return
-        
-        # Получаем роль по умолчанию
-        default_role = await conn.fetchrow(
-            "SELECT id FROM core_role WHERE name ILIKE 'Member' LIMIT 1"
-        )
-        if not default_role:
-            default_role = await conn.fetchrow(
-                "INSERT INTO core_role (name, can_assign, can_close) VALUES ('Member', false, false) RETURNING id"
-            )
-        role_id = default_role["id"]
-        
-        # Получаем администраторов группы (обычных участников API не дает)
-        created_count = 0
-        updated_count = 0
-        
-        try:
-            # Пробуем получить администраторов
-            admins = await bot.get_chat_administrators(msg.chat.id)
-            
-            for admin in admins:
-                if admin.user.is_bot:
-                    continue
-                    
-                # Создаем или обновляем пользователя
-                user = await conn.fetchrow(
-                    """
-                    INSERT INTO core_user (telegram_id, username, first_name, last_name, status, created_at)
-                    VALUES ($1, $2, $3, $4, 'active', NOW())
-                    ON CONFLICT (telegram_id) DO UPDATE
-                    SET username = EXCLUDED.username,
-                        first_name = EXCLUDED.first_name,
-                        last_name = EXCLUDED.last_name
-                    RETURNING id
-                    """,
-                    admin.user.id,
-                    admin.user.username or "",
-                    admin.user.first_name or "",
-                    admin.user.last_name or ""
-                )
-                
-                # Добавляем в ProjectMember
-                result = await conn.fetchrow(
-                    """
-                    INSERT INTO core_projectmember (project_id, user_id, role_id, created_at)
-                    VALUES ($1, $2, $3, NOW())
-                    ON CONFLICT (project_id, user_id, role_id) 
-                    WHERE department_id IS NULL
-                    DO NOTHING
-                    RETURNING id
-                    """,
-                    group["project_id"],
-                    user["id"],
-                    role_id
-                )
-                
-                if result:
-                    created_count += 1
-                else:
-                    updated_count += 1
-                    
-        except Exception as e:
-            # Если не можем получить администраторов, используем raw_updates
-            users_from_logs = await conn.fetch(
-                """
-                SELECT DISTINCT u.id, u.telegram_id, u.username, u.first_name, u.last_name
-                FROM raw_updates ru
-                JOIN core_user u ON u.telegram_id = ru.user_id
-                WHERE ru.chat_id = $1
-                  AND ru.user_id IS NOT NULL
-                LIMIT 100
-                """,
-                msg.chat.id
-            )
-            
-            for user in users_from_logs:
-                result = await conn.fetchrow(
-                    """
-                    INSERT INTO core_projectmember (project_id, user_id, role_id, created_at)
-                    VALUES ($1, $2, $3, NOW())
-                    ON CONFLICT (project_id, user_id, role_id)
-                    WHERE department_id IS NULL
-                    DO NOTHING
-                    RETURNING id
-                    """,
-                    group["project_id"],
-                    user["id"],
-                    role_id
-                )
-                
-                if result:
-                    created_count += 1
-                else:
-                    updated_count += 1
-        
-        await conn.close()
-        
+        present, added = result
         await safe_reply(
             msg,
             f"✅ Синхронизация завершена\n"
-            f"Добавлено новых участников: {created_count}\n"
-            f"Уже были в проекте: {updated_count}"
+            f"Участников группы (известно боту): {present}\n"
+            f"Добавлено в проект: {added}"
         )
-        
     except Exception as e:
         await safe_reply(msg, f"❌ Ошибка синхронизации: {str(e)[:200]}")
 
@@ -870,14 +915,11 @@ async def set_role(msg: Message, command: CommandObject):
                         return await safe_reply(msg, "⚠️ Неверный формат ID")
                 else:
                     # Формат @username
-                    username = user_arg.lstrip("@").lower()
-                    user_row = await conn.fetchrow(
-                        "SELECT telegram_id FROM core_user WHERE LOWER(username) = $1",
-                        username
-                    )
+                    username = normalize_username(user_arg)
+                    user_row = await users.lookup(conn, username)
                     if not user_row:
                         return await safe_reply(msg, f"⚠️ Пользователь @{username} не найден. Он должен сначала написать боту.")
-                    tg_id = user_row["telegram_id"]
+                    tg_id = user_row.telegram_id
             else:
                 return await safe_reply(msg, "⚠️ Укажите пользователя и роль")
             
@@ -916,8 +958,13 @@ async def set_role(msg: Message, command: CommandObject):
                 project_id,
                 role_id,
             )
+            project_chats = await conn.fetch(
+                "SELECT telegram_id FROM core_tggroup WHERE project_id = $1", project_id
+            )
         
         await conn.close()
+        # Права в чатах проекта поменялись — сбрасываем кэш
+        await _cache_delete(*[_perm_key(tg_id, r["telegram_id"]) for r in project_chats])
         await safe_reply(msg, f"✅ Роль '{role_name}' назначена")
         
     except Exception as e:
@@ -977,37 +1024,34 @@ async def new_task(msg: Message, command: CommandObject):
         else:
             text_parts = parts
         
-        # Парсим дедлайн с помощью новой утилиты
+        # Ищем дедлайн в любом месте текста за один проход
         deadline = None
         text = None
-        
-        # Проверяем различные варианты дедлайна в конце
-        for i in range(len(text_parts)):
-            potential_deadline_str = " ".join(text_parts[-(i+1):])
-            potential_deadline = parse_deadline(potential_deadline_str, TIMEZONE)
-            if potential_deadline:
-                deadline = potential_deadline
-                text = " ".join(text_parts[:-(i+1)])
-                break
+        raw_text = " ".join(text_parts)
+        found = find_deadline(raw_text, TIMEZONE)
+        if found:
+            deadline = found.deadline
+            text = strip_deadline(raw_text, found)
         
         # Если дедлайн не найден, весь текст - это задача
         if not text:
             text = " ".join(text_parts) if text_parts else "Задача"
         
+        topic_id = getattr(msg, "message_thread_id", None)
+        
         # Если дедлайн не указан, показываем календарь
         if not deadline:
-            # Сохраняем данные в Redis
-            r = get_redis()
+            # Сохраняем данные диалога
             task_data = {
                 "text": text,
                 "responsible_username": explicit_username,
                 "topic_id": topic_id,
                 "message_id": msg.message_id
             }
-            await r.set(
+            await get_state().set(
                 f"newtask:{msg.chat.id}:{msg.from_user.id}",
-                json.dumps(task_data),
-                ex=1200  # 20 минут
+                task_data,
+                ttl=1200  # 20 минут
             )
             await conn.close()
             
@@ -1022,7 +1066,6 @@ async def new_task(msg: Message, command: CommandObject):
             )
         
         # Резолвим ответственного
-        topic_id = getattr(msg, "message_thread_id", None)
         resp_user_id, resp_username = await _resolve_responsible(
             conn, msg.chat.id, topic_id, explicit_username
         )
@@ -1034,44 +1077,24 @@ async def new_task(msg: Message, command: CommandObject):
                 "⚠️ Не удалось определить ответственного. Укажите @username или настройте /topicrole"
             )
         
-        # Получаем автора и проект
-        author_id = await conn.fetchval(
-            "SELECT id FROM core_user WHERE telegram_id = $1", 
-            msg.from_user.id
-        )
-        project_id = await conn.fetchval(
-            "SELECT project_id FROM core_tggroup WHERE telegram_id = $1", 
-            msg.chat.id
-        )
-        
-        # Создаем задачу
-        result = await conn.fetchval(
-            """
-            INSERT INTO core_task (
-                title, description, responsible_user_id, responsible_username,
-                author_user_id, project_id, deadline,
-                status, created_at, updated_at,
-                source_chat_id, source_message_id, source_topic_id
-            )
-            VALUES ($1::varchar, $2::text, $3, $4::varchar, $5, $6, $7::timestamp with time zone, 
-                    'TODO', NOW(), NOW(), $8, $9, $10)
-            RETURNING id
-            """,
-            text[:256],
-            text,
-            resp_user_id,
-            resp_username or "unknown",
-            author_id,
-            project_id,
-            deadline,
-            msg.chat.id,
-            msg.message_id,
-            topic_id,
-        )
+        # Создаем задачу (автор и проект резолвятся внутри INSERT)
+        result = await TaskService(conn).create(NewTask(
+            title=text,
+            description=text,
+            responsible_user_id=resp_user_id,
+            responsible_username=resp_username,
+            deadline=deadline,
+            author_telegram_id=msg.from_user.id,
+            source_chat_id=msg.chat.id,
+            source_message_id=msg.message_id,
+            source_topic_id=topic_id,
+        ))
+        if result and result.created:
+            await _schedule_followups(conn, [result.id])
         
         await conn.close()
-        response_text = format_task_created_response(1, [result] if result else None)
-        await safe_reply(msg, response_text)
+        response_text, markup = _created_reply(result, topic_id)
+        await safe_reply(msg, response_text, reply_markup=markup)
         
     except Exception as e:
         await safe_reply(msg, f"⚠️ Ошибка: {str(e)[:200]}")
@@ -1101,13 +1124,16 @@ async def add_task(msg: Message, command: CommandObject):
     extracted_username_or_none = f"{m.group(1)}" if m else None
     extra_wo_user = re.sub(r'@([A-Za-z0-9_]{5,})', '', extra).strip()
     
+    # Пробуем найти дедлайн в аргументах (и не тащить его в заголовок)
+    found = find_deadline(extra_wo_user, TIMEZONE) if extra_wo_user else None
+    deadline = found.deadline if found else None
+    if found:
+        extra_wo_user = strip_deadline(extra_wo_user, found)
+    
     title = (base + (" — " + extra_wo_user if extra_wo_user else "")).strip()
     if not title:
         title = "Задача из сообщения"
     
-    # Пробуем распарсить дедлайн из аргументов
-    deadline = parse_deadline(extra_wo_user, TIMEZONE) if extra_wo_user else None
-    
     logger.info("ADD: reply mid=%s, args=%r", msg.reply_to_message.message_id if msg.reply_to_message else None, command.args)
     
     if deadline:
@@ -1125,48 +1151,27 @@ async def add_task(msg: Message, command: CommandObject):
                 # Мягкий фолбэк
                 resp_username = extracted_username_or_none or (msg.from_user.username or "unknown")
             
-            # Получаем автора и проект
-            author_id = await conn.fetchval(
-                "SELECT id FROM core_user WHERE telegram_id = $1", 
-                msg.from_user.id
-            )
-            project_id = await conn.fetchval(
-                "SELECT project_id FROM core_tggroup WHERE telegram_id = $1", 
-                msg.chat.id
-            )
-            
-            # Создаем задачу
-            result = await conn.fetchval(
-                """
-                INSERT INTO core_task (
-                    title, description, responsible_user_id, responsible_username,
-                    author_user_id, project_id, deadline,
-                    status, created_at, updated_at,
-                    source_chat_id, source_message_id, source_topic_id
-                )
-                VALUES ($1::varchar, $2::text, $3, $4::varchar, $5, $6, $7::timestamp with time zone, 
-                        'TODO', NOW(), NOW(), $8, $9, $10)
-                RETURNING id
-                """,
-                title[:256],
-                title,
-                resp_user_id,
-                resp_username or "unknown",
-                author_id,
-                project_id,
-                deadline,
-                msg.chat.id,
-                msg.reply_to_message.message_id,
-                topic_id,
-            )
+            # Создаем задачу (автор и проект резолвятся внутри INSERT)
+            result = await TaskService(conn).create(NewTask(
+                title=title,
+                description=title,
+                responsible_user_id=resp_user_id,
+                responsible_username=resp_username,
+                deadline=deadline,
+                author_telegram_id=msg.from_user.id,
+                source_chat_id=msg.chat.id,
+                source_message_id=msg.reply_to_message.message_id,
+                source_topic_id=topic_id,
+            ))
+            if result and result.created:
+                await _schedule_followups(conn, [result.id])
             
-            response_text = format_task_created_response(1, [result] if result else None)
-            await safe_reply(msg, response_text)
+            response_text, markup = _created_reply(result, topic_id)
+            await safe_reply(msg, response_text, reply_markup=markup)
         finally:
             await conn.close()
     else:
         # ПОДГОТОВИТЬ КАЛЕНДАРЬ ДЛЯ /add БЕЗ ДАТЫ
-        r = get_redis()
         key = f"newtask:{msg.chat.id}:{msg.from_user.id}"
         
         task_data = {
@@ -1175,32 +1180,150 @@ async def add_task(msg: Message, command: CommandObject):
             "topic_id": msg.message_thread_id,  # если есть топики
             "responsible_username": extracted_username_or_none,  # если @юзер был в args
         }
-        await r.set(key, json.dumps(task_data), ex=1200)
-        logger.info("ADD: state saved to redis key=%s", key)
+        await get_state().set(key, task_data, ttl=1200)
+        logger.info("ADD: state saved key=%s", key)
         
         # показать календарь
         today = datetime.datetime.now(ZoneInfo(TIMEZONE)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         kb = build_calendar_kb(today)
         await msg.answer(f"📅 Выберите дату дедлайна:\n<b>{_quote(title, 100)}</b>", reply_markup=kb)
 
-# === /closetask #ID =====================================================
+# === /closetask #ID…, /status #ID… СТАТУС ================================
+STATUS_ARGS = {
+    "TODO": "TODO", "IN_PROGRESS": "IN_PROGRESS", "PROGRESS": "IN_PROGRESS",
+    "ON_REVIEW": "ON_REVIEW", "REVIEW": "ON_REVIEW", "DONE": "DONE",
+}
+CLOSE_MENU_LIMIT = 20
+
+def _close_rows_key(chat_id: int, user_id: int) -> str:
+    return f"closemenu:{chat_id}:{user_id}:rows"
+
+def _close_sel_key(chat_id: int, user_id: int) -> str:
+    return f"closemenu:{chat_id}:{user_id}:sel"
+
+def _ids_text(ids: list[int]) -> str:
+    return ", ".join(f"#{i}" for i in ids)
+
+def format_status_result(result: StatusResult, done_text: str) -> str:
+    """Ответ на смену статуса: что обновлено и каких id нет"""
+    if len(result.updated) + len(result.missing) == 1:
+        return f"✅ Task #{result.updated[0]} {done_text}" if result.updated else "Не найдено"
+    lines = []
+    if result.updated:
+        lines.append(f"✅ {done_text[:1].upper()}{done_text[1:]} ({len(result.updated)}): {_ids_text(result.updated)}")
+    if result.missing:
+        lines.append(f"Не найдены: {_ids_text(result.missing)}")
+    return "\n".join(lines)
+
+async def _set_status(task_ids: list[int], status: str, telegram_id: int | None) -> StatusResult:
+    conn = await get_conn()
+    try:
+        return await TaskService(conn).set_status(task_ids, status, actor=f"tg:{telegram_id}" if telegram_id else None)
+    finally:
+        await conn.close()
+
+def build_close_kb(rows: list[dict], selected: set[int]) -> InlineKeyboardMarkup:
+    kb_rows = [[InlineKeyboardButton(
+        text=f"{'☑️' if r['id'] in selected else '⬜️'} #{r['id']} {_quote(r['title'], 40)}",
+        callback_data=f"ct:toggle:{r['id']}",
+    )] for r in rows]
+    kb_rows.append([InlineKeyboardButton(text=f"✅ Закрыть ({len(selected)})", callback_data="ct:close")])
+    kb_rows.append([InlineKeyboardButton(text="✖️ Отмена", callback_data="ct:cancel")])
+    return InlineKeyboardMarkup(inline_keyboard=kb_rows)
+
 @dp.message(Command("closetask", ignore_mention=True))
 async def close_task(msg: Message, command: CommandObject):
+    """/closetask #1 #2 … — закрыть задачи; без аргументов — меню открытых задач чата/топика"""
     await log_raw_update(msg)
     if not await _require_can_close_msg(msg):
         return
-    if not command.args or not command.args.lstrip("#").isdigit():
-        return await safe_reply(msg, "Usage: /closetask #123")
-    task_id = int(command.args.lstrip("#"))
+    task_ids, rest = parse_task_ids(command.args)
+    if rest:
+        return await safe_reply(msg, "Usage: /closetask #123 [#124 …]")
+    if len(task_ids) > MAX_BULK:
+        return await safe_reply(msg, f"Не больше {MAX_BULK} задач за раз (указано {len(task_ids)})")
+    if task_ids:
+        result = await _set_status(task_ids, "DONE", msg.from_user.id)
+        return await safe_reply(msg, format_status_result(result, "закрыта" if len(task_ids) == 1 else "закрыты"))
+
+    topic_id = getattr(msg, "message_thread_id", None)
     conn = await get_conn()
-    updated = await conn.execute(
-        "UPDATE core_task SET status='DONE', updated_at = NOW() WHERE id=$1", task_id
-    )
-    await conn.close()
-    if updated.endswith("0"):
-        await safe_reply(msg, "Не найдено")
-    else:
-        await safe_reply(msg, f"✅ Task #{task_id} закрыта")
+    try:
+        rows = await conn.fetch("""
+            SELECT id, title FROM core_task
+            WHERE source_chat_id = $1 AND ($2::bigint IS NULL OR source_topic_id = $2)
+              AND status = ANY($3::varchar[])
+            ORDER BY deadline ASC NULLS LAST, id
+            LIMIT $4
+        """, msg.chat.id, topic_id, list(reminders.OPEN_STATUSES), CLOSE_MENU_LIMIT)
+    finally:
+        await conn.close()
+    if not rows:
+        return await safe_reply(msg, "Открытых задач нет")
+    rows = [{"id": r["id"], "title": r["title"]} for r in rows]
+    user_id = msg.from_user.id
+    state = get_state()
+    await state.delete(_close_sel_key(msg.chat.id, user_id))
+    await state.set(_close_rows_key(msg.chat.id, user_id), rows, ttl=1200)
+    await safe_reply(msg, "Выберите задачи для закрытия:", reply_markup=build_close_kb(rows, set()))
+
+@dp.callback_query(F.data.startswith("ct:toggle:"))
+async def close_menu_toggle(cb: CallbackQuery):
+    state = get_state()
+    rows = await state.get(_close_rows_key(cb.message.chat.id, cb.from_user.id))
+    if not rows:
+        return await cb.answer("Меню устарело, повторите /closetask", show_alert=True)
+    sel_key = _close_sel_key(cb.message.chat.id, cb.from_user.id)
+    await state.toggle(sel_key, cb.data.rsplit(":", 1)[1], ttl=1200)
+    selected = set(map(int, await state.members(sel_key) or ()))
+    try:
+        await cb.message.edit_reply_markup(reply_markup=build_close_kb(rows, selected))
+    except Exception:
+        pass
+    await cb.answer()
+
+@dp.callback_query(F.data == "ct:close")
+async def close_menu_apply(cb: CallbackQuery):
+    state = get_state()
+    rows_key = _close_rows_key(cb.message.chat.id, cb.from_user.id)
+    sel_key = _close_sel_key(cb.message.chat.id, cb.from_user.id)
+    if not await state.get(rows_key):
+        return await cb.answer("Меню устарело, повторите /closetask", show_alert=True)
+    selected = sorted(map(int, await state.members(sel_key) or ()))
+    if not selected:
+        return await cb.answer("Ничего не выбрано")
+    result = await _set_status(selected, "DONE", cb.from_user.id)
+    await state.delete(rows_key, sel_key)
+    try:
+        await cb.message.edit_text(format_status_result(result, "закрыты"))
+    except Exception:
+        pass
+    await cb.answer()
+
+@dp.callback_query(F.data == "ct:cancel")
+async def close_menu_cancel(cb: CallbackQuery):
+    await get_state().delete(_close_rows_key(cb.message.chat.id, cb.from_user.id),
+                             _close_sel_key(cb.message.chat.id, cb.from_user.id))
+    try:
+        await cb.message.delete()
+    except Exception:
+        pass
+    await cb.answer("Отменено")
+
+@dp.message(Command("status", ignore_mention=True))
+async def status_cmd(msg: Message, command: CommandObject):
+    """/status #1 #2 IN_PROGRESS|ON_REVIEW|TODO|DONE — сменить статус пачки задач"""
+    await log_raw_update(msg)
+    if not await _require_can_close_msg(msg):
+        return
+    task_ids, rest = parse_task_ids(command.args)
+    status = STATUS_ARGS.get(rest[0].upper()) if len(rest) == 1 else None
+    if not task_ids or status is None:
+        return await safe_reply(msg, "Usage: /status #123 [#124 …] IN_PROGRESS|ON_REVIEW|TODO|DONE")
+    if len(task_ids) > MAX_BULK:
+        return await safe_reply(msg, f"Не больше {MAX_BULK} задач за раз (указано {len(task_ids)})")
+    result = await _set_status(task_ids, status, msg.from_user.id)
+    await safe_reply(msg, format_status_result(result, f"→ {status}"))
 
 # === /topicrole - привязка топика к пользователю/роли/департаменту ======
 @dp.message(Command("topicrole", ignore_mention=True))
@@ -1253,10 +1376,8 @@ async def topicrole_cmd(msg: Message, command: CommandObject):
         # парсим аргументы команды
         if args.startswith("@"):
             # /topicrole @user
-            username = args[1:].lower()
-            user_row = await conn.fetchrow(
-                "SELECT id FROM core_user WHERE LOWER(username) = $1", username
-            )
+            username = normalize_username(args)
+            user_row = await users.lookup(conn, username)
             if not user_row:
                 return await safe_reply(msg, f"⚠️ Пользователь @{username} не найден")
             
@@ -1265,7 +1386,7 @@ async def topicrole_cmd(msg: Message, command: CommandObject):
                 VALUES ($1, 1, $2, NULL, NULL)
                 ON CONFLICT (topic_id, priority)
                 DO UPDATE SET user_id = EXCLUDED.user_id, role_id = NULL, department_id = NULL
-            """, forum_topic_id, user_row["id"])
+            """, forum_topic_id, user_row.id)
             
             await safe_reply(msg, f"✅ Топик привязан к @{username}")
             
@@ -1307,7 +1428,10 @@ async def topicrole_cmd(msg: Message, command: CommandObject):
             await safe_reply(msg, f"✅ Топик привязан к департаменту '{dept_name}'")
             
         else:
-            await safe_reply(msg, "Usage: /topicrole @user | role RoleName | dept DepartmentName")
+            return await safe_reply(msg, "Usage: /topicrole @user | role RoleName | dept DepartmentName")
+        
+        # Привязка топика изменилась — сбрасываем кэш ответственного
+        await _cache_delete(_responsible_key(msg.chat.id, topic_id))
             
     except Exception as e:
         await safe_reply(msg, f"⚠️ Ошибка: {str(e)[:200]}")
@@ -1375,6 +1499,16 @@ async def on_general_topic_toggle(msg: Message):
     tid = getattr(msg, "message_thread_id", None)
     await _touch_topic_title(msg.chat.id, int(tid) if tid is not None else 0, "General")
 
+album_buffer = AlbumBuffer(lambda items: log_raw_update(items[0], album=items))
+
+@dp.message(F.content_type.in_(MEDIA_TYPES), ~F.caption.startswith("/"))
+async def catch_media(msg: Message):
+    """Фото, документы, голосовые и т.п.: подпись -> text, вложение -> media; альбом — одной строкой"""
+    if msg.media_group_id:
+        album_buffer.add(msg)
+        return
+    await log_raw_update(msg)
+
 @dp.message(F.text & ~F.text.startswith("/"))
 async def catch_all(msg: Message):
     await log_raw_update(msg)
@@ -1397,21 +1531,25 @@ async def _do_checklast(msg: Message, n=None):
         await msg.answer("Нет сообщений в журнале")
         return
     
-    r = get_redis()
+    state = get_state()
     
     # формируем "тонкие" данные с фиксированным порядком
     slim = []
     for idx, x in enumerate(rows, start=1):
+        media = json.loads(x["media"]) if isinstance(x.get("media"), str) else x.get("media")
+        attached = media_summary(media)
+        text = x["text"] or ""
+        if attached:
+            text = f"{text}\n📎 {attached}" if text else attached
         slim.append({
             "idx": idx,
             "message_id": int(x["id"]),
-            "text": x["text"],
+            "text": text,
             "topic_id": x.get("topic_id"),
         })
     
-    await r.set(_cl_rows_key(msg.chat.id, msg.from_user.id),
-                json.dumps(slim), ex=1200)
-    await r.delete(_cl_sel_key(msg.chat.id, msg.from_user.id))
+    await state.set(_cl_rows_key(msg.chat.id, msg.from_user.id), slim, ttl=1200)
+    await state.delete(_cl_sel_key(msg.chat.id, msg.from_user.id))
     
     kb = build_checklast_kb(slim, set())
     await msg.answer("Выберите сообщения для задач:", reply_markup=kb)
@@ -1458,19 +1596,13 @@ async def checklast_toggle(cb: CallbackQuery):
     rows_key = _cl_rows_key(cb.message.chat.id, cb.from_user.id)
     sel_key = _cl_sel_key(cb.message.chat.id, cb.from_user.id)
     
-    r = get_redis()
-    exists = await r.sismember(sel_key, raw_id)
-    if exists:
-        await r.srem(sel_key, raw_id)
-    else:
-        await r.sadd(sel_key, raw_id)
-        await r.expire(sel_key, 1200)  # 20 минут
+    state = get_state()
+    await state.toggle(sel_key, raw_id, ttl=1200)  # 20 минут
     
     # Обновляем клавиатуру
-    raw_rows = await r.get(rows_key)
-    if raw_rows:
-        rows = json.loads(raw_rows)
-        selected = await r.smembers(sel_key)
+    rows = await state.get(rows_key)
+    if rows:
+        selected = await state.members(sel_key)
         selected_ids = set(map(int, selected)) if selected else set()
         kb = build_checklast_kb(rows, selected_ids)
         try:
@@ -1485,13 +1617,12 @@ async def checklast_reset(cb: CallbackQuery):
     rows_key = _cl_rows_key(cb.message.chat.id, cb.from_user.id)
     sel_key = _cl_sel_key(cb.message.chat.id, cb.from_user.id)
     
-    r = get_redis()
-    await r.delete(sel_key)
+    state = get_state()
+    await state.delete(sel_key)
     
     # Обновляем клавиатуру
-    raw_rows = await r.get(rows_key)
-    if raw_rows:
-        rows = json.loads(raw_rows)
+    rows = await state.get(rows_key)
+    if rows:
         kb = build_checklast_kb(rows, set())
         try:
             await cb.message.edit_reply_markup(reply_markup=kb)
@@ -1505,9 +1636,7 @@ async def checklast_cancel(cb: CallbackQuery):
     rows_key = _cl_rows_key(cb.message.chat.id, cb.from_user.id)
     sel_key = _cl_sel_key(cb.message.chat.id, cb.from_user.id)
     
-    r = get_redis()
-    await r.delete(rows_key)
-    await r.delete(sel_key)
+    await get_state().delete(rows_key, sel_key)
     
     try:
         await cb.message.delete()
@@ -1524,53 +1653,47 @@ async def checklast_create(cb: CallbackQuery):
     user_id = cb.from_user.id
     rows_key = _cl_rows_key(chat_id, user_id)
     sel_key = _cl_sel_key(chat_id, user_id)
-    r = get_redis()
+    state = get_state()
     
     # Получаем выбранные ID
-    raw_ids = await r.smembers(sel_key)
+    raw_ids = await state.members(sel_key)
     selected_ids = set(map(int, raw_ids)) if raw_ids else set()
     if not selected_ids:
         await cb.answer("Не выбрано ни одного сообщения", show_alert=True)
         return
     
-    # Получаем данные из Redis
-    raw_rows = await r.get(rows_key)
-    rows = json.loads(raw_rows) if raw_rows else []
+    # Получаем сохранённые строки
+    rows = await state.get(rows_key) or []
     
     # берём только выбранные, в исходном порядке (по idx)
     ordered = [rd for rd in rows if int(rd["message_id"]) in selected_ids]
     ordered.sort(key=lambda rd: rd.get("idx", 0))
     
-    created_titles = []
+    created_titles, existing_titles = [], []
     conn = await get_conn()
     try:
-        # Получаем автора и проект один раз
-        author_id = await conn.fetchval(
-            "SELECT id FROM core_user WHERE telegram_id = $1", 
-            user_id
-        )
-        project_id = await conn.fetchval(
-            "SELECT project_id FROM core_tggroup WHERE telegram_id = $1", 
-            chat_id
-        )
-        
+        # Ответственные по всем топикам пачки: один MGET + один пайплайн на промахи
+        responsible = await _resolve_responsible_many(conn, chat_id, [rd.get("topic_id") for rd in ordered])
+        drafts = []
         for rd in ordered:
-            resp_user_id, resp_username = await _resolve_responsible(
-                conn, chat_id, rd.get("topic_id"), None
-            )
-            task_id = await _create_task_minimal(
+            resp_user_id, resp_username = responsible[rd.get("topic_id")]
+            drafts.append(NewTask(
                 title=_quote(rd["text"], 160),
                 description=rd["text"],
                 responsible_user_id=resp_user_id,
                 responsible_username=resp_username,
-                author_user_id=author_id,
-                project_id=project_id,
+                author_telegram_id=user_id,
                 source_chat_id=chat_id,
                 source_message_id=int(rd["message_id"]),
                 source_topic_id=rd.get("topic_id"),
-            )
-            if task_id:
-                created_titles.append(_quote(rd["text"], 60))
+            ))
+        # Одна пачка — один INSERT (автор и проект резолвятся внутри)
+        results = await TaskService(conn).create_many(drafts)
+        # повторный клик: upsert вернёт id уже существующих задач с created = false
+        await _schedule_followups(conn, list(dict.fromkeys(r.id for r in results if r and r.created)))
+        for rd, r in zip(ordered, results):
+            if r is not None:
+                (created_titles if r.created else existing_titles).append(_quote(rd["text"], 60))
     finally:
         await conn.close()
     
@@ -1580,19 +1703,285 @@ async def checklast_create(cb: CallbackQuery):
     elif created_titles:
         items = "\n".join(f"{i+1}) «{t}»" for i, t in enumerate(created_titles))
         text = f"✅ Создано задач: {len(created_titles)}\n\nЦитаты из чата:\n{items}"
-    else:
+    elif not existing_titles:
         text = "❌ Задачи не созданы"
+    else:
+        text = ""
+    if existing_titles:
+        items = "\n".join(f"{i+1}) «{t}»" for i, t in enumerate(existing_titles))
+        text = (text + "\n\n" if text else "") + f"ℹ️ Уже были задачами: {len(existing_titles)}\n{items}"
     
     await cb.message.answer(text)
     
     # очистка состояния и закрытие меню
-    await r.delete(sel_key)
-    await r.delete(rows_key)
+    await state.delete(sel_key, rows_key)
     try:
         await cb.message.delete()
     except:
         pass
 
+# === /search <запрос> — полнотекстовый поиск по журналу и задачам =========
+def _search_key(chat_id: int, user_id: int) -> str:
+    return f"search:{chat_id}:{user_id}"
+
+def _message_link(chat_id: int, message_id: int | None) -> str | None:
+    """Ссылка на сообщение супергруппы (t.me/c/...), для обычных групп ссылок нет"""
+    s = str(chat_id)
+    if not message_id or not s.startswith("-100"):
+        return None
+    return f"https://t.me/c/{s[4:]}/{message_id}"
+
+def _render_search(chat_id: int, query: str, result: SearchPage) -> tuple[str, InlineKeyboardMarkup | None]:
+    lines = [f"🔎 <b>{html.escape(query)}</b>"]
+    if result.tasks:
+        lines.append("\nЗадачи:")
+        for t in result.tasks:
+            lines.append(f"#{t['id']} [{t['status']}] {html.escape(_quote(t['title'], 80))}")
+    if result.messages:
+        lines.append(f"\nСообщения (стр. {result.page + 1}):")
+        tz = ZoneInfo(TIMEZONE)
+        for m in result.messages:
+            when = m["created_at"].astimezone(tz).strftime("%d.%m.%Y %H:%M")
+            link = _message_link(chat_id, m["message_id"])
+            when = f'<a href="{link}">{when}</a>' if link else when
+            lines.append(f"• {when}: {html.escape(_quote(m['text'], 120))}")
+    elif not result.tasks:
+        lines.append("Ничего не найдено")
+
+    nav = []
+    if result.page > 0:
+        nav.append(InlineKeyboardButton(text="◀", callback_data=f"srch:page:{result.page - 1}"))
+    if result.has_next:
+        nav.append(InlineKeyboardButton(text="▶", callback_data=f"srch:page:{result.page + 1}"))
+    kb = InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
+    return "\n".join(lines), kb
+
+@dp.message(Command("search", ignore_mention=True))
+async def search_cmd(msg: Message, command: CommandObject):
+    await log_raw_update(msg)
+    query = normalize_query(command.args)
+    if not query:
+        return await safe_reply(msg, "Usage: /search <запрос> — поиск по сообщениям и задачам чата (в топике — по топику)")
+
+    topic_id = getattr(msg, "message_thread_id", None)
+    user_id = msg.from_user.id if msg.from_user else 0
+    await get_state().set(_search_key(msg.chat.id, user_id), {"q": query, "topic_id": topic_id})
+
+    conn = await get_conn()
+    try:
+        result = await search(conn, query, msg.chat.id, topic_id)
+    finally:
+        await conn.close()
+    text, kb = _render_search(msg.chat.id, query, result)
+    await safe_reply(msg, text, reply_markup=kb, disable_web_page_preview=True)
+
+@dp.callback_query(F.data.startswith("srch:page:"))
+async def search_page(cb: CallbackQuery):
+    saved = await get_state().get(_search_key(cb.message.chat.id, cb.from_user.id))
+    if not saved:
+        return await cb.answer("Поиск устарел, повторите /search", show_alert=True)
+    page = max(0, int(cb.data.rsplit(":", 1)[1]))
+    conn = await get_conn()
+    try:
+        result = await search(conn, saved["q"], cb.message.chat.id, saved.get("topic_id"), page=page)
+    finally:
+        await conn.close()
+    text, kb = _render_search(cb.message.chat.id, saved["q"], result)
+    try:
+        await cb.message.edit_text(text, reply_markup=kb, disable_web_page_preview=True)
+    except Exception:
+        pass
+    await cb.answer()
+
+STATS_MAX_DAYS = 365
+
+def _render_stats(stats: ChatStats, topic_titles: dict, user_names: dict, topic_id: int | None) -> str:
+    scope = f" в топике «{html.escape(topic_titles.get(topic_id) or str(topic_id))}»" if topic_id else ""
+    lines = [f"📊 Сообщений за {stats.days} дн.{scope}: <b>{stats.total}</b>"]
+    if stats.topics and not topic_id:
+        lines.append("\nТопики:")
+        for tid, cnt in stats.topics:
+            title = "без топика" if not tid else (topic_titles.get(tid) or f"#{tid}")
+            lines.append(f"• {html.escape(title)} — {cnt}")
+    if stats.users:
+        lines.append("\nАктивнее всех:")
+        for uid, cnt in stats.users:
+            name = user_names.get(uid) or (f"id:{uid}" if uid else "неизвестно")
+            lines.append(f"• {html.escape(name)} — {cnt}")
+    return "\n".join(lines)
+
+@dp.message(Command("stats", ignore_mention=True))
+async def stats_cmd(msg: Message, command: CommandObject):
+    """/stats [дней] — активность чата (в топике — топика) по почасовым сводкам"""
+    await log_raw_update(msg)
+    arg = (command.args or "").strip()
+    if arg and not arg.isdigit():
+        return await safe_reply(msg, "Usage: /stats [дней] — активность чата за N дней (по умолчанию 7)")
+    days = min(max(int(arg or 7), 1), STATS_MAX_DAYS)
+    topic_id = getattr(msg, "message_thread_id", None)
+
+    conn = await get_conn()
+    try:
+        stats = await chat_stats(conn, msg.chat.id, TIMEZONE, days=days, topic_id=topic_id)
+        topic_ids = [t for t, _ in stats.topics if t] + ([topic_id] if topic_id else [])
+        user_ids = [u for u, _ in stats.users if u]
+        topic_rows = await conn.fetch("""
+            SELECT ft.topic_id, ft.title
+            FROM core_forumtopic ft
+            JOIN core_tggroup g ON g.id = ft.group_id
+            WHERE g.telegram_id = $1 AND ft.topic_id = ANY($2::bigint[])
+        """, msg.chat.id, topic_ids) if topic_ids else []
+        user_rows = await conn.fetch(
+            "SELECT telegram_id, username FROM core_user WHERE telegram_id = ANY($1::bigint[])", user_ids
+        ) if user_ids else []
+    finally:
+        await conn.close()
+    topic_titles = {r["topic_id"]: r["title"] for r in topic_rows}
+    user_names = {r["telegram_id"]: f"@{r['username']}" for r in user_rows if r["username"]}
+    await safe_reply(msg, _render_stats(stats, topic_titles, user_names, topic_id))
+
+# === /mytasks, /tasks — списки задач (services.listings) ==================
+TASKS_USAGE = "Usage: /tasks [@user] [open|todo|progress|review|done|all]"
+
+def _tasks_key(chat_id: int, user_id: int) -> str:
+    return f"tasks:{chat_id}:{user_id}"
+
+def _render_listing(result: listings.ListingPage) -> InlineKeyboardMarkup | None:
+    nav = []
+    if result.page > 0:
+        nav.append(InlineKeyboardButton(text="◀", callback_data=f"tl:page:{result.page - 1}"))
+    if result.has_next:
+        nav.append(InlineKeyboardButton(text="▶", callback_data=f"tl:page:{result.page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[nav]) if nav else None
+
+async def _show_listing(msg: Message, q: listings.TaskQuery, title: str):
+    user_id = msg.from_user.id if msg.from_user else 0
+    await get_state().set(_tasks_key(msg.chat.id, user_id), {"q": q.to_state(), "title": title})
+    result = await listings.get_page(get_redis(), get_conn, q, title)
+    await safe_reply(msg, result.text, reply_markup=_render_listing(result))
+
+@dp.message(Command("mytasks", ignore_mention=True))
+async def mytasks_cmd(msg: Message, command: CommandObject):
+    """/mytasks [статус] — задачи, где я ответственный"""
+    await log_raw_update(msg)
+    parsed = listings.parse_filter(command.args)
+    if not msg.from_user or parsed is None or parsed[1]:
+        return await safe_reply(msg, "Usage: /mytasks [open|todo|progress|review|done|all]")
+    q = listings.TaskQuery("my", msg.from_user.id, parsed[0], username=msg.from_user.username)
+    await _show_listing(msg, q, "📋 Мои задачи")
+
+@dp.message(Command("tasks", ignore_mention=True))
+async def tasks_cmd(msg: Message, command: CommandObject):
+    """/tasks [@user] [статус] — задачи проекта группы (без проекта — этого чата)"""
+    await log_raw_update(msg)
+    parsed = listings.parse_filter(command.args)
+    if parsed is None:
+        return await safe_reply(msg, TASKS_USAGE)
+    statuses, username = parsed
+    project_id = await _get_project_id_by_chat(msg.chat.id)
+    if project_id:
+        q = listings.TaskQuery("project", project_id, statuses)
+        title = "📋 Задачи проекта"
+    else:
+        q = listings.TaskQuery("chat", msg.chat.id, statuses)
+        title = "📋 Задачи чата"
+    if username:
+        conn = await get_conn()
+        try:
+            row = await users.lookup(conn, username)
+        finally:
+            await conn.close()
+        q.user_id, q.username = (row.id, None) if row else (None, username)
+        title += f" — @{html.escape(row.display if row else username)}"
+    await _show_listing(msg, q, title)
+
+@dp.callback_query(F.data.startswith("tl:page:"))
+async def tasks_page(cb: CallbackQuery):
+    saved = await get_state().get(_tasks_key(cb.message.chat.id, cb.from_user.id))
+    if not saved:
+        return await cb.answer("Список устарел, повторите /tasks или /mytasks", show_alert=True)
+    page = max(0, int(cb.data.rsplit(":", 1)[1]))
+    q = listings.TaskQuery.from_state(saved["q"])
+    result = await listings.get_page(get_redis(), get_conn, q, saved["title"], page=page)
+    try:
+        await cb.message.edit_text(result.text, reply_markup=_render_listing(result))
+    except Exception:
+        pass
+    await cb.answer()
+
+# === Inline-режим: @bot <текст> — поиск задач (services.inline) ===========
+inline_scopes = inline.ScopeCache()
+
+@dp.inline_query()
+async def inline_tasks(iq: InlineQuery):
+    offset = int(iq.offset) if iq.offset.isdigit() else 0
+    cache_time = inline.INLINE_CACHE_SECONDS
+    try:
+        conn = await get_conn()
+        try:
+            results, next_offset = await inline.search_tasks(conn, inline_scopes, iq.from_user.id, iq.query, offset)
+        finally:
+            await conn.close()
+    except Exception as e:
+        print(f"INLINE_WARN: {e}")
+        results, next_offset, cache_time = [], "", 0  # сбой не должен закэшироваться у Telegram
+    await iq.answer(results, cache_time=cache_time, is_personal=True, next_offset=next_offset)
+
+# === /board — закреплённая доска задач топика (services.boards) =========
+@dp.message(Command("board", ignore_mention=True))
+async def board_cmd(msg: Message, command: CommandObject):
+    """/board — закрепить в топике доску открытых задач; /board off — снять"""
+    await log_raw_update(msg)
+    if not await _require_can_assign_msg(msg):
+        return
+    topic_id = getattr(msg, "message_thread_id", None)
+    arg = (command.args or "").strip().lower()
+    if arg not in ("", "off"):
+        return await safe_reply(msg, "Usage: /board [off]")
+    old_id = await boards.remove(msg.chat.id, topic_id)
+    if old_id:
+        try:
+            await bot.unpin_chat_message(msg.chat.id, message_id=old_id)
+        except Exception as e:
+            print(f"BOARD_WARN unpin: {e}")
+    if arg == "off":
+        return await safe_reply(msg, "Доска снята" if old_id else "Доски нет")
+    message_id = await boards.create(msg.chat.id, topic_id, safe_send)
+    if message_id:
+        try:
+            await bot.pin_chat_message(msg.chat.id, message_id, disable_notification=True)
+        except Exception as e:
+            print(f"BOARD_WARN pin: {e}")
+
+@dp.callback_query(F.data.startswith("task:ack:"))
+async def task_ack(cb: CallbackQuery):
+    """«Принял»: останавливает эскалацию. Может нажать ответственный или тот, кто может назначать"""
+    task_id = int(cb.data.rsplit(":", 1)[1])
+    conn = await get_conn()
+    try:
+        row = await conn.fetchrow("""
+            SELECT t.responsible_username, u.telegram_id
+            FROM core_task t
+            LEFT JOIN core_user u ON u.id = t.responsible_user_id
+            WHERE t.id = $1
+        """, task_id)
+        if row is None:
+            return await cb.answer("Задача не найдена", show_alert=True)
+        is_responsible = row["telegram_id"] == cb.from_user.id or (
+            bool(cb.from_user.username)
+            and normalize_username(cb.from_user.username) == normalize_username(row["responsible_username"])
+        )
+        if not is_responsible and not await _require_can_assign_cb(cb):
+            return
+        acked = await escalation.acknowledge(conn, task_id)
+    finally:
+        await conn.close()
+    await cb.answer("👍 Принято" if acked else "Уже принята")
+    try:
+        await cb.message.edit_reply_markup(reply_markup=None)
+    except Exception:
+        pass
+
 # === Обработчики календаря ===============================================
 @dp.callback_query(F.data.startswith("cal:"))
 async def calendar_callback(cb: CallbackQuery):
@@ -1601,8 +1990,7 @@ async def calendar_callback(cb: CallbackQuery):
     
     if data == "cal:cancel":
         # Отмена выбора
-        r = get_redis()
-        await r.delete(f"newtask:{cb.message.chat.id}:{cb.from_user.id}")
+        await get_state().delete(f"newtask:{cb.message.chat.id}:{cb.from_user.id}")
         await cb.message.delete()
         await cb.answer("Отменено")
         return
@@ -1644,18 +2032,17 @@ async def calendar_callback(cb: CallbackQuery):
     if data.startswith("cal:"):
         date_str = data[4:]  # Убираем "cal:"
         
-        # Сохраняем выбранную дату в Redis
-        r = get_redis()
+        # Сохраняем выбранную дату в состоянии диалога
+        state = get_state()
         key = f"newtask:{cb.message.chat.id}:{cb.from_user.id}"
-        task_data_raw = await r.get(key)
-        if not task_data_raw:
+        task_data = await state.get(key)
+        if not task_data:
             await cb.message.delete()
             await cb.answer("Сессия истекла, начните заново")
             return
         
-        task_data = json.loads(task_data_raw)
         task_data["date"] = date_str
-        await r.set(key, json.dumps(task_data), ex=1200)
+        await state.set(key, task_data, ttl=1200)
         
         # Показываем выбор времени
         kb = build_time_kb(30)
@@ -1670,16 +2057,15 @@ async def time_callback(cb: CallbackQuery):
     """Обработчик выбора времени"""
     time_str = cb.data[5:]  # Убираем "time:"
     
-    # Получаем данные из Redis
-    r = get_redis()
+    # Получаем данные диалога
+    state = get_state()
     key = f"newtask:{cb.message.chat.id}:{cb.from_user.id}"
-    task_data_raw = await r.get(key)
-    if not task_data_raw:
+    task_data = await state.get(key)
+    if not task_data:
         await cb.message.delete()
         await cb.answer("Сессия истекла, начните заново")
         return
     
-    task_data = json.loads(task_data_raw)
     
     # Создаем полный дедлайн
     date_str = task_data.get("date", datetime.datetime.now().strftime("%Y-%m-%d"))
@@ -1701,48 +2087,28 @@ async def time_callback(cb: CallbackQuery):
             resp_username = task_data.get("responsible_username") or (cb.from_user.username or "unknown")
             # resp_user_id оставить None — в БД есть поле responsible_username
         
-        # Получаем автора и проект
-        author_id = await conn.fetchval(
-            "SELECT id FROM core_user WHERE telegram_id = $1", 
-            cb.from_user.id
-        )
-        project_id = await conn.fetchval(
-            "SELECT project_id FROM core_tggroup WHERE telegram_id = $1", 
-            cb.message.chat.id
-        )
-        
-        # Создаем задачу
+        # Создаем задачу (автор и проект резолвятся внутри INSERT)
         text = task_data["text"]
-        result = await conn.fetchval(
-            """
-            INSERT INTO core_task (
-                title, description, responsible_user_id, responsible_username,
-                author_user_id, project_id, deadline,
-                status, created_at, updated_at,
-                source_chat_id, source_message_id, source_topic_id
-            )
-            VALUES ($1::varchar, $2::text, $3, $4::varchar, $5, $6, $7::timestamp with time zone, 
-                    'TODO', NOW(), NOW(), $8, $9, $10)
-            RETURNING id
-            """,
-            text[:256],
-            text,
-            resp_user_id,
-            resp_username or "unknown",
-            author_id,
-            project_id,
-            deadline,
-            cb.message.chat.id,
-            task_data.get("message_id"),
-            task_data.get("topic_id"),
-        )
+        result = await TaskService(conn).create(NewTask(
+            title=text,
+            description=text,
+            responsible_user_id=resp_user_id,
+            responsible_username=resp_username,
+            deadline=deadline,
+            author_telegram_id=cb.from_user.id,
+            source_chat_id=cb.message.chat.id,
+            source_message_id=task_data.get("message_id"),
+            source_topic_id=task_data.get("topic_id"),
+        ))
+        if result and result.created:
+            await _schedule_followups(conn, [result.id])
         
-        # Удаляем данные из Redis
-        await r.delete(key)
+        # Удаляем данные диалога
+        await state.delete(key)
         
         # Отправляем ответ
-        response_text = format_task_created_response(1, [result] if result else None)
-        await cb.message.edit_text(response_text)
+        response_text, markup = _created_reply(result, task_data.get("topic_id"))
+        await cb.message.edit_text(response_text, reply_markup=markup)
         
     finally:
         await conn.close()
@@ -1752,13 +2118,13 @@ async def time_callback(cb: CallbackQuery):
 # === Обработчики редактирования сообщений ===============================
 @dp.edited_message()
 async def on_edited_message(msg: Message):
-    """Обновляет текст в raw_updates при редактировании сообщения"""
-    await _update_raw_on_edit(msg)
+    """Правка сообщения: серия правок склеивается и пишется в raw_updates одной записью"""
+    edit_buffer.add(msg)
 
 @dp.edited_channel_post()
 async def on_edited_channel_post(msg: Message):
-    """Обновляет текст в raw_updates при редактировании поста канала"""
-    await _update_raw_on_edit(msg)
+    """Правка поста канала — так же, как правка сообщения"""
+    edit_buffer.add(msg)
 
 
 async def setup_bot_commands(bot: Bot):
@@ -1770,8 +2136,14 @@ async def setup_bot_commands(bot: Bot):
         BotCommand(command="newrole", description="создать роль"),
         BotCommand(command="setrole", description="назначить роль"),
         BotCommand(command="newtask", description="новая задача"),
-        BotCommand(command="closetask", description="закрыть задачу"),
+        BotCommand(command="closetask", description="закрыть задачи"),
+        BotCommand(command="status", description="сменить статус задач"),
+        BotCommand(command="mytasks", description="мои задачи"),
+        BotCommand(command="tasks", description="задачи проекта/чата"),
+        BotCommand(command="board", description="доска задач топика"),
         BotCommand(command="checklast", description="последние N"),
+        BotCommand(command="search", description="поиск по сообщениям и задачам"),
+        BotCommand(command="stats", description="активность чата"),
         BotCommand(command="topicrole", description="привязка к топику"),
         BotCommand(command="assigntopic", description="alias topicrole"),
         BotCommand(command="add", description="задача из сообщения")
@@ -1780,6 +2152,15 @@ async def setup_bot_commands(bot: Bot):
     await bot.set_my_commands(private_cmds, scope=BotCommandScopeAllPrivateChats())
     await bot.set_my_commands(group_cmds,   scope=BotCommandScopeAllGroupChats())
 
+_background_tasks: set[asyncio.Task] = set()
+
+def _spawn(coro) -> asyncio.Task:
+    """Фоновая задача на всё время работы бота (держим ссылку, чтобы её не собрал GC)"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
 async def main():
     await ensure_schema()
     me = await bot.get_me()
@@ -1789,12 +2170,51 @@ async def main():
     await setup_bot_commands(bot)
     print("Bot commands menu configured")
     
+    cache = get_client_cache()
+    if cache is not None:
+        cache.start()
+    try:
+        conn = await get_conn()
+        try:
+            await payload_codec.load(conn)
+        finally:
+            await conn.close()
+        print(f"Payload codec ready (dict_id={payload_codec.current_id})")
+    except Exception as e:
+        print(f"RAW_PAYLOAD_WARN: {e}")
+    metrics_interval = float(os.getenv("REDIS_METRICS_INTERVAL", "300"))
+    if metrics_interval > 0:
+        _spawn(report_metrics(metrics_interval))
+    _spawn(maintenance_loop(get_conn))
+    _spawn(rollup_loop(get_conn, TIMEZONE))
+    _spawn(flow_loop(get_conn, TIMEZONE))
+    _spawn(uniques.snapshot_loop(get_redis, get_conn, TIMEZONE))
+    _spawn(reminders.reminder_loop(
+        get_redis, get_conn, safe_send, TIMEZONE,
+        handlers={escalation.KIND: escalation.escalate}, reconcilers=(escalation.reconcile,),
+    ))
+    _spawn(task_changes.run())
+    _spawn(outbox_relay.run())
+    _spawn(digest.digest_loop(
+        get_redis, get_conn, lambda chat, topic, text: safe_send(chat, topic, text, shadow=False),
+        TIMEZONE, SHADOW_MODE,
+    ))
+    
     try:
         await bot.delete_webhook(drop_pending_updates=True)
         print("Webhook deleted (if existed), starting polling…")
     except Exception as e:
         print(f"Failed to delete webhook: {e}")
-    await dp.start_polling(bot)
+    try:
+        # chat_member Telegram шлёт только по явному запросу — список из зарегистрированных хендлеров
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        await album_buffer.drain()
+        await edit_buffer.drain()
+        await membership_buffer.drain()
+        await task_changes.drain()
+        await boards.drain()
+        await outbox_relay.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,316 @@
+"""
+Холодный архив raw_updates: отцепленные месячные секции -> файлы-сегменты на диске.
+
+Формат сегмента (raw_updates_pYYYYMM.seg):
+    [блок 0][блок 1]...[индекс][u64 длина индекса][MAGIC]
+- строки отсортированы по (chat_id, created_at, id) и нарезаны на блоки по
+  BLOCK_ROWS; каждый блок — отдельный zstd-кадр с JSONL внутри;
+- индекс (zstd JSON) — разреженный: для блока первая и последняя пара
+  (chat_id, created_at), смещение, длина и число строк.
+Полный апдейт из raw_payloads (services.payloads) кладётся в строку распакованным
+(ключ update): сегмент читается без словарей zstd из Postgres. Тела удаляются из
+raw_payloads вместе с секцией, после записи сегмента.
+
+Читатель отображает файл в память (mmap), по индексу выбирает только блоки,
+пересекающиеся с запросом, и распаковывает их по одному — холодная история
+стоит места на диске, а не памяти Postgres.
+
+Запуск вручную:
+    python -m services.archive archive            # заархивировать отцепленные секции
+    python -m services.archive scan CHAT_ID [--since ISO] [--until ISO] [--limit N]
+"""
+import asyncio
+import bisect
+import datetime
+import json
+import mmap
+import os
+import re
+import struct
+
+import zstandard
+
+from services.payloads import PayloadCodec, codec as default_codec
+
+ARCHIVE_DIR = os.getenv("RAW_ARCHIVE_DIR", "")  # пусто — архивирование выключено
+BLOCK_ROWS = int(os.getenv("RAW_ARCHIVE_BLOCK_ROWS", "2000"))
+ZSTD_LEVEL = int(os.getenv("RAW_ARCHIVE_ZSTD_LEVEL", "10"))
+
+MAGIC = b"RAWSEG01"
+_TRAILER = struct.Struct("<Q8s")
+_PARTITION_RE = re.compile(r"^raw_updates_p\d{6}$")
+COLUMNS = ("id", "chat_id", "message_id", "user_id", "username", "text", "topic_id", "payload", "media", "created_at")
+
+
+def _ts(value) -> float:
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+def _encode_row(row, payload_codec: PayloadCodec | None = None) -> dict:
+    out = {c: row[c] for c in COLUMNS}
+    for key in ("payload", "media"):
+        if isinstance(out[key], str):
+            out[key] = json.loads(out[key])
+    out["created_at"] = out["created_at"].isoformat()
+    if payload_codec is not None and row["body"] is not None:
+        out["update"] = payload_codec.decode(row["dict_id"], bytes(row["body"]))
+    return out
+
+
+class SegmentWriter:
+    """Пишет сегмент во временный файл; close() атомарно переименовывает его в path"""
+
+    def __init__(self, path: str, block_rows: int = BLOCK_ROWS, level: int = ZSTD_LEVEL):
+        self.path = path
+        self.block_rows = block_rows
+        self._tmp = path + ".tmp"
+        self._f = open(self._tmp, "wb")
+        self._cctx = zstandard.ZstdCompressor(level=level)
+        self._buf: list[dict] = []
+        self._blocks: list[list] = []
+        self._last_key = None
+        self.rows = 0      # строк в записанных блоках
+        self.added = 0     # строк принято всего
+
+    def add(self, row: dict) -> None:
+        key = (row["chat_id"], _ts(row["created_at"]))
+        if self._last_key is not None and key < self._last_key:
+            raise ValueError("rows must be sorted by (chat_id, created_at)")
+        self._last_key = key
+        self._buf.append(row)
+        self.added += 1
+        if len(self._buf) >= self.block_rows:
+            self._flush()
+
+    def add_many(self, rows: list[dict]) -> None:
+        for row in rows:
+            self.add(row)
+
+    def _flush(self) -> None:
+        if not self._buf:
+            return
+        data = "\n".join(json.dumps(r, ensure_ascii=False, default=str) for r in self._buf).encode()
+        frame = self._cctx.compress(data)
+        first, last = self._buf[0], self._buf[-1]
+        self._blocks.append([
+            first["chat_id"], _ts(first["created_at"]),
+            last["chat_id"], _ts(last["created_at"]),
+            self._f.tell(), len(frame), len(self._buf),
+        ])
+        self._f.write(frame)
+        self.rows += len(self._buf)
+        self._buf = []
+
+    def close(self) -> str:
+        self._flush()
+        index = json.dumps({"version": 1, "rows": self.rows, "blocks": self._blocks}).encode()
+        index = self._cctx.compress(index)
+        self._f.write(index)
+        self._f.write(_TRAILER.pack(len(index), MAGIC))
+        self._f.flush()
+        os.fsync(self._f.fileno())
+        self._f.close()
+        os.replace(self._tmp, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self._f.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+class SegmentReader:
+    """Чтение одного сегмента через mmap"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._dctx = zstandard.ZstdDecompressor()
+        index_len, magic = _TRAILER.unpack_from(self._mm, len(self._mm) - _TRAILER.size)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a raw_updates segment")
+        start = len(self._mm) - _TRAILER.size - index_len
+        index = json.loads(self._dctx.decompress(self._mm[start:start + index_len]))
+        self.rows = index["rows"]
+        self.blocks = index["blocks"]
+        self._last_keys = [(b[2], b[3]) for b in self.blocks]
+
+    def close(self) -> None:
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _block_rows(self, block) -> list[dict]:
+        offset, length = block[4], block[5]
+        data = self._dctx.decompress(self._mm[offset:offset + length])
+        return [json.loads(line) for line in data.decode().split("\n")]
+
+    def _candidate_blocks(self, chat_id: int, lo: float, hi: float) -> list:
+        """Блоки, чей диапазон ключей пересекается с [(chat_id, lo), (chat_id, hi)]"""
+        i = bisect.bisect_left(self._last_keys, (chat_id, lo))
+        out = []
+        while i < len(self.blocks) and (self.blocks[i][0], self.blocks[i][1]) <= (chat_id, hi):
+            out.append(self.blocks[i])
+            i += 1
+        return out
+
+    def scan(self, chat_id: int, since: datetime.datetime | None = None,
+             until: datetime.datetime | None = None, reverse: bool = False):
+        """Строки чата в окне [since, until] по возрастанию created_at (или убыванию)"""
+        lo = since.timestamp() if since else float("-inf")
+        hi = until.timestamp() if until else float("inf")
+        blocks = self._candidate_blocks(chat_id, lo, hi)
+        for block in (reversed(blocks) if reverse else blocks):
+            rows = self._block_rows(block)
+            for row in (reversed(rows) if reverse else rows):
+                if row["chat_id"] == chat_id and lo <= _ts(row["created_at"]) <= hi:
+                    yield row
+
+
+class ArchiveReader:
+    """Все сегменты каталога; сегменты месячные, порядок имён = порядок времени"""
+
+    def __init__(self, directory: str = ARCHIVE_DIR):
+        self.directory = directory
+
+    def segments(self) -> list[str]:
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            os.path.join(self.directory, n) for n in os.listdir(self.directory) if n.endswith(".seg")
+        )
+
+    def scan(self, chat_id: int, since: datetime.datetime | None = None,
+             until: datetime.datetime | None = None, reverse: bool = False):
+        paths = self.segments()
+        for path in (reversed(paths) if reverse else paths):
+            with SegmentReader(path) as seg:
+                yield from seg.scan(chat_id, since, until, reverse=reverse)
+
+    def latest(self, chat_id: int, limit: int, topic_id: int | None = None,
+               before: datetime.datetime | None = None) -> list[dict]:
+        """Последние limit сообщений чата (без команд), от новых к старым — как /checklast"""
+        out = []
+        for row in self.scan(chat_id, until=before, reverse=True):
+            if topic_id is not None and row["topic_id"] != topic_id:
+                continue
+            text = row.get("text")
+            if text is None or text.startswith("/"):
+                continue
+            out.append(row)
+            if len(out) >= limit:
+                break
+        return out
+
+
+# --- архивирование из Postgres --------------------------------------------
+async def detached_partitions(conn) -> list[str]:
+    """Отцепленные секции raw_updates (после raw_updates_maintain(..., 'detach'))"""
+    rows = await conn.fetch("""
+        SELECT c.relname
+        FROM pg_class c
+        WHERE c.relkind = 'r'
+          AND NOT c.relispartition
+          AND c.relname ~ '^raw_updates_p[0-9]{6}$'
+        ORDER BY c.relname
+    """)
+    return [r["relname"] for r in rows]
+
+
+async def archive_partition(conn, table: str, directory: str = ARCHIVE_DIR,
+                            drop: bool = True, block_rows: int = BLOCK_ROWS,
+                            payload_codec: PayloadCodec | None = None) -> str:
+    """
+    Выгружает отцепленную секцию в сегмент вместе с телами из raw_payloads.
+    Таблица и её тела удаляются только после того, как сегмент записан на диск
+    и число строк сошлось.
+    """
+    if not _PARTITION_RE.match(table):
+        raise ValueError(f"not a raw_updates partition: {table}")
+    payload_codec = payload_codec or default_codec
+    await payload_codec.load(conn)
+    os.makedirs(directory, exist_ok=True)
+    writer = SegmentWriter(os.path.join(directory, f"{table}.seg"), block_rows=block_rows)
+    try:
+        async with conn.transaction():
+            cursor = conn.cursor(
+                f'SELECT {", ".join("t." + c for c in COLUMNS)}, p.dict_id, p.body FROM "{table}" t'
+                f' LEFT JOIN raw_payloads p ON p.raw_id = t.id ORDER BY t.chat_id, t.created_at, t.id',
+                prefetch=block_rows,
+            )
+            batch = []
+            async for row in cursor:
+                batch.append(_encode_row(row, payload_codec))
+                if len(batch) >= block_rows:
+                    # сжатие — в потоке, чтобы не стопорить event loop бота
+                    await asyncio.to_thread(writer.add_many, batch)
+                    batch = []
+            await asyncio.to_thread(writer.add_many, batch)
+            expected = await conn.fetchval(f'SELECT count(*) FROM "{table}"')
+    except BaseException:
+        writer.abort()
+        raise
+    if expected != writer.added:
+        writer.abort()
+        raise RuntimeError(f"{table}: row count mismatch ({writer.added} vs {expected})")
+    path = await asyncio.to_thread(writer.close)
+    if drop:
+        async with conn.transaction():
+            await conn.execute(f'DELETE FROM raw_payloads WHERE raw_id IN (SELECT id FROM "{table}")')
+            await conn.execute(f'DROP TABLE "{table}"')
+    return path
+
+
+async def archive_detached(conn, directory: str = ARCHIVE_DIR) -> list[str]:
+    """Архивирует все отцепленные секции. Возвращает пути созданных сегментов"""
+    if not directory:
+        return []
+    return [await archive_partition(conn, t, directory) for t in await detached_partitions(conn)]
+
+
+def _main(argv=None) -> None:
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(prog="python -m services.archive")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("archive")
+    scan = sub.add_parser("scan")
+    scan.add_argument("chat_id", type=int)
+    scan.add_argument("--since", type=datetime.datetime.fromisoformat)
+    scan.add_argument("--until", type=datetime.datetime.fromisoformat)
+    scan.add_argument("--limit", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "scan":
+        for n, row in enumerate(ArchiveReader().scan(args.chat_id, args.since, args.until), start=1):
+            sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+            if args.limit and n >= args.limit:
+                break
+        return
+
+    import asyncpg
+
+    async def run():
+        conn = await asyncpg.connect(
+            user="bot", password=os.getenv("DB_PASSWORD"), database="botdb", host="db", port=5432,
+        )
+        try:
+            for path in await archive_detached(conn):
+                print(f"RAW_ARCHIVE {path}")
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,141 @@
+"""
+Закреплённая «доска» открытых задач в топике, обновляемая сама.
+
+/board в топике публикует и закрепляет сообщение со списком открытых задач
+топика; состояние доски — в Redis, хеш board:<chat>:<topic> (message_id и хеш
+показанного текста), так что оно переживает перезапуск и общее для процессов.
+
+Изменения задач приходят из services.task_changes (триггер в БД) и копятся по
+топику BOARD_DEBOUNCE_SECONDS секунд тишины (services.coalesce): всплеск из
+20 задач от /checklast — одна перерисовка; при непрерывных правках доска
+перерисовывается не реже BOARD_MAX_DELAY_SECONDS. Текст пересобирается одним запросом,
+и сообщение правится, только если изменился хеш видимого содержимого, —
+лишних правок (и упора в лимиты Telegram на edit) нет.
+"""
+from __future__ import annotations
+
+import hashlib
+import html
+import os
+
+from aiogram.exceptions import TelegramBadRequest
+
+from services.coalesce import CoalescingBuffer
+from services.reminders import OPEN_STATUSES
+
+BOARD_DEBOUNCE = float(os.getenv("BOARD_DEBOUNCE_SECONDS", "3"))
+BOARD_MAX_DELAY = float(os.getenv("BOARD_MAX_DELAY_SECONDS", "15"))
+BOARD_MAX_ITEMS = 40
+TITLE_MAX = 60
+STATUS_ICONS = {"TODO": "⚪", "IN_PROGRESS": "🔵", "ON_REVIEW": "🟣"}
+
+SQL_OPEN_TOPIC = """
+SELECT id, title, status, deadline, responsible_username, count(*) OVER () AS total
+FROM core_task
+WHERE source_chat_id = $1 AND source_topic_id IS NOT DISTINCT FROM $2
+  AND status = ANY($3::varchar[])
+ORDER BY deadline ASC NULLS LAST, id
+LIMIT $4
+"""
+
+
+def board_key(chat_id: int, topic_id: int | None) -> str:
+    return f"board:{chat_id}:{topic_id or 0}"
+
+
+def render(rows) -> str:
+    if not rows:
+        return "📌 Открытые задачи топика\n\nНет открытых задач 🎉"
+    lines = ["📌 Открытые задачи топика", ""]
+    for r in rows:
+        title = r["title"] if len(r["title"]) <= TITLE_MAX else r["title"][:TITLE_MAX - 1] + "…"
+        line = f"{STATUS_ICONS.get(r['status'], '•')} #{r['id']} «{html.escape(title)}»"
+        who = r["responsible_username"]
+        if who and who != "unknown":
+            line += f" — @{html.escape(who)}"
+        if r["deadline"]:
+            line += f" · до {r['deadline'].strftime('%d.%m')}"
+        lines.append(line)
+    total = rows[0]["total"]
+    if total > len(rows):
+        lines.append(f"…и ещё {total - len(rows)}")
+    return "\n".join(lines)
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+class BoardManager:
+    """Доски по топикам: создание, отложенная перерисовка по изменениям, снятие"""
+
+    def __init__(self, get_redis, get_conn, edit, window: float = BOARD_DEBOUNCE, max_delay: float = BOARD_MAX_DELAY):
+        self._get_redis = get_redis
+        self._get_conn = get_conn
+        self._edit = edit  # async edit(chat_id, message_id, text)
+        self._buffer = CoalescingBuffer(self._flush, window, key=lambda scope: scope, max_delay=max_delay)
+
+    async def _render(self, chat_id: int, topic_id: int | None) -> str:
+        conn = await self._get_conn()
+        try:
+            rows = await conn.fetch(SQL_OPEN_TOPIC, chat_id, topic_id, list(OPEN_STATUSES), BOARD_MAX_ITEMS)
+        finally:
+            await conn.close()
+        return render(rows)
+
+    async def create(self, chat_id: int, topic_id: int | None, send) -> int | None:
+        """Публикует доску через send(chat, topic, text) -> Message; None — не отправлено (shadow)"""
+        text = await self._render(chat_id, topic_id)
+        sent = await send(chat_id, topic_id, text)
+        if sent is None:
+            return None
+        await self._get_redis().hset(board_key(chat_id, topic_id), mapping={
+            "message_id": sent.message_id, "hash": content_hash(text),
+        })
+        return sent.message_id
+
+    async def remove(self, chat_id: int, topic_id: int | None) -> int | None:
+        """Снимает доску; возвращает message_id бывшей доски"""
+        redis = self._get_redis()
+        key = board_key(chat_id, topic_id)
+        message_id = await redis.hget(key, "message_id")
+        await redis.delete(key)
+        return int(message_id) if message_id else None
+
+    async def refresh(self, chat_id: int, topic_id: int | None) -> bool:
+        """Перерисовка, если доска есть и видимый текст изменился. True — сообщение правилось"""
+        redis = self._get_redis()
+        key = board_key(chat_id, topic_id)
+        state = await redis.hgetall(key)
+        if not state:
+            return False
+        state = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+                 for k, v in state.items()}
+        text = await self._render(chat_id, topic_id)
+        digest = content_hash(text)
+        if digest == state.get("hash"):
+            return False
+        try:
+            await self._edit(chat_id, int(state["message_id"]), text)
+        except TelegramBadRequest as e:
+            if "not modified" not in str(e):
+                if "not found" in str(e):
+                    await redis.delete(key)  # доску удалили в Telegram
+                print(f"BOARD_WARN {chat_id}:{topic_id}: {e}")
+                return False
+        await redis.hset(key, "hash", digest)
+        return True
+
+    async def _flush(self, scopes: list) -> None:
+        chat_id, topic_id = scopes[0]
+        await self.refresh(chat_id, topic_id)
+
+    async def on_changes(self, changes) -> None:
+        """Подписчик task_changes: топики, где задача была или стала, — в отложенную перерисовку"""
+        for change in changes:
+            for s in change.scopes():
+                if s.chat_id:
+                    self._buffer.add((s.chat_id, s.topic_id))
+
+    async def drain(self) -> None:
+        await self._buffer.drain()
@@ -0,0 +1,75 @@
+"""
+Склейка всплесков событий по ключу: CoalescingBuffer копит элементы в памяти
+процесса и после тишины window секунд по ключу отдаёт их одной пачкой в flush().
+При непрерывном потоке тишины может не быть — max_delay (секунд от первого
+элемента) и max_items ограничивают, сколько пачка может копиться.
+
+Используется для альбомов (services.media), серий правок одного сообщения
+(services.edits), вступлений/выходов в группе (services.membership) и
+уведомлений task_changed (services.task_changes): вместо записи на каждое
+событие — одна запись на всплеск.
+"""
+from __future__ import annotations
+
+import asyncio
+
+
+class CoalescingBuffer:
+    """
+    flush(items) вызывается один раз на ключ после window секунд без новых элементов,
+    но не позже max_delay от первого элемента и сразу по набору max_items
+    """
+
+    def __init__(self, flush, window: float, key,
+                 max_delay: float | None = None, max_items: int | None = None):
+        self._flush = flush
+        self._key = key
+        self.window = window
+        self.max_delay = max_delay
+        self.max_items = max_items
+        # ключ -> [время последнего, элементы в порядке прихода,
+        #         время первого, Event «пачка полна» (max_items)]
+        self._groups: dict = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._groups)
+
+    def add(self, item) -> None:
+        key = self._key(item)
+        now = asyncio.get_running_loop().time()
+        group = self._groups.get(key)
+        if group is not None:
+            group[0] = now
+            group[1].append(item)
+            if self.max_items and len(group[1]) >= self.max_items:
+                group[3].set()
+            return
+        self._groups[key] = [now, [item], now, asyncio.Event()]
+        task = asyncio.create_task(self._flush_later(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_later(self, key) -> None:
+        loop = asyncio.get_running_loop()
+        group = self._groups[key]
+        while not group[3].is_set():
+            deadline = group[0] + self.window
+            if self.max_delay is not None:
+                deadline = min(deadline, group[2] + self.max_delay)
+            delay = deadline - loop.time()
+            if delay <= 0:
+                break
+            try:
+                await asyncio.wait_for(group[3].wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        self._groups.pop(key)
+        try:
+            await self._flush(group[1])
+        except Exception as e:
+            print(f"COALESCE_FLUSH_WARN key={key}: {e}")
+
+    async def drain(self) -> None:
+        """Дождаться сброса всех незакрытых групп (остановка бота; не дольше window)"""
+        await asyncio.gather(*self._tasks, return_exceptions=True)
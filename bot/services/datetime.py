@@ -1,25 +1,382 @@
-from datetime import datetime, time, timedelta
+"""
+Парсер дедлайнов на естественном русском языке.
+
+Поддерживаемые формы (с предлогами в/во/к/до/на или без):
+  "завтра", "послезавтра", "сегодня вечером", "в пятницу", "к пт",
+  "15 марта", "15 марта 2026", "15.03", "15.03.2026", "2025-02-01",
+  "через 2 дня", "через неделю", "через 3 часа", "через полчаса",
+  "18:00", "в 10 утра", "в 7 вечера", "завтра в 10:30", "в 10:30 завтра".
+
+В свободном тексте (find_deadline) — строже, чтобы не резать заголовки:
+  - "15.03" без года — дата только после предлога ("до 15.03") и с двузначным
+    днём или месяцем с нулём: "до 3.11", "1.5 раз" — версии и числа, не даты;
+  - "в 3" без "утра/вечера/часов" и без минут — не время;
+  - "в понедельник" без времени — только в начале или в конце текста
+    ("обсудили в понедельник баг" — не дедлайн).
+parse_deadline (вся строка — дедлайн) принимает и "5.3", и "пятницу" где угодно.
+
+Устройство:
+  1) регулярка-токенизатор режет текст на токены (компилируется один раз);
+  2) каждый токен отображается в один символ грамматики (лексикон — словарь);
+  3) грамматика — скомпилированная регулярка над строкой символов, поэтому
+     все кандидаты находятся за один проход finditer, берётся самый длинный;
+  4) результат разбора (не зависящий от текущего времени) кэшируется LRU,
+     а привязка к "сейчас" делается дёшево на каждый вызов.
+"""
+import calendar
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import NamedTuple
 from zoneinfo import ZoneInfo
 
-def parse_deadline(args: str, tz_name: str) -> datetime | None:
-    tz = ZoneInfo(tz_name)
-    now = datetime.now(tz)
-    a = args.strip()
-    # Форматы: "YYYY-MM-DD HH:MM" | "YYYY-MM-DD" | "HH:MM"
-    for fmt in ("%Y-%m-%d %H:%M", "%Y-%m-%d"):
-        try:
-            dt = datetime.strptime(a, fmt).replace(tzinfo=tz)
-            if fmt == "%Y-%m-%d":
-                dt = dt.replace(hour=23, minute=59)
-            return dt
-        except ValueError:
-            pass
-    # только время HH:MM → сегодня, если прошло — завтра
+DEFAULT_TIME = (23, 59)  # дата без времени → конец дня
+
+# === Лексикон ===========================================================
+# символ грамматики: (значение, ...)
+#   v/k/z — предлоги (в, к/до, на); r — относительный день; w — день недели;
+#   m — месяц; a — часть суток после числа; e — часть суток наречием;
+#   c — "через"; u — единица смещения; h — час(ы); q — "полчаса"
+#   d — дата с годом; b/p — дата без года: "15.03", "5.03" / "3.11", "1.5"
+_WEEKDAYS = [
+    ("понедельник", "понедельника", "понедельнику", "пн"),
+    ("вторник", "вторника", "вторнику", "вт"),
+    ("среда", "среду", "среды", "среде", "ср"),
+    ("четверг", "четверга", "четвергу", "чт"),
+    ("пятница", "пятницу", "пятницы", "пятнице", "пт"),
+    ("суббота", "субботу", "субботы", "субботе", "сб"),
+    ("воскресенье", "воскресенья", "воскресенью", "вс"),
+]
+_MONTHS = [
+    ("январь", "января", "янв"),
+    ("февраль", "февраля", "фев"),
+    ("март", "марта", "мар"),
+    ("апрель", "апреля", "апр"),
+    ("май", "мая"),
+    ("июнь", "июня", "июн"),
+    ("июль", "июля", "июл"),
+    ("август", "августа", "авг"),
+    ("сентябрь", "сентября", "сен", "сент"),
+    ("октябрь", "октября", "окт"),
+    ("ноябрь", "ноября", "ноя"),
+    ("декабрь", "декабря", "дек"),
+]
+_NUMBER_WORDS = {
+    "один": 1, "одну": 1, "одна": 1, "два": 2, "две": 2, "три": 3,
+    "четыре": 4, "пять": 5, "шесть": 6, "семь": 7, "восемь": 8,
+    "девять": 9, "десять": 10,
+}
+
+
+def _build_lexicon() -> dict[str, tuple[str, object]]:
+    lex: dict[str, tuple[str, object]] = {}
+    for w in ("в", "во"):
+        lex[w] = ("v", None)
+    for w in ("к", "ко", "до"):
+        lex[w] = ("k", None)
+    lex["на"] = ("z", None)
+    lex["сегодня"] = ("r", 0)
+    lex["завтра"] = ("r", 1)
+    lex["послезавтра"] = ("r", 2)
+    for idx, forms in enumerate(_WEEKDAYS):
+        for f in forms:
+            lex[f] = ("w", idx)
+    for idx, forms in enumerate(_MONTHS, start=1):
+        for f in forms:
+            lex[f] = ("m", idx)
+    for w, part in (("утра", "am"), ("дня", "day"), ("вечера", "pm"), ("ночи", "night")):
+        lex[w] = ("a", part)
+    for w, hh in (("утром", 9), ("днем", 13), ("вечером", 19), ("ночью", 23)):
+        lex[w] = ("e", hh)
+    lex["через"] = ("c", None)
+    for w in ("день", "дней", "сутки", "суток"):
+        lex[w] = ("u", ("days", 1))
+    for w in ("неделю", "недели", "недель", "неделя"):
+        lex[w] = ("u", ("days", 7))
+    for w in ("месяц", "месяца", "месяцев"):
+        lex[w] = ("u", ("months", 1))
+    for w in ("минуту", "минуты", "минут", "мин"):
+        lex[w] = ("u", ("minutes", 1))
+    for w in ("час", "часа", "часов"):
+        lex[w] = ("h", ("minutes", 60))
+    lex["полчаса"] = ("q", ("minutes", 30))
+    for w, n in _NUMBER_WORDS.items():
+        lex[w] = ("n", n)
+    return lex
+
+
+_LEXICON = _build_lexicon()
+
+# === Токенизатор ========================================================
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<iso>\d{4}-\d{1,2}-\d{1,2})
+  | (?P<dmy>\d{1,2}[./]\d{1,2}(?:[./]\d{2,4})?)
+  | (?P<time>\d{1,2}:\d{2})
+  | (?P<num>\d+)
+  | (?P<word>[^\W\d_]+)
+    """,
+    re.VERBOSE,
+)
+
+# === Грамматика над строкой символов ====================================
+# "в 10" — время только с "утра/вечера/часов": "встреча в 3" — не дедлайн
+_TIME = r"(?:[vkz]?ta?|[vk]n[ah]|e)"
+_OFFSET = r"(?:[vkz]?c(?:n?[uha]|q))"
+
+
+def _grammar(date_sym: str) -> re.Pattern:
+    return re.compile(rf"{date_sym}{_TIME}?|{_TIME}{date_sym}?|{_OFFSET}{_TIME}?")
+
+
+# свободный текст: дата без года — только с предлогом и в виде "15.03"/"5.03"
+_GRAMMAR = _grammar(r"(?:[vkz]?(?:r|w|nmy?|d)|[vkz]b)")
+# вся строка — дедлайн: "15.03" и "5.3" без предлога
+_GRAMMAR_WHOLE = _grammar(r"(?:[vkz]?(?:r|w|nmy?|d|b|p))")
+
+
+class _Tok(NamedTuple):
+    sym: str
+    val: object
+    start: int
+    end: int
+
+
+class DeadlineMatch(NamedTuple):
+    deadline: datetime
+    start: int
+    end: int
+
+
+def _tokenize(text: str) -> list[_Tok]:
+    toks = []
+    for m in _TOKEN_RE.finditer(text):
+        kind = m.lastgroup
+        raw = m.group()
+        if kind == "iso":
+            y, mo, d = map(int, raw.split("-"))
+            toks.append(_Tok("d", ("ymd", y, mo, d), m.start(), m.end()))
+        elif kind == "dmy":
+            parts = [int(p) for p in re.split(r"[./]", raw)]
+            if len(parts) == 3:
+                year = parts[2] + 2000 if parts[2] < 100 else parts[2]
+                toks.append(_Tok("d", ("dm", parts[0], parts[1], year), m.start(), m.end()))
+            else:
+                day, month = re.split(r"[./]", raw)
+                padded = (len(day) == 2 and len(month) == 2) or month.startswith("0")
+                toks.append(_Tok("b" if padded else "p", ("dm", parts[0], parts[1], None), m.start(), m.end()))
+        elif kind == "time":
+            hh, mm = map(int, raw.split(":"))
+            toks.append(_Tok("t", (hh, mm), m.start(), m.end()))
+        elif kind == "num":
+            if len(raw) <= 2:
+                toks.append(_Tok("n", int(raw), m.start(), m.end()))
+            elif len(raw) == 4:
+                toks.append(_Tok("y", int(raw), m.start(), m.end()))
+            else:
+                toks.append(_Tok("x", None, m.start(), m.end()))
+        else:
+            sym, val = _LEXICON.get(raw.lower().replace("ё", "е"), ("x", None))
+            toks.append(_Tok(sym, val, m.start(), m.end()))
+    return toks
+
+
+def _apply_daypart(hh: int, part: str) -> int:
+    if part in ("day", "pm") and hh < 12:
+        return hh + 12
+    if part in ("am", "night") and hh == 12:
+        return 0
+    return hh
+
+
+def _valid_day(y: int, mo: int, d: int) -> bool:
     try:
-        hh, mm = map(int, a.split(":"))
+        date(y, mo, d)
+        return True
+    except ValueError:
+        return False
+
+
+def _interpret(toks: list[_Tok]):
+    """Превращает токены совпадения в (date_part, time_part) или None, если значение невалидно"""
+    date_part = None
+    time_part = None
+    i, n = 0, len(toks)
+    while i < n:
+        t = toks[i]
+        if t.sym in "vkz":
+            pass
+        elif t.sym == "r":
+            date_part = ("rel", t.val)
+        elif t.sym == "w":
+            date_part = ("wd", t.val)
+        elif t.sym in "dbp":
+            date_part = t.val
+        elif t.sym == "n" and i + 1 < n and toks[i + 1].sym == "m":
+            year = toks[i + 2].val if i + 2 < n and toks[i + 2].sym == "y" else None
+            date_part = ("dm", t.val, toks[i + 1].val, year)
+            i += 2 if year is None else 3
+            continue
+        elif t.sym == "c":
+            amount, j = 1, i + 1
+            if toks[j].sym == "n":
+                amount, j = toks[j].val, j + 1
+            unit_tok = toks[j]
+            if unit_tok.sym == "a":
+                if unit_tok.val != "day":  # "через 2 дня", но не "через 2 вечера"
+                    return None
+                unit, mult = "days", 1
+            else:
+                unit, mult = unit_tok.val
+            date_part = ("off", unit, amount * mult)
+            i = j + 1
+            continue
+        elif t.sym == "t":
+            hh, mm = t.val
+            if i + 1 < n and toks[i + 1].sym == "a":
+                hh = _apply_daypart(hh, toks[i + 1].val)
+                i += 1
+            time_part = (hh, mm)
+        elif t.sym == "n":
+            hh = t.val
+            if i + 1 < n and toks[i + 1].sym == "a":
+                if hh > 12:
+                    return None
+                hh = _apply_daypart(hh, toks[i + 1].val)
+                i += 1
+            elif i + 1 < n and toks[i + 1].sym == "h":
+                i += 1
+            time_part = (hh, 0)
+        elif t.sym == "e":
+            time_part = (t.val, 0)
+        i += 1
+
+    if time_part is not None:
+        hh, mm = time_part
+        if not (0 <= hh < 24 and 0 <= mm < 60):
+            return None
+    if date_part is not None:
+        kind = date_part[0]
+        if kind == "ymd" and not _valid_day(date_part[1], date_part[2], date_part[3]):
+            return None
+        # без года проверяем по високосному 2000, чтобы 29.02 был допустим
+        if kind == "dm" and not _valid_day(date_part[3] or 2000, date_part[2], date_part[1]):
+            return None
+        if kind == "off" and date_part[2] <= 0:
+            return None
+    return date_part, time_part
+
+
+def _weak_weekday(symbols: str) -> bool:
+    """"в понедельник" / "понедельник" без времени — в середине текста скорее рассказ о прошлом"""
+    return symbols in ("w", "vw")
+
+
+def _weak_daypart(symbols: str) -> bool:
+    """"утром" / "ночью" без даты и времени — обычное слово ("с днем рождения", "падает ночью")"""
+    return symbols == "e"
+
+
+@lru_cache(maxsize=2048)
+def _scan(text: str, whole: bool = False):
+    """
+    Один проход грамматики по тексту. Возвращает (start, end, spec) самого длинного
+    валидного совпадения или None. Не зависит от текущего времени — поэтому кэшируется.
+    """
+    toks = _tokenize(text)
+    if not toks:
+        return None
+    symbols = "".join(t.sym for t in toks)
+    best = None
+    for m in (_GRAMMAR_WHOLE if whole else _GRAMMAR).finditer(symbols):
+        if m.end() == m.start():
+            continue
+        if (not whole and _weak_weekday(m.group())
+                and m.start() > 0 and m.end() < len(symbols)):
+            continue
+        if not whole and _weak_daypart(m.group()):
+            continue
+        span_toks = toks[m.start():m.end()]
+        spec = _interpret(span_toks)
+        if spec is None:
+            continue
+        start, end = span_toks[0].start, span_toks[-1].end
+        # при равной длине предпочитаем более позднее — дедлайн обычно в конце
+        if best is None or end - start >= best[1] - best[0]:
+            best = (start, end, spec)
+    return best
+
+
+def _add_months(d: date, months: int) -> date:
+    total = d.month - 1 + months
+    y, mo = d.year + total // 12, total % 12 + 1
+    return date(y, mo, min(d.day, calendar.monthrange(y, mo)[1]))
+
+
+def _resolve(spec, now: datetime) -> datetime:
+    date_part, time_part = spec
+    tz = now.tzinfo
+    today = now.date()
+
+    if date_part is not None and date_part[0] == "off" and date_part[1] == "minutes":
+        return (now + timedelta(minutes=date_part[2])).replace(second=0, microsecond=0)
+
+    if date_part is None:
+        hh, mm = time_part
         candidate = now.replace(hour=hh, minute=mm, second=0, microsecond=0)
         if candidate <= now:
             candidate += timedelta(days=1)
         return candidate
-    except Exception:
-        return None
\ No newline at end of file
+
+    kind = date_part[0]
+    if kind == "rel":
+        day = today + timedelta(days=date_part[1])
+    elif kind == "wd":
+        day = today + timedelta(days=(date_part[1] - today.weekday()) % 7)
+    elif kind == "ymd":
+        day = date(date_part[1], date_part[2], date_part[3])
+    elif kind == "dm":
+        d, mo, y = date_part[1], date_part[2], date_part[3]
+        if y is not None:
+            day = date(y, mo, d)
+        else:
+            y = today.year
+            while not _valid_day(y, mo, d) or date(y, mo, d) < today:
+                y += 1
+            day = date(y, mo, d)
+    elif date_part[1] == "months":
+        day = _add_months(today, date_part[2])
+    else:
+        day = today + timedelta(days=date_part[2])
+
+    hh, mm = time_part or DEFAULT_TIME
+    return datetime.combine(day, time(hh, mm), tzinfo=tz)
+
+
+def find_deadline(text: str, tz_name: str, now: datetime | None = None,
+                  whole: bool = False) -> DeadlineMatch | None:
+    """Находит самый длинный дедлайн в произвольном месте текста (whole — вся строка и есть дедлайн)"""
+    if not text:
+        return None
+    found = _scan(text, whole)
+    if found is None:
+        return None
+    start, end, spec = found
+    if now is None:
+        now = datetime.now(ZoneInfo(tz_name))
+    return DeadlineMatch(_resolve(spec, now), start, end)
+
+
+def strip_deadline(text: str, match: DeadlineMatch) -> str:
+    """Текст без найденного фрагмента дедлайна"""
+    rest = f"{text[:match.start]} {text[match.end:]}"
+    return " ".join(rest.split()).strip(" ,.;—-")
+
+
+def parse_deadline(args: str, tz_name: str, now: datetime | None = None) -> datetime | None:
+    """Разбирает строку, целиком являющуюся дедлайном"""
+    a = (args or "").strip()
+    m = find_deadline(a, tz_name, now, whole=True)
+    if m is None or m.start != 0 or a[m.end:].strip(" .,!;"):
+        return None
+    return m.deadline
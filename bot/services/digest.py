@@ -0,0 +1,167 @@
+"""
+Утренний дайджест: одно сообщение на чат/топик со списком просроченных задач и
+задач со сроком сегодня — вместо пинга по каждой задаче.
+
+Все дайджесты считаются одним сгруппированным запросом SQL_DIGEST по индексу
+(status, deadline): агрегаты и первые DIGEST_MAX_ITEMS задач на каждую пару
+(source_chat_id, source_topic_id), группы в shadow-режиме отфильтрованы там же.
+Отправка идёт с общим темпом DIGEST_RATE сообщений в секунду и не чаще одного
+сообщения в DIGEST_CHAT_INTERVAL секунд в один чат (лимиты Telegram), запросы
+перекрываются по сети — сотни чатов укладываются в секунды.
+
+Запуск раз в сутки в DIGEST_HOUR по TIMEZONE; ключ digest:YYYYMMDD в Redis
+(SET NX) не даёт отправить дайджест дважды — при перезапуске или двух процессах.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import html
+import json
+import os
+from zoneinfo import ZoneInfo
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from services.reminders import OPEN_STATUSES
+
+DIGEST_HOUR = int(os.getenv("DIGEST_HOUR", "9"))  # < 0 — дайджест выключен
+DIGEST_MAX_ITEMS = int(os.getenv("DIGEST_MAX_ITEMS", "30"))
+DIGEST_RATE = float(os.getenv("DIGEST_RATE", "20"))
+DIGEST_CHAT_INTERVAL = float(os.getenv("DIGEST_CHAT_INTERVAL", "3"))
+CATCHUP_SECONDS = 2 * 3600  # запуск позже DIGEST_HOUR (рестарт) ещё догоняет сегодняшний дайджест
+TITLE_MAX = 80
+
+SQL_DIGEST = """
+WITH due AS (
+    SELECT source_chat_id, source_topic_id,
+           count(*) FILTER (WHERE deadline < $2) AS overdue,
+           count(*) FILTER (WHERE deadline = $2) AS today,
+           (array_agg(
+               jsonb_build_object('id', id, 'title', title, 'deadline', deadline,
+                                  'who', responsible_username)
+               ORDER BY deadline, id
+           ))[1:$3] AS items
+    FROM core_task
+    WHERE status = ANY($1::varchar[]) AND deadline <= $2
+      AND source_chat_id IS NOT NULL
+    GROUP BY source_chat_id, source_topic_id
+)
+SELECT d.source_chat_id AS chat_id, d.source_topic_id AS topic_id, d.overdue, d.today, d.items
+FROM due d
+LEFT JOIN core_tggroup g ON g.telegram_id = d.source_chat_id
+LEFT JOIN core_groupprofile gp ON gp.id = g.profile_id
+WHERE NOT COALESCE(gp.shadow_mode, $4)
+ORDER BY d.source_chat_id, d.source_topic_id NULLS FIRST
+"""
+
+
+def render(row, today: datetime.date) -> str:
+    head = f"📋 Задачи на {today.strftime('%d.%m')}: просрочено {row['overdue']}, сегодня {row['today']}"
+    lines = [head]
+    for raw in row["items"] or []:
+        item = json.loads(raw) if isinstance(raw, str) else raw
+        deadline = datetime.date.fromisoformat(item["deadline"])
+        title = item["title"] if len(item["title"]) <= TITLE_MAX else item["title"][:TITLE_MAX - 1] + "…"
+        who = item.get("who")
+        who = f" — @{html.escape(who)}" if who and who != "unknown" else ""
+        if deadline < today:
+            lines.append(f"🔴 #{item['id']} «{html.escape(title)}»{who} (до {deadline.strftime('%d.%m')})")
+        else:
+            lines.append(f"🟡 #{item['id']} «{html.escape(title)}»{who}")
+    rest = row["overdue"] + row["today"] - len(row["items"] or [])
+    if rest > 0:
+        lines.append(f"…и ещё {rest}")
+    return "\n".join(lines)
+
+
+async def collect(conn, today: datetime.date, shadow_default: bool, limit: int = DIGEST_MAX_ITEMS) -> list:
+    """Строки дайджеста для всех чатов/топиков — один запрос"""
+    return await conn.fetch(SQL_DIGEST, list(OPEN_STATUSES), today, limit, shadow_default)
+
+
+class SendPacer:
+    """Темп отправки: общий (rate в секунду) и на чат (interval). Слоты резервируются сразу"""
+
+    def __init__(self, rate: float = DIGEST_RATE, chat_interval: float = DIGEST_CHAT_INTERVAL):
+        self._gap = 1.0 / rate
+        self._chat_interval = chat_interval
+        self._next = 0.0
+        self._chat_next: dict[int, float] = {}
+
+    def reserve(self, chat_id: int, now: float) -> float:
+        """Момент, когда можно отправить в chat_id"""
+        slot = max(now, self._next)
+        self._next = slot + self._gap
+        at = max(slot, self._chat_next.get(chat_id, 0.0))
+        self._chat_next[chat_id] = at + self._chat_interval
+        return at
+
+    async def wait(self, chat_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        delay = self.reserve(chat_id, loop.time()) - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def send_all(messages: list[tuple[int, int | None, str]], send, pacer: SendPacer | None = None) -> int:
+    """Отправляет [(chat, topic, text)] с темпом pacer; на RetryAfter — одна повторная попытка"""
+    pacer = pacer or SendPacer()
+
+    async def one(chat_id, topic_id, text) -> bool:
+        await pacer.wait(chat_id)
+        for attempt in (1, 2):
+            try:
+                await send(chat_id, topic_id, text)
+                return True
+            except TelegramRetryAfter as e:
+                if attempt == 2:
+                    print(f"DIGEST_SEND_WARN chat={chat_id}: {e}")
+                    return False
+                await asyncio.sleep(e.retry_after)
+            except Exception as e:
+                print(f"DIGEST_SEND_WARN chat={chat_id}: {e}")
+                return False
+
+    results = await asyncio.gather(*(one(*m) for m in messages))
+    return sum(results)
+
+
+async def run_digest(conn, send, tz: str, shadow_default: bool, pacer: SendPacer | None = None) -> int:
+    """Считает и рассылает дайджест на сегодня. Возвращает число отправленных"""
+    today = datetime.datetime.now(ZoneInfo(tz)).date()
+    rows = await collect(conn, today, shadow_default)
+    return await send_all([(r["chat_id"], r["topic_id"], render(r, today)) for r in rows], send, pacer)
+
+
+def next_run(now: datetime.datetime, hour: int = DIGEST_HOUR) -> datetime.datetime:
+    """Ближайший запуск: сегодня в hour (с догоном CATCHUP_SECONDS) или завтра"""
+    at = now.replace(hour=hour, minute=0, second=0, microsecond=0)
+    if now >= at + datetime.timedelta(seconds=CATCHUP_SECONDS):
+        at += datetime.timedelta(days=1)
+    return at
+
+
+async def digest_loop(get_redis, get_conn, send, tz: str, shadow_default: bool) -> None:
+    """Воркер: раз в сутки в DIGEST_HOUR; день «занимается» в Redis, чтобы не отправить дважды"""
+    if DIGEST_HOUR < 0:
+        return
+    zone = ZoneInfo(tz)
+    while True:
+        now = datetime.datetime.now(zone)
+        at = next_run(now)
+        await asyncio.sleep(max(0.0, (at - now).total_seconds()))
+        try:
+            key = f"digest:{at:%Y%m%d}"
+            if not await get_redis().set(key, 1, nx=True, ex=2 * 86400):
+                await asyncio.sleep(CATCHUP_SECONDS)  # уже отправлен — ждём выхода из окна догона
+                continue
+            conn = await get_conn()
+            try:
+                sent = await run_digest(conn, send, tz, shadow_default)
+            finally:
+                await conn.close()
+            print(f"DIGEST sent={sent} day={at:%Y-%m-%d}")
+        except Exception as e:
+            print(f"DIGEST_WARN: {e}")
+        await asyncio.sleep(CATCHUP_SECONDS)
@@ -0,0 +1,101 @@
+"""
+Правки сообщений: склейка серии правок и история версий.
+
+Серия правок одного сообщения (chat_id, message_id) копится EDIT_WINDOW секунд
+(services.coalesce) и применяется один раз — последней версией — одним
+SQL-выражением SQL_APPLY_EDIT:
+- текущая строка raw_updates блокируется (FOR UPDATE) и, если текст/вложения
+  изменились, прежняя версия дописывается в raw_update_versions (миграция 0012);
+- строка обновляется, а если её нет (бот перезапускался) — вставляется.
+
+Уникального ключа (chat_id, message_id) на raw_updates быть не может: у
+секционированной таблицы уникальный индекс обязан включать created_at. Поэтому
+вместо ON CONFLICT по raw_updates — CTE «найти-обновить-иначе вставить», а гонку
+двух правок одного сообщения исключает буфер (одна запись на ключ в процессе).
+ON CONFLICT работает на raw_update_versions: PK (chat_id, message_id, version).
+
+Правка подписи элемента альбома находит общую строку альбома по payload.album_ids.
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import os
+
+from services.coalesce import CoalescingBuffer
+from services.media import extract_media
+
+EDIT_WINDOW = float(os.getenv("EDIT_WINDOW_SECONDS", "2.0"))
+
+_MATCH_MESSAGE = "message_id = $2"
+_MATCH_ALBUM = "(message_id = $2 OR payload->'album_ids' @> to_jsonb($2::bigint))"
+
+SQL_APPLY_EDIT = """
+WITH cur AS (
+    SELECT id, created_at, message_id, text, media
+    FROM raw_updates
+    WHERE chat_id = $1 AND {match}
+      AND ($5::timestamptz IS NULL OR created_at >= $5)
+    ORDER BY created_at DESC
+    LIMIT 1
+    FOR UPDATE
+), ver AS (
+    INSERT INTO raw_update_versions (chat_id, message_id, version, text, media)
+    SELECT $1, cur.message_id,
+           COALESCE((SELECT max(v.version) FROM raw_update_versions v
+                     WHERE v.chat_id = $1 AND v.message_id = cur.message_id), 0) + 1,
+           cur.text, cur.media
+    FROM cur
+    WHERE cur.text IS DISTINCT FROM $3
+       OR ($6::jsonb IS NOT NULL AND cur.media IS DISTINCT FROM $6::jsonb)
+    ON CONFLICT (chat_id, message_id, version) DO NOTHING
+), upd AS (
+    UPDATE raw_updates r
+       SET text = $3,
+           topic_id = COALESCE($4, r.topic_id),
+           media = COALESCE($6::jsonb, r.media)
+      FROM cur
+     WHERE r.id = cur.id AND r.created_at = cur.created_at
+)
+INSERT INTO raw_updates (chat_id, message_id, user_id, text, topic_id, payload, media)
+SELECT $1, $2, $7, $3, $4, $8::jsonb, $6::jsonb
+WHERE NOT EXISTS (SELECT 1 FROM cur)
+"""
+
+
+def latest_edit(items: list):
+    """Последняя правка серии (по edit_date, при равенстве — последняя пришедшая)"""
+    return max(enumerate(items), key=lambda p: (p[1].edit_date or 0, p[0]))[1]
+
+
+def edit_args(msg) -> tuple:
+    """Аргументы SQL_APPLY_EDIT для правки msg"""
+    media = extract_media(msg)
+    # Граница по created_at отсекает лишние месячные секции (с запасом на расхождение часов)
+    sent_at = (msg.date - datetime.timedelta(hours=1)) if msg.date else None
+    return (
+        msg.chat.id,
+        msg.message_id,
+        (msg.text or msg.caption or "")[:4096],
+        getattr(msg, "message_thread_id", None),
+        sent_at,
+        # у элемента альбома не затираем вложения всего альбома
+        json.dumps(media, ensure_ascii=False) if media and not msg.media_group_id else None,
+        msg.from_user.id if msg.from_user else None,
+        json.dumps({"message_type": "text"}, ensure_ascii=False),
+    )
+
+
+async def apply_edit(conn, msg) -> str:
+    """Одно выражение: версия в историю + обновление (или вставка) строки журнала"""
+    match = _MATCH_ALBUM if msg.media_group_id else _MATCH_MESSAGE
+    return await conn.execute(SQL_APPLY_EDIT.format(match=match), *edit_args(msg))
+
+
+class EditBuffer(CoalescingBuffer):
+    """Серия правок одного сообщения -> flush(последняя правка)"""
+
+    def __init__(self, flush, window: float = EDIT_WINDOW):
+        async def flush_latest(items):
+            await flush(latest_edit(items))
+        super().__init__(flush_latest, window, key=lambda m: (m.chat.id, m.message_id))
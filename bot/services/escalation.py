@@ -0,0 +1,180 @@
+"""
+Эскалация задач по цепочке привязок топика (TopicBinding.priority).
+
+Задача из топика, которую не приняли (кнопка «Принял», acknowledged_at) и не
+сдвинули из TODO за ESCALATION_MINUTES, переходит к следующему по приоритету
+кандидату цепочки: пользователь привязки -> участник проекта с ролью ->
+лид/техлид/первый участник департамента. В топик уходит уведомление.
+
+Таймеры — в общем ZSET services.reminders (вид "esc", arg — уровень), так что
+тысячи открытых задач стоят одного ZSET и одного воркера. Уровень в member
+сверяется с core_task.escalation_level: UPDATE ... WHERE escalation_level = $prev
+не даст эскалировать дважды. Потерянные таймеры восстанавливает reconcile по
+частичному индексу idx_task_escalation_open (миграция 0013); задачи, созданные
+до включения эскалации, миграция отмечает принятыми. Если цепочка кончилась,
+escalation_level ставится в EXHAUSTED — reconcile такие задачи больше не берёт.
+"""
+from __future__ import annotations
+
+import html
+import os
+import time
+
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from services.reminders import ZSET_KEY, member
+from services.users import UserRow
+
+KIND = "esc"
+ESCALATION_SECONDS = float(os.getenv("ESCALATION_MINUTES", "120")) * 60
+EXHAUSTED = 32767  # escalation_level: цепочка пройдена (максимум smallint)
+
+# Цепочка кандидатов одним запросом: для каждой привязки — её пользователь
+SQL_CHAIN = """
+SELECT tb.priority, u.id, u.username, u.telegram_id
+FROM core_topicbinding tb
+JOIN core_forumtopic ft ON ft.id = tb.topic_id
+JOIN core_tggroup g ON g.id = ft.group_id
+CROSS JOIN LATERAL (
+    SELECT COALESCE(
+        tb.user_id,
+        (SELECT pm.user_id FROM core_projectmember pm
+         WHERE pm.project_id = g.project_id AND pm.role_id = tb.role_id
+         ORDER BY pm.id DESC LIMIT 1),
+        (SELECT dm.user_id FROM core_departmentmember dm
+         WHERE dm.department_id = tb.department_id
+         ORDER BY dm.is_lead DESC, dm.is_tech DESC, dm.order_index, dm.id LIMIT 1)
+    ) AS user_id
+) pick
+JOIN core_user u ON u.id = pick.user_id
+WHERE g.telegram_id = $1 AND ft.topic_id = $2
+ORDER BY tb.priority, tb.id
+"""
+
+SQL_TASKS = """
+SELECT id, title, status, acknowledged_at, escalation_level,
+       responsible_user_id, responsible_username, source_chat_id, source_topic_id
+FROM core_task
+WHERE id = ANY($1::bigint[])
+"""
+
+SQL_ESCALATE = """
+UPDATE core_task
+   SET responsible_user_id = $2, responsible_username = $3,
+       escalation_level = $4, updated_at = NOW()
+ WHERE id = $1 AND escalation_level = $4 - 1
+   AND status = 'TODO' AND acknowledged_at IS NULL
+RETURNING id
+"""
+
+SQL_EXHAUST = """
+UPDATE core_task SET escalation_level = $3
+ WHERE id = $1 AND escalation_level = $2 - 1
+   AND status = 'TODO' AND acknowledged_at IS NULL
+"""
+
+SQL_OPEN = """
+SELECT id, escalation_level, updated_at
+FROM core_task
+WHERE status = 'TODO' AND acknowledged_at IS NULL AND source_topic_id IS NOT NULL
+  AND escalation_level < $1
+"""
+
+SQL_ACK = """
+UPDATE core_task SET acknowledged_at = NOW(), updated_at = NOW()
+WHERE id = $1 AND acknowledged_at IS NULL
+RETURNING id
+"""
+
+
+def ack_keyboard(task_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="👍 Принял", callback_data=f"task:ack:{task_id}"),
+    ]])
+
+
+def _mention(username: str | None) -> str:
+    return f"@{html.escape(username)}" if username and username != "unknown" else "—"
+
+
+def initial_timers(rows, now: float | None = None) -> dict[str, float]:
+    """Первый уровень для новых задач из топиков (для reminders.schedule_tasks)"""
+    if ESCALATION_SECONDS <= 0:
+        return {}
+    now = time.time() if now is None else now
+    return {
+        member(r["id"], KIND, 1): now + ESCALATION_SECONDS
+        for r in rows if r["source_topic_id"] is not None and r["status"] == "TODO"
+    }
+
+
+async def resolve_chain(conn, chat_id: int, topic_id: int) -> list:
+    """Кандидаты по приоритету без повторов: [UserRow]"""
+    chain, seen = [], set()
+    for r in await conn.fetch(SQL_CHAIN, chat_id, topic_id):
+        if r["id"] not in seen:
+            seen.add(r["id"])
+            chain.append(UserRow(r["id"], r["username"] or "", r["telegram_id"]))
+    return chain
+
+
+def next_in_chain(chain: list, current_user_id: int | None):
+    """Следующий после текущего ответственного; если текущего в цепочке нет — первый"""
+    ids = [u.id for u in chain]
+    pos = ids.index(current_user_id) if current_user_id in ids else -1
+    return chain[pos + 1] if pos + 1 < len(chain) else None
+
+
+async def escalate(conn, entries: list, send) -> dict[str, float]:
+    """Обработчик таймеров "esc": [(task_id, уровень)] -> таймеры следующих уровней"""
+    if not entries:
+        return {}
+    rows = await conn.fetch(SQL_TASKS, sorted({t for t, _ in entries}))
+    tasks = {r["id"]: r for r in rows}
+    follow = {}
+    for task_id, arg in entries:
+        level = int(arg)
+        task = tasks.get(task_id)
+        if (task is None or task["status"] != "TODO" or task["acknowledged_at"] is not None
+                or task["escalation_level"] != level - 1 or task["source_topic_id"] is None):
+            continue  # приняли, сдвинули или уже эскалировали — таймер устарел
+        chain = await resolve_chain(conn, task["source_chat_id"], task["source_topic_id"])
+        target = next_in_chain(chain, task["responsible_user_id"])
+        if target is None:
+            print(f"ESCALATION task={task_id} level={level}: chain exhausted")
+            await conn.execute(SQL_EXHAUST, task_id, level, EXHAUSTED)
+            continue
+        # в responsible_username — только настоящий username, как при создании задачи
+        if not await conn.fetchval(SQL_ESCALATE, task_id, target.id, target.username or "unknown", level):
+            continue
+        who = _mention(target.username) if target.username else html.escape(target.display)
+        minutes = int(ESCALATION_SECONDS // 60)
+        text = (
+            f"⏫ Эскалация: #{task_id} «{html.escape(task['title'])}» не взята в работу за {minutes} мин.\n"
+            f"Ответственный: {who} (был {_mention(task['responsible_username'])})"
+        )
+        try:
+            await send(task["source_chat_id"], task["source_topic_id"], text, reply_markup=ack_keyboard(task_id))
+        except Exception as e:
+            print(f"ESCALATION_SEND_WARN task={task_id}: {e}")
+        follow[member(task_id, KIND, level + 1)] = time.time() + ESCALATION_SECONDS
+    return follow
+
+
+async def reconcile(conn, redis, tz: str) -> int:
+    """Таймер следующего уровня для каждой открытой задачи, если его нет (ZADD NX)"""
+    if ESCALATION_SECONDS <= 0:
+        return 0
+    now = time.time()
+    timers = {
+        member(r["id"], KIND, r["escalation_level"] + 1): max(now, r["updated_at"].timestamp() + ESCALATION_SECONDS)
+        for r in await conn.fetch(SQL_OPEN, EXHAUSTED)
+    }
+    if timers:
+        await redis.zadd(ZSET_KEY, timers, nx=True)
+    return len(timers)
+
+
+async def acknowledge(conn, task_id: int) -> bool:
+    """Отметка «принял» — останавливает эскалацию. False, если уже была"""
+    return bool(await conn.fetchval(SQL_ACK, task_id))
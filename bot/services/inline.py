@@ -0,0 +1,155 @@
+"""
+Inline-режим: @bot <текст> — поиск задач в проектах пользователя, чтобы вставить
+ссылку на задачу в любой чат.
+
+Запрос: "#123" — по id, "@user" — по ответственному, остальное — подстрока
+заголовка (lower(title) LIKE, GIN pg_trgm idx_task_title_trgm, миграция 0015);
+части можно сочетать. Пустой запрос — открытые задачи пользователя.
+
+Бюджет Telegram на ответ — секунды, поэтому:
+- область (core_user.id и проекты из core_projectmember) кэшируется в памяти
+  процесса на SCOPE_TTL — на запрос остаётся один SELECT с LIMIT;
+- запрос ограничен QUERY_TIMEOUT;
+- ответ отдаётся с is_personal и cache_time=INLINE_CACHE_SECONDS — повторы
+  того же текста Telegram отдаёт сам, не дёргая бота.
+"""
+from __future__ import annotations
+
+import html
+import os
+from dataclasses import dataclass
+
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+
+from services.state import TTLCache
+
+INLINE_LIMIT = 20
+INLINE_CACHE_SECONDS = int(os.getenv("INLINE_CACHE_SECONDS", "30"))
+SCOPE_TTL = 300
+QUERY_TIMEOUT = 2.0
+OPEN_STATUSES = ("TODO", "IN_PROGRESS", "ON_REVIEW")
+STATUS_LABELS = {
+    "TODO": "к выполнению", "IN_PROGRESS": "в работе", "ON_REVIEW": "на проверке",
+    "DONE": "выполнена", "ARCHIVED": "в архиве",
+}
+
+SQL_SCOPE = """
+SELECT u.id,
+       COALESCE(array_agg(DISTINCT pm.project_id) FILTER (WHERE pm.project_id IS NOT NULL), '{}') AS projects
+FROM core_user u
+LEFT JOIN core_projectmember pm ON pm.user_id = u.id
+WHERE u.telegram_id = $1
+GROUP BY u.id
+"""
+
+
+@dataclass(frozen=True, slots=True)
+class UserScope:
+    user_id: int | None
+    projects: tuple[int, ...]
+
+
+class ScopeCache:
+    """telegram_id -> UserScope; незарегистрированные тоже кэшируются (пустая область)"""
+
+    def __init__(self, ttl: float = SCOPE_TTL, max_items: int = 5000):
+        self.ttl = ttl
+        self._cache = TTLCache(max_items=max_items)
+
+    async def get(self, conn, telegram_id: int) -> UserScope:
+        scope = self._cache.get(telegram_id)
+        if scope is None:
+            row = await conn.fetchrow(SQL_SCOPE, telegram_id, timeout=QUERY_TIMEOUT)
+            scope = UserScope(row["id"], tuple(row["projects"])) if row else UserScope(None, ())
+            self._cache.set(telegram_id, scope, self.ttl)
+        return scope
+
+
+@dataclass(slots=True)
+class InlineQueryText:
+    task_id: int | None = None
+    username: str | None = None
+    words: str = ""
+
+
+def parse_query(text: str | None) -> InlineQueryText:
+    q = InlineQueryText()
+    words = []
+    for token in (text or "").split():
+        if token.startswith("#") and token[1:].isdigit():
+            q.task_id = int(token[1:])
+        elif token.startswith("@") and len(token) > 1:
+            q.username = token[1:].lower()
+        else:
+            words.append(token)
+    q.words = " ".join(words)[:100]
+    return q
+
+
+def _like_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def build_sql(scope: UserScope, q: InlineQueryText, offset: int = 0, limit: int = INLINE_LIMIT) -> tuple[str, list]:
+    """Запрос по области и фильтрам; условия только для заданных частей — чтобы план брал индекс"""
+    args: list = [list(scope.projects), scope.user_id]
+    where = ["(project_id = ANY($1::bigint[]) OR responsible_user_id = $2)"]
+    order = []
+    if q.task_id is not None:
+        args.append(q.task_id)
+        where.append(f"id = ${len(args)}")
+    if q.username:
+        args.append(_like_escape(q.username) + "%")
+        where.append(f"lower(responsible_username) LIKE ${len(args)}")
+    if q.words:
+        pattern = _like_escape(q.words.lower())
+        args.append(f"%{pattern}%")
+        where.append(f"lower(title) LIKE ${len(args)}")
+        args.append(f"{pattern}%")
+        order.append(f"(lower(title) LIKE ${len(args)}) DESC")  # совпадения с начала — выше
+    if q.task_id is None and not q.username and not q.words:
+        where.append("status = ANY($3::varchar[])")
+        args.append(list(OPEN_STATUSES))
+    args += [limit, offset]
+    order_sql = ", ".join(order + ["(status IN ('TODO', 'IN_PROGRESS', 'ON_REVIEW')) DESC", "id DESC"])
+    sql = (
+        "SELECT id, title, status, deadline, responsible_username FROM core_task"
+        f" WHERE {' AND '.join(where)} ORDER BY {order_sql} LIMIT ${len(args) - 1} OFFSET ${len(args)}"
+    )
+    return sql, args
+
+
+def task_reference(row) -> str:
+    who = row["responsible_username"]
+    who = f" — @{html.escape(who)}" if who and who != "unknown" else ""
+    status = STATUS_LABELS.get(row["status"], row["status"])
+    return f"#{row['id']} «{html.escape(row['title'])}»{who} ({status})"
+
+
+def to_results(rows) -> list[InlineQueryResultArticle]:
+    results = []
+    for r in rows:
+        details = [STATUS_LABELS.get(r["status"], r["status"])]
+        if r["responsible_username"] and r["responsible_username"] != "unknown":
+            details.append(f"@{r['responsible_username']}")
+        if r["deadline"]:
+            details.append(f"до {r['deadline'].strftime('%d.%m.%Y')}")
+        results.append(InlineQueryResultArticle(
+            id=str(r["id"]),
+            title=f"#{r['id']} {r['title']}"[:256],
+            description=" · ".join(details),
+            input_message_content=InputTextMessageContent(message_text=task_reference(r)),
+        ))
+    return results
+
+
+async def search_tasks(conn, scopes: ScopeCache, telegram_id: int, text: str | None,
+                       offset: int = 0) -> tuple[list, str]:
+    """(результаты, next_offset) для inline-ответа; вне проектов — пусто"""
+    scope = await scopes.get(conn, telegram_id)
+    if scope.user_id is None:
+        return [], ""
+    sql, args = build_sql(scope, parse_query(text), offset)
+    rows = await conn.fetch(sql, *args, timeout=QUERY_TIMEOUT)
+    next_offset = str(offset + len(rows)) if len(rows) == INLINE_LIMIT else ""
+    return to_results(rows), next_offset
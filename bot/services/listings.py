@@ -0,0 +1,192 @@
+"""
+Списки задач в Telegram: /mytasks и /tasks [@user|статус] постранично.
+
+Запросы опираются на составные индексы миграции 0014 — (responsible_user_id,
+status, deadline), (project_id, status, deadline), (source_chat_id, status,
+deadline): фильтр по области и статусу, порядок по дедлайну без сортировки.
+
+Готовые страницы (текст + есть ли следующая) лежат в Redis под ключом с
+версией области: tasks:page:<область>:<версия>:<фильтр>:<страница>. Изменение
+задачи (services.task_changes, триггер в БД) делает INCR версии всех затронутых
+областей — до и после изменения, — и старые страницы больше не читаются,
+а доживают TTL. Области: tg:<telegram_id> и name:<username> ответственного,
+chat:<id>, project:<id>.
+"""
+from __future__ import annotations
+
+import hashlib
+import html
+import json
+import os
+from dataclasses import asdict, dataclass, field
+
+PAGE_SIZE = 10
+CACHE_TTL = int(os.getenv("TASK_LIST_CACHE_TTL", "300"))
+VERSION_TTL = 7 * 86400
+TITLE_MAX = 60
+
+STATUSES = ("TODO", "IN_PROGRESS", "ON_REVIEW", "DONE", "ARCHIVED")
+OPEN_STATUSES = ("TODO", "IN_PROGRESS", "ON_REVIEW")
+STATUS_ALIASES = {
+    "open": OPEN_STATUSES, "all": STATUSES,
+    "todo": ("TODO",), "progress": ("IN_PROGRESS",), "in_progress": ("IN_PROGRESS",),
+    "review": ("ON_REVIEW",), "on_review": ("ON_REVIEW",),
+    "done": ("DONE",), "archived": ("ARCHIVED",),
+}
+STATUS_ICONS = {"TODO": "⚪", "IN_PROGRESS": "🔵", "ON_REVIEW": "🟣", "DONE": "✅", "ARCHIVED": "📦"}
+
+_COLUMNS = "SELECT id, title, status, deadline, responsible_username FROM core_task"
+_ORDER = "ORDER BY deadline ASC NULLS LAST, id DESC"
+
+
+@dataclass(slots=True)
+class TaskQuery:
+    """Что показать: kind — my | chat | project, scope_id — telegram_id / chat_id / project_id"""
+    kind: str
+    scope_id: int
+    statuses: list[str] = field(default_factory=lambda: list(OPEN_STATUSES))
+    username: str | None = None  # my: свой username; chat/project: фильтр по @user
+    user_id: int | None = None   # chat/project: core_user.id фильтра @user
+
+    def scopes(self) -> list[str]:
+        if self.kind == "my":
+            out = [f"tg:{self.scope_id}"]
+            if self.username:
+                out.append(f"name:{self.username.lower()}")
+            return out
+        return [f"{self.kind}:{self.scope_id}"]
+
+    def filter_key(self) -> str:
+        raw = f"{','.join(self.statuses)}|{self.username or ''}|{self.user_id or ''}"
+        return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+    def to_state(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_state(cls, data: dict) -> TaskQuery:
+        return cls(**data)
+
+
+@dataclass(slots=True)
+class ListingPage:
+    text: str
+    page: int
+    has_next: bool
+
+
+def parse_filter(args: str | None) -> tuple[list[str], str | None] | None:
+    """'@user review' -> (статусы, username); None — неизвестный аргумент"""
+    statuses, username = list(OPEN_STATUSES), None
+    for token in (args or "").split():
+        if token.startswith("@") and len(token) > 1:
+            username = token[1:]
+        elif token.lower() in STATUS_ALIASES:
+            statuses = list(STATUS_ALIASES[token.lower()])
+        elif token.upper() in STATUSES:
+            statuses = [token.upper()]
+        else:
+            return None
+    return statuses, username
+
+
+def build_sql(q: TaskQuery, page: int, page_size: int = PAGE_SIZE) -> tuple[str, list]:
+    args: list = [q.statuses]
+    where = ["status = ANY($1::varchar[])"]
+    if q.kind == "my":
+        args += [q.scope_id, q.username]
+        where.append(
+            "(responsible_user_id = (SELECT id FROM core_user WHERE telegram_id = $2)"
+            " OR (responsible_user_id IS NULL AND lower(responsible_username) = lower($3)))"
+        )
+    else:
+        column = "project_id" if q.kind == "project" else "source_chat_id"
+        args.append(q.scope_id)
+        where.append(f"{column} = $2")
+        if q.user_id is not None:
+            args.append(q.user_id)
+            where.append(f"responsible_user_id = ${len(args)}")
+        elif q.username:
+            args.append(q.username)
+            where.append(f"lower(responsible_username) = lower(${len(args)})")
+    args += [page_size + 1, page * page_size]
+    sql = f"{_COLUMNS} WHERE {' AND '.join(where)} {_ORDER} LIMIT ${len(args) - 1} OFFSET ${len(args)}"
+    return sql, args
+
+
+def render(title: str, rows: list, page: int, page_size: int = PAGE_SIZE) -> str:
+    if not rows and page == 0:
+        return f"{title}\n\nЗадач нет"
+    lines = [f"{title} — стр. {page + 1}", ""]
+    for r in rows:
+        name = r["title"] if len(r["title"]) <= TITLE_MAX else r["title"][:TITLE_MAX - 1] + "…"
+        line = f"{STATUS_ICONS.get(r['status'], '•')} #{r['id']} «{html.escape(name)}»"
+        who = r["responsible_username"]
+        if who and who != "unknown":
+            line += f" — @{html.escape(who)}"
+        if r["deadline"]:
+            line += f" · до {r['deadline'].strftime('%d.%m')}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def page_key(q: TaskQuery, versions: list, page: int) -> str:
+    ver = ".".join((v.decode() if isinstance(v, bytes) else str(v)) if v else "0" for v in versions)
+    return f"tasks:page:{q.kind}:{q.scope_id}:{ver}:{q.filter_key()}:{page}"
+
+
+async def get_page(redis, get_conn, q: TaskQuery, title: str, page: int = 0) -> ListingPage:
+    """Страница из кэша; промах — запрос по индексу и запись в кэш. Ошибки Redis = промах"""
+    key = None
+    try:
+        versions = await redis.mget([f"tasks:ver:{s}" for s in q.scopes()])
+        key = page_key(q, versions, page)
+        cached = await redis.get(key)
+        if cached:
+            data = json.loads(cached)
+            return ListingPage(data["text"], page, data["has_next"])
+    except Exception as e:
+        print(f"TASK_LIST_CACHE_WARN: {e}")
+    sql, args = build_sql(q, page)
+    conn = await get_conn()
+    try:
+        rows = await conn.fetch(sql, *args)
+    finally:
+        await conn.close()
+    result = ListingPage(render(title, rows[:PAGE_SIZE], page), page, len(rows) > PAGE_SIZE)
+    if key is not None:
+        try:
+            await redis.set(key, json.dumps({"text": result.text, "has_next": result.has_next},
+                                            ensure_ascii=False), ex=CACHE_TTL)
+        except Exception as e:
+            print(f"TASK_LIST_CACHE_WARN: {e}")
+    return result
+
+
+def change_scopes(changes) -> set[str]:
+    """Области, затронутые пачкой изменений (services.task_changes.TaskChange)"""
+    out = set()
+    for change in changes:
+        for s in change.scopes():
+            if s.user_tg:
+                out.add(f"tg:{s.user_tg}")
+            if s.username:
+                out.add(f"name:{s.username.lower()}")
+            if s.chat_id:
+                out.add(f"chat:{s.chat_id}")
+            if s.project_id:
+                out.add(f"project:{s.project_id}")
+    return out
+
+
+async def invalidate(redis, changes) -> int:
+    """Подписчик task_changes: INCR версий затронутых областей одним пайплайном"""
+    scopes = change_scopes(changes)
+    if not scopes:
+        return 0
+    async with redis.pipeline(transaction=False) as pipe:
+        for s in scopes:
+            pipe.incr(f"tasks:ver:{s}")
+            pipe.expire(f"tasks:ver:{s}", VERSION_TTL)
+        await pipe.execute()
+    return len(scopes)
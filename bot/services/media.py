@@ -0,0 +1,70 @@
+"""
+Медиа во входящих сообщениях: компактные метаданные и склейка альбомов.
+
+extract_media() -> список dict для raw_updates.media (миграция 0011): тип,
+file_unique_id (стабилен между ботами и перезапусками), file_id (чтобы переслать),
+размер, mime, габариты/длительность — только то, что есть у вложения.
+
+Альбом (media_group_id) приходит отдельными сообщениями с разницей в доли секунды.
+AlbumBuffer (services.coalesce) копит их и после тишины ALBUM_WINDOW секунд
+отдаёт одной пачкой — в журнал пишется одна логическая строка вместо десяти.
+"""
+from __future__ import annotations
+
+import os
+from collections import Counter
+
+from services.coalesce import CoalescingBuffer
+
+ALBUM_WINDOW = float(os.getenv("ALBUM_WINDOW_SECONDS", "1.0"))
+
+# Порядок важен: у animation Telegram дублирует вложение в document
+MEDIA_TYPES = ("photo", "animation", "video", "document", "audio", "voice", "video_note", "sticker")
+
+MEDIA_LABELS = {
+    "photo": "📷 фото", "animation": "🎞 GIF", "video": "🎬 видео", "document": "📄 документ",
+    "audio": "🎵 аудио", "voice": "🎤 голосовое", "video_note": "⏺ кружок", "sticker": "🏷 стикер",
+}
+
+_FIELDS = (
+    ("file_size", "size"), ("mime_type", "mime"), ("file_name", "name"),
+    ("width", "w"), ("height", "h"), ("duration", "duration"), ("emoji", "emoji"),
+)
+
+
+def _describe(kind: str, obj) -> dict:
+    item = {"type": kind, "file_unique_id": obj.file_unique_id, "file_id": obj.file_id}
+    for attr, key in _FIELDS:
+        value = getattr(obj, attr, None)
+        if value is not None:
+            item[key] = value
+    return item
+
+
+def extract_media(msg) -> list[dict]:
+    """Вложение сообщения (для фото — самый крупный размер); [] если его нет"""
+    for kind in MEDIA_TYPES:
+        obj = getattr(msg, kind, None)
+        if not obj:
+            continue
+        if kind == "photo":
+            obj = max(obj, key=lambda p: (p.width or 0) * (p.height or 0))
+        return [_describe(kind, obj)]
+    return []
+
+
+def media_summary(media: list[dict] | None) -> str:
+    """'📷 фото ×3, 📄 документ' — подпись для списков, где нет текста"""
+    counts = Counter(m.get("type") for m in media or [])
+    return ", ".join(
+        MEDIA_LABELS.get(kind, kind) + (f" ×{n}" if n > 1 else "") for kind, n in counts.items()
+    )
+
+
+class AlbumBuffer(CoalescingBuffer):
+    """Склейка сообщений альбома: flush(items) вызывается один раз на media_group_id"""
+
+    def __init__(self, flush, window: float = ALBUM_WINDOW):
+        async def flush_sorted(items):
+            await flush(sorted(items, key=lambda m: m.message_id))
+        super().__init__(flush_sorted, window, key=lambda m: (m.chat.id, m.media_group_id))
@@ -0,0 +1,170 @@
+"""
+Состав групп по апдейтам chat_member / my_chat_member (таблица tg_chat_member, миграция 0018).
+
+get_chat_administrators видит только админов, а логи — только тех, кто писал,
+поэтому состав ведётся инкрементально: вступления/выходы копятся MEMBERSHIP_WINDOW
+секунд по чату (services.coalesce) и пишутся пачкой в одной транзакции — три
+выражения на пачку, массивы через unnest():
+- tg_chat_member — последний статус (по дате апдейта, запоздавший не перетирает);
+- core_user — upsert профилей (кроме ботов);
+- core_projectmember — вступившие в группу проекта получают роль Member, если
+  ещё не состоят в проекте ни в какой роли.
+Выход из группы участника проекта не снимает: роли в проекте назначаются вручную.
+
+/syncmembers и админка только сверяют: SQL-функция tg_members_reconcile (миграция
+0019) — один INSERT ... SELECT по tg_chat_member (и user_chat_activity для тех,
+по кому апдейтов ещё не было); её список статусов совпадает с ACTIVE_STATUSES.
+"""
+from __future__ import annotations
+
+import datetime
+import os
+from dataclasses import dataclass
+
+from services.coalesce import CoalescingBuffer
+
+MEMBERSHIP_WINDOW = float(os.getenv("MEMBERSHIP_WINDOW_SECONDS", "2.0"))
+ACTIVE_STATUSES = ("creator", "administrator", "member", "restricted")
+
+SQL_MEMBER_ROLE = "SELECT id FROM core_role WHERE name ILIKE 'Member' LIMIT 1"
+SQL_CREATE_MEMBER_ROLE = "INSERT INTO core_role (name, can_assign, can_close) VALUES ('Member', false, false) RETURNING id"
+
+SQL_UPSERT_MEMBERS = """
+INSERT INTO tg_chat_member (chat_id, user_id, status, is_bot, updated_at)
+SELECT * FROM unnest($1::bigint[], $2::bigint[], $3::varchar[], $4::bool[], $5::timestamptz[])
+ON CONFLICT (chat_id, user_id) DO UPDATE
+SET status = EXCLUDED.status, is_bot = EXCLUDED.is_bot, updated_at = EXCLUDED.updated_at
+WHERE tg_chat_member.updated_at <= EXCLUDED.updated_at
+"""
+
+SQL_UPSERT_USERS = """
+INSERT INTO core_user (telegram_id, username, first_name, last_name, status, created_at)
+SELECT t, u, f, l, 'active', now() FROM unnest($1::bigint[], $2::text[], $3::text[], $4::text[]) AS x(t, u, f, l)
+ON CONFLICT (telegram_id) DO UPDATE
+SET username = EXCLUDED.username, first_name = EXCLUDED.first_name, last_name = EXCLUDED.last_name
+WHERE (core_user.username, core_user.first_name, core_user.last_name)
+      IS DISTINCT FROM (EXCLUDED.username, EXCLUDED.first_name, EXCLUDED.last_name)
+"""
+
+SQL_ADD_PROJECT_MEMBERS = """
+INSERT INTO core_projectmember (project_id, user_id, role_id, created_at)
+SELECT DISTINCT g.project_id, u.id, $3, now()
+FROM unnest($1::bigint[], $2::bigint[]) AS m(chat_id, tg)
+JOIN core_tggroup g ON g.telegram_id = m.chat_id AND g.project_id IS NOT NULL
+JOIN core_user u ON u.telegram_id = m.tg
+WHERE NOT EXISTS (SELECT 1 FROM core_projectmember pm WHERE pm.project_id = g.project_id AND pm.user_id = u.id)
+ON CONFLICT (project_id, user_id, role_id) WHERE department_id IS NULL DO NOTHING
+"""
+
+# тело — SQL-функция tg_members_reconcile (миграция 0019), общая с админкой
+SQL_RECONCILE = "SELECT present, added FROM tg_members_reconcile($1::bigint[], $2)"
+
+
+@dataclass(slots=True)
+class MemberEvent:
+    chat_id: int
+    user_id: int
+    status: str
+    is_bot: bool
+    date: datetime.datetime
+    username: str = ""
+    first_name: str = ""
+    last_name: str = ""
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+
+def member_status(member) -> str:
+    """restricted без is_member — уже не в группе"""
+    status = str(getattr(member.status, "value", member.status))
+    if status == "restricted" and not getattr(member, "is_member", True):
+        return "left"
+    return status
+
+
+def event_from_member(chat_id: int, member, date: datetime.datetime) -> MemberEvent:
+    user = member.user
+    return MemberEvent(
+        chat_id=chat_id,
+        user_id=user.id,
+        status=member_status(member),
+        is_bot=user.is_bot,
+        date=date,
+        username=user.username or "",
+        first_name=user.first_name or "",
+        last_name=user.last_name or "",
+    )
+
+
+def event_from_update(update) -> MemberEvent:
+    """ChatMemberUpdated (chat_member или my_chat_member) -> MemberEvent"""
+    return event_from_member(update.chat.id, update.new_chat_member, update.date)
+
+
+def latest(events: list[MemberEvent]) -> list[MemberEvent]:
+    """Последнее событие на пару (чат, пользователь): ON CONFLICT не примет дубли в одном INSERT"""
+    out: dict = {}
+    for e in events:
+        prev = out.get((e.chat_id, e.user_id))
+        if prev is None or e.date >= prev.date:
+            out[(e.chat_id, e.user_id)] = e
+    return list(out.values())
+
+
+async def member_role_id(conn) -> int:
+    role = await conn.fetchrow(SQL_MEMBER_ROLE)
+    if not role:
+        role = await conn.fetchrow(SQL_CREATE_MEMBER_ROLE)
+    return role["id"]
+
+
+async def apply_events(conn, events: list[MemberEvent]) -> int:
+    """Записать пачку событий; возвращает число новых ProjectMember"""
+    events = latest(events)
+    if not events:
+        return 0
+    people = list({e.user_id: e for e in sorted(events, key=lambda e: e.date) if not e.is_bot}.values())
+    joined = [e for e in events if e.active and not e.is_bot]
+    async with conn.transaction():
+        await conn.execute(
+            SQL_UPSERT_MEMBERS,
+            [e.chat_id for e in events], [e.user_id for e in events], [e.status for e in events],
+            [e.is_bot for e in events], [e.date for e in events],
+        )
+        if people:
+            await conn.execute(
+                SQL_UPSERT_USERS,
+                [e.user_id for e in people], [e.username for e in people],
+                [e.first_name for e in people], [e.last_name for e in people],
+            )
+        if not joined:
+            return 0
+        status = await conn.execute(
+            SQL_ADD_PROJECT_MEMBERS, [e.chat_id for e in joined], [e.user_id for e in joined],
+            await member_role_id(conn),
+        )
+    return int(status.split()[-1])
+
+
+async def reconcile(conn, chat_ids: list[int]) -> tuple[int, int]:
+    """Сверка ProjectMember с составом групп: (присутствуют, добавлено)"""
+    role_id = await member_role_id(conn)
+    row = await conn.fetchrow(SQL_RECONCILE, chat_ids, role_id)
+    return row["present"], row["added"]
+
+
+class MembershipBuffer(CoalescingBuffer):
+    """События одного чата -> одна запись apply_events после тишины window"""
+
+    def __init__(self, get_conn, window: float = MEMBERSHIP_WINDOW):
+        async def flush(events):
+            conn = await get_conn()
+            try:
+                added = await apply_events(conn, events)
+            finally:
+                await conn.close()
+            if added:
+                print(f"MEMBERSHIP chat={events[0].chat_id} added={added}")
+        super().__init__(flush, window, key=lambda e: e.chat_id)
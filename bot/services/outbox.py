@@ -0,0 +1,227 @@
+"""
+Доставка событий задач во внешние системы через транзакционный outbox (миграция 0017).
+
+Событие пишет триггер core_task_outbox в транзакции самого изменения core_task,
+поэтому /newtask, /closetask и админка не ходят в сеть и не теряют событие при
+сбое приёмника. Реле забирает пачку из task_outbox и отдаёт её всем приёмникам
+(OUTBOX_WEBHOOK_URL, OUTBOX_FILE, OUTBOX_REDIS_STREAM):
+- успех во всех — строки удаляются;
+- ошибка хоть в одном — вся пачка откладывается: attempts + 1, next_attempt_at
+  через min(2^attempts, OUTBOX_MAX_BACKOFF) секунд. Доставка «хотя бы раз» —
+  приёмник отсеивает повторы по id события.
+
+Порядок по задаче: строка не берётся, пока более раннее событие той же задачи
+ждёт повтора, а внутри пачки события идут по id. Пачку берёт одно реле за раз
+(pg_try_advisory_xact_lock) — несколько процессов бота не обгоняют друг друга.
+Без приёмников события просто снимаются с очереди.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+from dataclasses import dataclass
+
+import aiohttp
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_INTERVAL = float(os.getenv("OUTBOX_INTERVAL_SECONDS", "5"))
+MAX_BACKOFF = int(os.getenv("OUTBOX_MAX_BACKOFF", "3600"))
+SINK_TIMEOUT = 10.0
+LOCK_KEY = 0x6F7574  # pg advisory lock реле
+
+SQL_LOCK = "SELECT pg_try_advisory_xact_lock($1)"
+
+SQL_BATCH = """
+SELECT o.id, o.task_id, o.event, o.payload::text AS payload, o.created_at, o.attempts
+FROM task_outbox o
+WHERE o.next_attempt_at <= now()
+  AND NOT EXISTS (
+      SELECT 1 FROM task_outbox p
+      WHERE p.task_id = o.task_id AND p.id < o.id AND p.next_attempt_at > now()
+  )
+ORDER BY o.id
+LIMIT $1
+"""
+
+SQL_DELETE = "DELETE FROM task_outbox WHERE id = ANY($1::bigint[])"
+
+SQL_RETRY = """
+UPDATE task_outbox
+SET attempts = attempts + 1,
+    next_attempt_at = now() + make_interval(secs => LEAST(power(2, attempts + 1), $2)),
+    last_error = $3
+WHERE id = ANY($1::bigint[])
+"""
+
+
+@dataclass(slots=True)
+class OutboxEvent:
+    id: int
+    task_id: int
+    event: str
+    payload: dict
+    created_at: str
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "type": self.event, "task_id": self.task_id,
+                "created_at": self.created_at, "data": self.payload}
+
+
+def _event(row) -> OutboxEvent:
+    payload = row["payload"]
+    return OutboxEvent(
+        id=row["id"],
+        task_id=row["task_id"],
+        event=row["event"],
+        payload=json.loads(payload) if isinstance(payload, str) else payload,
+        created_at=row["created_at"].isoformat(),
+    )
+
+
+# ===== Приёмники: async send(events), исключение = пачка не доставлена =====
+
+class WebhookSink:
+    """POST {"events": [...]} на url; 2xx — доставлено. С секретом — подпись X-Signature (HMAC-SHA256 тела)"""
+    name = "webhook"
+
+    def __init__(self, url: str, secret: str | None = None, timeout: float = SINK_TIMEOUT):
+        self.url = url
+        self.secret = secret
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._session: aiohttp.ClientSession | None = None
+
+    async def send(self, events: list[OutboxEvent]) -> None:
+        body = json.dumps({"events": [e.to_dict() for e in events]}, ensure_ascii=False).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            headers["X-Signature"] = hmac.new(self.secret.encode(), body, hashlib.sha256).hexdigest()
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=self.timeout)
+        async with self._session.post(self.url, data=body, headers=headers) as resp:
+            if resp.status >= 300:
+                raise RuntimeError(f"HTTP {resp.status}")
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+
+class FileSink:
+    """JSON Lines: одно событие — одна строка (append)"""
+    name = "file"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def _write(self, lines: str) -> None:
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def send(self, events: list[OutboxEvent]) -> None:
+        lines = "".join(json.dumps(e.to_dict(), ensure_ascii=False) + "\n" for e in events)
+        await asyncio.to_thread(self._write, lines)
+
+    async def close(self) -> None:
+        pass
+
+
+class RedisStreamSink:
+    """XADD на событие одним pipeline; поле event — JSON события, длина потока ~maxlen"""
+    name = "redis"
+
+    def __init__(self, get_redis, stream: str, maxlen: int = 100_000):
+        self.get_redis = get_redis
+        self.stream = stream
+        self.maxlen = maxlen
+
+    async def send(self, events: list[OutboxEvent]) -> None:
+        pipe = self.get_redis().pipeline(transaction=False)
+        for e in events:
+            pipe.xadd(self.stream, {"event": json.dumps(e.to_dict(), ensure_ascii=False)},
+                      maxlen=self.maxlen, approximate=True)
+        await pipe.execute()
+
+    async def close(self) -> None:
+        pass
+
+
+def sinks_from_env(get_redis) -> list:
+    sinks = []
+    if url := os.getenv("OUTBOX_WEBHOOK_URL"):
+        sinks.append(WebhookSink(url, os.getenv("OUTBOX_WEBHOOK_SECRET") or None))
+    if path := os.getenv("OUTBOX_FILE"):
+        sinks.append(FileSink(path))
+    if stream := os.getenv("OUTBOX_REDIS_STREAM"):
+        sinks.append(RedisStreamSink(get_redis, stream))
+    return sinks
+
+
+# ===== Реле =====
+
+async def relay_once(conn, sinks: list, batch_size: int = BATCH_SIZE) -> tuple[int, int]:
+    """Одна пачка: (доставлено, отложено). Строки заблокированы реле до конца транзакции"""
+    async with conn.transaction():
+        if not await conn.fetchval(SQL_LOCK, LOCK_KEY):
+            return 0, 0  # пачку уже везёт другой процесс
+        rows = await conn.fetch(SQL_BATCH, batch_size)
+        if not rows:
+            return 0, 0
+        ids = [r["id"] for r in rows]
+        events = [_event(r) for r in rows]
+        for sink in sinks:
+            try:
+                await asyncio.wait_for(sink.send(events), SINK_TIMEOUT)
+            except Exception as e:
+                error = f"{sink.name}: {e!r}"[:500]
+                await conn.execute(SQL_RETRY, ids, float(MAX_BACKOFF), error)
+                print(f"OUTBOX_WARN {len(ids)} events deferred: {error}")
+                return 0, len(ids)
+        await conn.execute(SQL_DELETE, ids)
+        return len(ids), 0
+
+
+class OutboxRelay:
+    """Фоновое реле; wake() — из подписки на task_changed, чтобы не ждать интервал"""
+
+    def __init__(self, get_conn, sinks: list, interval: float = OUTBOX_INTERVAL, batch_size: int = BATCH_SIZE):
+        self.get_conn = get_conn
+        self.sinks = sinks
+        self.interval = interval
+        self.batch_size = batch_size
+        self._wake = asyncio.Event()
+
+    async def on_changes(self, changes) -> None:
+        self._wake.set()
+
+    async def relay_pending(self) -> int:
+        total = 0
+        conn = await self.get_conn()
+        try:
+            while True:
+                sent, deferred = await relay_once(conn, self.sinks, self.batch_size)
+                total += sent
+                if deferred or sent < self.batch_size:
+                    return total
+        finally:
+            await conn.close()
+
+    async def run(self) -> None:
+        while True:
+            self._wake.clear()
+            try:
+                n = await self.relay_pending()
+                if n:
+                    print(f"OUTBOX sent={n}")
+            except Exception as e:
+                print(f"OUTBOX_WARN: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self) -> None:
+        for sink in self.sinks:
+            await sink.close()
@@ -0,0 +1,59 @@
+"""
+Обслуживание секций raw_updates (секционирование по месяцам, миграция 0004).
+
+Вся логика — в SQL-функции raw_updates_maintain(): создаёт секции на
+RAW_UPDATES_MONTHS_AHEAD месяцев вперёд и отцепляет (detach) или удаляет (drop)
+секции старше RAW_UPDATES_RETENTION_MONTHS. Здесь — только вызов и фоновый цикл.
+Если задан RAW_ARCHIVE_DIR, отцепленные секции сразу уходят в холодный архив
+(services.archive) и удаляются из Postgres вместе с телами raw_payloads. Тем же
+проходом обслуживается raw_payloads (services.payloads): первый словарь zstd и
+чистка осиротевших тел — кроме тел отцепленных секций, ещё не ушедших в архив.
+"""
+import asyncio
+import datetime
+import os
+
+from services.archive import archive_detached, detached_partitions
+from services.payloads import maintain_payloads
+
+MONTHS_AHEAD = int(os.getenv("RAW_UPDATES_MONTHS_AHEAD", "2"))
+RETENTION_MONTHS = int(os.getenv("RAW_UPDATES_RETENTION_MONTHS", "0"))  # 0 — хранить всё
+RETENTION_MODE = os.getenv("RAW_UPDATES_RETENTION_MODE", "detach")       # detach | drop
+MAINTENANCE_INTERVAL = float(os.getenv("RAW_UPDATES_MAINTENANCE_HOURS", "24")) * 3600
+
+
+def month_start(ts: datetime.datetime) -> datetime.datetime:
+    """Нижняя граница месячной секции, в которую попадает ts (UTC)"""
+    ts = ts.astimezone(datetime.timezone.utc)
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+async def maintain_raw_updates(conn, months_ahead: int = MONTHS_AHEAD,
+                               retention_months: int = RETENTION_MONTHS,
+                               mode: str = RETENTION_MODE) -> list[str]:
+    """Один проход обслуживания. Возвращает список действий ('created raw_updates_p202611', ...)"""
+    if mode not in ("detach", "drop"):
+        raise ValueError(f"unknown retention mode: {mode}")
+    rows = await conn.fetch(
+        "SELECT action FROM raw_updates_maintain($1, $2, $3) AS action",
+        months_ahead, retention_months, mode,
+    )
+    return [r["action"] for r in rows]
+
+
+async def maintenance_loop(get_conn, interval: float = MAINTENANCE_INTERVAL) -> None:
+    """Фоновый цикл: сразу при старте и далее раз в interval секунд"""
+    while True:
+        try:
+            conn = await get_conn()
+            try:
+                actions = await maintain_raw_updates(conn)
+                actions += [f"archived {p}" for p in await archive_detached(conn)]
+                actions += await maintain_payloads(conn, await detached_partitions(conn))
+            finally:
+                await conn.close()
+            for a in actions:
+                print(f"RAW_PARTITION {a}")
+        except Exception as e:
+            print(f"RAW_PARTITION_WARN: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,180 @@
+"""
+Полный апдейт Telegram рядом с журналом: msgpack + zstd с общим словарём.
+
+raw_updates.payload держит только компактный dict (chat/message/from/topic), а всё
+остальное — подписи, медиа, entities, reply/forward — лежит в raw_payloads
+(миграция 0010): raw_id -> (dict_id, body bytea). Горячая таблица не раздувается,
+body читается и распаковывается только по запросу (load_payload).
+
+Сообщения Telegram короткие и однотипные, поэтому обычный zstd почти не сжимает
+их по отдельности; словарь, обученный на накопленных апдейтах (raw_payload_dicts),
+выносит общие ключи и структуру за скобки. dict_id = 0 — сжато без словаря
+(до первого обучения). Старые словари не удаляются: по ним читаются старые строки.
+
+Запуск вручную:
+    python -m services.payloads train            # обучить новый словарь
+    python -m services.payloads show RAW_ID      # распаковать апдейт
+    python -m services.payloads stats [--sample N]  # байт на сообщение: body vs jsonb
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+
+import msgpack
+import zstandard
+
+ZSTD_LEVEL = int(os.getenv("RAW_PAYLOAD_ZSTD_LEVEL", "6"))
+DICT_SIZE = int(os.getenv("RAW_PAYLOAD_DICT_SIZE", "16384"))
+DICT_SAMPLES = int(os.getenv("RAW_PAYLOAD_DICT_SAMPLES", "5000"))
+MIN_SAMPLES = 500  # меньше — словарь не обучить осмысленно
+
+SQL_SAMPLES = "SELECT dict_id, body FROM raw_payloads ORDER BY raw_id DESC LIMIT $1"
+
+
+def message_to_dict(msg) -> dict:
+    """Апдейт aiogram (pydantic) -> dict без пустых полей"""
+    return msg.model_dump(mode="json", exclude_none=True)
+
+
+class PayloadCodec:
+    """Кодек msgpack+zstd; словари регистрируются по id, сжатие — последним"""
+
+    def __init__(self, level: int = ZSTD_LEVEL):
+        self.level = level
+        self.current_id = 0
+        self._cctx = {0: zstandard.ZstdCompressor(level=level)}
+        self._dctx = {0: zstandard.ZstdDecompressor()}
+
+    def use(self, dict_id: int, data: bytes) -> None:
+        d = zstandard.ZstdCompressionDict(data)
+        self._cctx[dict_id] = zstandard.ZstdCompressor(level=self.level, dict_data=d)
+        self._dctx[dict_id] = zstandard.ZstdDecompressor(dict_data=d)
+        self.current_id = max(self.current_id, dict_id)
+
+    def has(self, dict_id: int) -> bool:
+        return dict_id in self._dctx
+
+    def encode(self, obj: dict) -> tuple[int, bytes]:
+        packed = msgpack.packb(obj, use_bin_type=True)
+        return self.current_id, self._cctx[self.current_id].compress(packed)
+
+    def unpack_raw(self, dict_id: int, body: bytes) -> bytes:
+        """Распаковка zstd без разбора msgpack (нужна для обучения словаря)"""
+        return self._dctx[dict_id].decompress(body)
+
+    def decode(self, dict_id: int, body: bytes) -> dict:
+        return msgpack.unpackb(self.unpack_raw(dict_id, body), raw=False)
+
+    async def load(self, conn) -> None:
+        """Подтягивает все словари из БД (при старте и при встрече неизвестного dict_id)"""
+        for r in await conn.fetch("SELECT id, dict FROM raw_payload_dicts ORDER BY id"):
+            if not self.has(r["id"]):
+                self.use(r["id"], bytes(r["dict"]))
+
+
+async def load_payload(conn, raw_id: int, payload_codec: PayloadCodec | None = None) -> dict | None:
+    """Полный апдейт по raw_updates.id (None, если не сохранялся)"""
+    payload_codec = payload_codec or codec
+    row = await conn.fetchrow("SELECT dict_id, body FROM raw_payloads WHERE raw_id = $1", raw_id)
+    if row is None:
+        return None
+    if not payload_codec.has(row["dict_id"]):
+        await payload_codec.load(conn)
+    return payload_codec.decode(row["dict_id"], bytes(row["body"]))
+
+
+async def train_dictionary(conn, payload_codec: PayloadCodec | None = None,
+                           samples: int = DICT_SAMPLES, size: int = DICT_SIZE) -> int | None:
+    """Обучает словарь на последних апдейтах и делает его текущим. None — мало данных"""
+    payload_codec = payload_codec or codec
+    rows = await conn.fetch(SQL_SAMPLES, samples)
+    if len(rows) < MIN_SAMPLES:
+        return None
+    if any(not payload_codec.has(r["dict_id"]) for r in rows):
+        await payload_codec.load(conn)
+    raw = [payload_codec.unpack_raw(r["dict_id"], bytes(r["body"])) for r in rows]
+    trained = await asyncio.to_thread(zstandard.train_dictionary, size, raw)
+    dict_id = await conn.fetchval(
+        "INSERT INTO raw_payload_dicts (dict, samples) VALUES ($1, $2) RETURNING id",
+        trained.as_bytes(), len(raw),
+    )
+    payload_codec.use(dict_id, trained.as_bytes())
+    return dict_id
+
+
+def prune_sql(detached: list[str]) -> str:
+    """
+    Удаление тел ниже самого старого id, который ещё есть в Postgres: в raw_updates
+    или в отцепленной, но не заархивированной секции (её тела уходят в сегмент).
+    Отсюда уходят тела удалённых (mode='drop') секций.
+    """
+    lows = ["(SELECT min(id) FROM raw_updates)"] + [f'(SELECT min(id) FROM "{t}")' for t in detached]
+    return f"DELETE FROM raw_payloads WHERE raw_id < COALESCE(LEAST({', '.join(lows)}), 0)"
+
+
+async def maintain_payloads(conn, detached: list[str],
+                            payload_codec: PayloadCodec | None = None) -> list[str]:
+    """
+    Обучает первый словарь, когда данных достаточно; удаляет тела строк, которых
+    нет ни в raw_updates, ни в отцепленных секциях detached (ждут архивации)
+    """
+    payload_codec = payload_codec or codec
+    actions = []
+    await payload_codec.load(conn)
+    if payload_codec.current_id == 0:
+        dict_id = await train_dictionary(conn, payload_codec)
+        if dict_id:
+            actions.append(f"trained payload dict {dict_id}")
+    status = await conn.execute(prune_sql(detached))
+    if status and status != "DELETE 0":
+        actions.append(f"pruned payloads: {status}")
+    return actions
+
+
+codec = PayloadCodec()
+
+
+def _main(argv=None) -> None:
+    import argparse
+
+    import asyncpg
+
+    parser = argparse.ArgumentParser(prog="python -m services.payloads")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("train")
+    show = sub.add_parser("show")
+    show.add_argument("raw_id", type=int)
+    stats = sub.add_parser("stats")
+    stats.add_argument("--sample", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    async def run():
+        conn = await asyncpg.connect(
+            user="bot", password=os.getenv("DB_PASSWORD"), database="botdb", host="db", port=5432,
+        )
+        try:
+            await codec.load(conn)
+            if args.cmd == "train":
+                print(await train_dictionary(conn) or f"not enough samples (< {MIN_SAMPLES})")
+            elif args.cmd == "show":
+                print(json.dumps(await load_payload(conn, args.raw_id), ensure_ascii=False, indent=2))
+            else:
+                rows = await conn.fetch(SQL_SAMPLES, args.sample)
+                if not rows:
+                    return print("no payloads")
+                docs = [json.dumps(codec.decode(r["dict_id"], bytes(r["body"])), ensure_ascii=False) for r in rows]
+                jsonb = float(await conn.fetchval(
+                    "SELECT avg(pg_column_size(d::jsonb)) FROM unnest($1::text[]) AS d", docs
+                ))
+                body = sum(len(r["body"]) for r in rows) / len(rows)
+                print(f"rows={len(rows)} body={body:.0f}B jsonb={jsonb:.0f}B ratio={body / jsonb:.2f}")
+        finally:
+            await conn.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,295 @@
+"""
+Слой доступа к Redis для бота.
+
+- Явный пул соединений (BlockingConnectionPool): лимит соединений, таймауты
+  сокета/подключения, ретраи с экспоненциальной задержкой, health-check.
+- Метрики латентности по каждой команде (и по пайплайнам целиком).
+- Пакетные операции: get_many (MGET) и set_many (пайплайн SET EX).
+- Опциональный клиентский кэш горячих ключей (responsible:*, perm:*) с
+  инвалидацией на стороне сервера: CLIENT TRACKING в режиме BCAST по префиксам,
+  уведомления приходят в отдельное pubsub-соединение (REDIRECT). Так работает
+  и на RESP2, и на RESP3 (REDIS_PROTOCOL=3).
+
+Настройки (env):
+  REDIS_HOST, REDIS_PORT, REDIS_DB, REDIS_PROTOCOL (2|3)
+  REDIS_MAX_CONNECTIONS=20, REDIS_POOL_TIMEOUT=2
+  REDIS_SOCKET_TIMEOUT=0.5, REDIS_CONNECT_TIMEOUT=1.0, REDIS_RETRIES=2
+  REDIS_CLIENT_CACHE=0|1, REDIS_CLIENT_CACHE_SIZE=10000
+"""
+import asyncio
+import bisect
+import os
+import time
+from collections import OrderedDict
+
+import redis.asyncio as aioredis
+from redis.asyncio.client import Pipeline
+from redis.asyncio.retry import Retry
+from redis.backoff import ExponentialBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+# Префиксы горячих ключей, которые держим в клиентском кэше
+TRACKED_PREFIXES = ("responsible:", "perm:")
+
+_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class LatencyMetrics:
+    """Счётчики латентности по командам: count / total / max + гистограмма для p95"""
+
+    def __init__(self):
+        self._data: dict[str, list] = {}
+
+    def record(self, op: str, seconds: float) -> None:
+        ms = seconds * 1000
+        d = self._data.get(op)
+        if d is None:
+            d = self._data[op] = [0, 0.0, 0.0, [0] * (len(_BUCKETS_MS) + 1)]
+        d[0] += 1
+        d[1] += ms
+        d[2] = max(d[2], ms)
+        d[3][bisect.bisect_left(_BUCKETS_MS, ms)] += 1
+
+    def snapshot(self) -> dict[str, dict]:
+        out = {}
+        for op, (count, total, mx, hist) in self._data.items():
+            # p95 — верхняя граница корзины, в которую попал 95-й перцентиль
+            need, acc, p95 = count * 0.95, 0, mx
+            for i, c in enumerate(hist):
+                acc += c
+                if acc >= need:
+                    p95 = _BUCKETS_MS[i] if i < len(_BUCKETS_MS) else mx
+                    break
+            out[op] = {
+                "count": count,
+                "avg_ms": round(total / count, 3),
+                "p95_ms": p95,
+                "max_ms": round(mx, 3),
+            }
+        return out
+
+    def format(self) -> str:
+        snap = self.snapshot()
+        return " | ".join(
+            f"{op} n={s['count']} avg={s['avg_ms']}ms p95<={s['p95_ms']}ms max={s['max_ms']}ms"
+            for op, s in sorted(snap.items(), key=lambda kv: -kv[1]["count"])
+        ) or "no commands"
+
+    def reset(self) -> None:
+        self._data.clear()
+
+
+metrics = LatencyMetrics()
+
+
+class InstrumentedPipeline(Pipeline):
+    async def execute(self, raise_on_error: bool = True):
+        t0 = time.perf_counter()
+        try:
+            return await super().execute(raise_on_error)
+        finally:
+            metrics.record("PIPELINE", time.perf_counter() - t0)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    """redis.asyncio.Redis, замеряющий латентность каждой команды"""
+
+    async def execute_command(self, *args, **options):
+        t0 = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            metrics.record(str(args[0]).upper(), time.perf_counter() - t0)
+
+    def pipeline(self, transaction: bool = True, shard_hint: str | None = None) -> Pipeline:
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+def _connection_kwargs() -> dict:
+    retries = int(os.getenv("REDIS_RETRIES", "2"))
+    return dict(
+        host=os.getenv("REDIS_HOST", "redis"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        db=int(os.getenv("REDIS_DB", "0")),
+        protocol=int(os.getenv("REDIS_PROTOCOL", "2")),
+        decode_responses=True,
+        socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "0.5")),
+        socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1.0")),
+        socket_keepalive=True,
+        health_check_interval=30,
+        retry=Retry(ExponentialBackoff(cap=0.5, base=0.02), retries),
+        retry_on_error=[RedisConnectionError, RedisTimeoutError],
+    )
+
+
+def create_redis() -> InstrumentedRedis:
+    """Клиент с явным пулом: при исчерпании пула ждём REDIS_POOL_TIMEOUT, а не плодим соединения"""
+    pool = aioredis.BlockingConnectionPool(
+        max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "20")),
+        timeout=float(os.getenv("REDIS_POOL_TIMEOUT", "2")),
+        **_connection_kwargs(),
+    )
+    return InstrumentedRedis(connection_pool=pool)
+
+
+async def get_many(client, keys: list[str]) -> list[str | None]:
+    """Несколько ключей за один MGET"""
+    if not keys:
+        return []
+    return await client.mget(keys)
+
+
+async def set_many(client, mapping: dict[str, str], ttl: int) -> None:
+    """Запись нескольких ключей с TTL одним пайплайном"""
+    if not mapping:
+        return
+    async with client.pipeline(transaction=False) as pipe:
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ttl)
+        await pipe.execute()
+
+
+class ClientSideCache:
+    """
+    Локальная копия горячих ключей с серверной инвалидацией.
+
+    Пока слушатель инвалидаций жив, чтения tracked-ключей обслуживаются из памяти.
+    Любой сбой канала инвалидаций очищает кэш и выключает его до переподключения —
+    лучше лишний поход в Redis, чем устаревший ответ.
+    """
+
+    CHANNEL = "__redis__:invalidate"
+
+    def __init__(self, client, prefixes: tuple[str, ...] = TRACKED_PREFIXES, max_items: int = 10000):
+        self.client = client
+        self.prefixes = prefixes
+        self.max_items = max_items
+        self._data: OrderedDict[str, str | None] = OrderedDict()
+        self._epoch = 0        # растёт на каждую инвалидацию: защищает от гонки чтение/инвалидация
+        self._active = False
+        self._task: asyncio.Task | None = None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def active(self) -> bool:
+        return self._active
+
+    def _tracked(self, key: str) -> bool:
+        return key.startswith(self.prefixes)
+
+    def _store(self, key: str, value: str | None) -> None:
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def invalidate(self, keys: list[str] | None) -> None:
+        self._epoch += 1
+        if keys is None:
+            self._data.clear()
+            return
+        for k in keys:
+            self._data.pop(k, None)
+
+    async def get(self, key: str) -> str | None:
+        if self._active and self._tracked(key) and key in self._data:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+        self.misses += 1
+        epoch = self._epoch
+        value = await self.client.get(key)
+        if self._active and self._tracked(key) and epoch == self._epoch:
+            self._store(key, value)
+        return value
+
+    async def get_many(self, keys: list[str]) -> list[str | None]:
+        result: dict[str, str | None] = {}
+        missing = []
+        for k in keys:
+            if self._active and self._tracked(k) and k in self._data:
+                self.hits += 1
+                result[k] = self._data[k]
+            else:
+                missing.append(k)
+        if missing:
+            self.misses += len(missing)
+            epoch = self._epoch
+            values = await get_many(self.client, missing)
+            for k, v in zip(missing, values):
+                result[k] = v
+                if self._active and self._tracked(k) and epoch == self._epoch:
+                    self._store(k, v)
+        return [result[k] for k in keys]
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        self._active = False
+        self.invalidate(None)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"REDIS_CLIENT_CACHE_WARN: {e!r}")
+            self._active = False
+            self.invalidate(None)
+            await asyncio.sleep(5)
+
+    async def _listen(self) -> None:
+        # Пул на одно соединение: CLIENT ID и подписка гарантированно на одном сокете
+        kwargs = _connection_kwargs()
+        kwargs["socket_timeout"] = None  # слушатель ждёт сообщения бесконечно
+        inv_pool = aioredis.ConnectionPool(max_connections=1, **kwargs)
+        inv_client = aioredis.Redis(connection_pool=inv_pool)
+        tracker = aioredis.Redis(single_connection_client=True, **_connection_kwargs())
+        pubsub = inv_client.pubsub()
+        try:
+            redirect_id = await inv_client.client_id()
+            await pubsub.subscribe(self.CHANNEL)
+            args = ["CLIENT", "TRACKING", "ON", "REDIRECT", redirect_id, "BCAST"]
+            for p in self.prefixes:
+                args += ["PREFIX", p]
+            await tracker.execute_command(*args)
+            self.invalidate(None)
+            self._active = True
+            print(f"REDIS_CLIENT_CACHE_ON prefixes={','.join(self.prefixes)}")
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = message.get("data")
+                if data is None:
+                    self.invalidate(None)
+                elif isinstance(data, (list, tuple)):
+                    self.invalidate(list(data))
+                else:
+                    self.invalidate([data])
+            raise RedisConnectionError("invalidation channel closed")
+        finally:
+            self._active = False
+            try:
+                await pubsub.aclose()
+                await tracker.aclose()
+                await inv_client.aclose()
+            except Exception:
+                pass
+
+
+async def report_metrics(interval: float) -> None:
+    """Фоновая печать метрик латентности раз в interval секунд"""
+    while True:
+        await asyncio.sleep(interval)
+        print(f"REDIS_LATENCY {metrics.format()}")
+        metrics.reset()
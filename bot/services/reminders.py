@@ -0,0 +1,223 @@
+"""
+Напоминания о дедлайнах: таймеры в Redis ZSET, без периодических сканов core_task.
+
+При создании задачи с дедлайном в ZSET reminders:due кладутся её события:
+  warn — за REMINDER_WARN_DAYS дней до дедлайна, due — в день дедлайна,
+оба в REMINDER_HOUR по TIMEZONE (core_task.deadline — дата). score — unix-время
+срабатывания, member — "task_id:kind:YYYY-MM-DD".
+
+Воркер раз в REMINDER_POLL_SECONDS забирает созревшие элементы пачкой (Lua:
+ZRANGEBYSCORE + ZREM атомарно — два процесса не отправят одно и то же), одним
+запросом по PK читает задачи и шлёт напоминание в чат/топик-источник. Дата в
+member сверяется с текущим дедлайном: если дедлайн перенесли или задачу
+закрыли, устаревший таймер просто отбрасывается.
+
+Сверка (reconcile) при старте и раз в REMINDER_RECONCILE_HOURS идёт по индексу
+(status, deadline) в окне ближайших дней и досоздаёт таймеры (ZADD идемпотентен) —
+так подхватываются дедлайны, изменённые в админке, и потерянный Redis.
+
+Тот же ZSET — общий таймер для других событий по задачам (эскалация,
+services.escalation): member "task_id:kind:arg", вид события определяет
+обработчик из handlers, сверки — reconcilers воркера.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import html
+import os
+import time
+from zoneinfo import ZoneInfo
+
+ZSET_KEY = "reminders:due"
+REMINDER_HOUR = int(os.getenv("REMINDER_HOUR", "10"))
+WARN_DAYS = int(os.getenv("REMINDER_WARN_DAYS", "1"))
+POLL_SECONDS = float(os.getenv("REMINDER_POLL_SECONDS", "5"))
+RECONCILE_SECONDS = float(os.getenv("REMINDER_RECONCILE_HOURS", "6")) * 3600
+BATCH = 100
+OPEN_STATUSES = ("TODO", "IN_PROGRESS", "ON_REVIEW")
+
+# Забрать до ARGV[2] элементов со score <= ARGV[1] и удалить их — атомарно
+CLAIM_LUA = """
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #items > 0 then
+    redis.call('ZREM', KEYS[1], unpack(items))
+end
+return items
+"""
+
+SQL_TASKS_BY_ID = """
+SELECT id, title, status, deadline, source_chat_id, source_topic_id, responsible_username
+FROM core_task
+WHERE id = ANY($1::bigint[])
+"""
+
+SQL_RECONCILE = """
+SELECT id, deadline
+FROM core_task
+WHERE status = ANY($1::varchar[])
+  AND deadline >= $2 AND deadline <= $3
+"""
+
+_claim_script = None
+
+
+def reminder_times(deadline: datetime.date, tz: str) -> list[tuple[str, datetime.datetime]]:
+    """[(kind, момент срабатывания)] для дедлайна-даты"""
+    at = datetime.time(hour=REMINDER_HOUR)
+    zone = ZoneInfo(tz)
+    return [
+        ("warn", datetime.datetime.combine(deadline - datetime.timedelta(days=WARN_DAYS), at, tzinfo=zone)),
+        ("due", datetime.datetime.combine(deadline, at, tzinfo=zone)),
+    ]
+
+
+def member(task_id: int, kind: str, arg) -> str:
+    if isinstance(arg, datetime.date):
+        arg = arg.isoformat()
+    return f"{task_id}:{kind}:{arg}"
+
+
+def parse_member(value) -> tuple[int, str, str]:
+    if isinstance(value, bytes):
+        value = value.decode()
+    task_id, kind, arg = value.split(":")
+    return int(task_id), kind, arg
+
+
+def timers_for(rows, tz: str, now: float | None = None) -> dict[str, float]:
+    """{member: score} для строк (id, deadline); прошедшие моменты не планируются"""
+    now = time.time() if now is None else now
+    out = {}
+    for r in rows:
+        if r["deadline"] is None:
+            continue
+        for kind, at in reminder_times(r["deadline"], tz):
+            ts = at.timestamp()
+            if ts > now:
+                out[member(r["id"], kind, r["deadline"])] = ts
+    return out
+
+
+async def schedule_tasks(conn, redis, task_ids: list[int], tz: str, extra=()) -> int:
+    """
+    Таймеры для задач по id (после создания/смены дедлайна). extra — функции
+    rows -> {member: score} для других видов событий. Возвращает число таймеров
+    """
+    ids = [i for i in task_ids if i]
+    if not ids:
+        return 0
+    rows = await conn.fetch(SQL_TASKS_BY_ID, ids)
+    timers = timers_for(rows, tz)
+    for fn in extra:
+        timers.update(fn(rows))
+    if timers:
+        await redis.zadd(ZSET_KEY, timers)
+    return len(timers)
+
+
+async def reconcile(conn, redis, tz: str, days_ahead: int | None = None) -> int:
+    """Досоздать таймеры по индексу (status, deadline) на ближайшие дни"""
+    days_ahead = WARN_DAYS + 2 if days_ahead is None else days_ahead
+    today = datetime.datetime.now(ZoneInfo(tz)).date()
+    rows = await conn.fetch(SQL_RECONCILE, list(OPEN_STATUSES), today,
+                            today + datetime.timedelta(days=days_ahead))
+    timers = timers_for(rows, tz)
+    if timers:
+        await redis.zadd(ZSET_KEY, timers)
+    return len(timers)
+
+
+async def claim_due(redis, now: float | None = None, limit: int = BATCH) -> list:
+    """Атомарно забирает созревшие таймеры"""
+    global _claim_script
+    if _claim_script is None or _claim_script.registered_client is not redis:
+        _claim_script = redis.register_script(CLAIM_LUA)
+    return await _claim_script(keys=[ZSET_KEY], args=[time.time() if now is None else now, limit])
+
+
+def render(kind: str, task) -> str:
+    who = task["responsible_username"]
+    who = f" — @{who}" if who and who != "unknown" else ""
+    day = task["deadline"].strftime("%d.%m.%Y")
+    head = "⏰ Скоро дедлайн" if kind == "warn" else "🔥 Сегодня дедлайн"
+    return f"{head} ({day}): #{task['id']} «{html.escape(task['title'])}»{who}"
+
+
+async def fire(conn, items: list, send) -> int:
+    """Отправляет напоминания по забранным таймерам. Возвращает число отправленных"""
+    timers = [(t, kind, datetime.date.fromisoformat(arg)) for t, kind, arg in map(parse_member, items)]
+    if not timers:
+        return 0
+    rows = await conn.fetch(SQL_TASKS_BY_ID, sorted({t for t, _, _ in timers}))
+    tasks = {r["id"]: r for r in rows}
+    sent = 0
+    for task_id, kind, deadline in timers:
+        task = tasks.get(task_id)
+        # задачу удалили, закрыли или перенесли дедлайн — таймер устарел
+        if task is None or task["status"] not in OPEN_STATUSES or task["deadline"] != deadline:
+            continue
+        if not task["source_chat_id"]:
+            continue
+        try:
+            await send(task["source_chat_id"], task["source_topic_id"], render(kind, task))
+            sent += 1
+        except Exception as e:
+            print(f"REMINDER_SEND_WARN task={task_id}: {e}")
+    return sent
+
+
+async def dispatch(conn, redis, items: list, send, handlers: dict | None = None) -> int:
+    """
+    Раздаёт забранные таймеры: warn/due — напоминания, прочие виды — handlers[kind]
+    (conn, [(task_id, arg)], send) -> {member: score} следующих таймеров
+    """
+    by_kind: dict[str, list] = {}
+    for raw in items:
+        task_id, kind, arg = parse_member(raw)
+        by_kind.setdefault(kind, []).append((raw, task_id, arg))
+    done = await fire(conn, [raw for k in ("warn", "due") for raw, _, _ in by_kind.pop(k, [])], send)
+    follow: dict[str, float] = {}
+    for kind, entries in by_kind.items():
+        handler = (handlers or {}).get(kind)
+        if handler is None:
+            print(f"REMINDER_WARN: no handler for {kind}")
+            continue
+        follow.update(await handler(conn, [(t, arg) for _, t, arg in entries], send))
+        done += len(entries)
+    if follow:
+        await redis.zadd(ZSET_KEY, follow)
+    return done
+
+
+async def reminder_loop(get_redis, get_conn, send, tz: str, poll: float = POLL_SECONDS,
+                        reconcile_every: float = RECONCILE_SECONDS,
+                        handlers: dict | None = None, reconcilers=()) -> None:
+    """Воркер: сверки при старте и по расписанию, далее — забор созревших таймеров"""
+    loop = asyncio.get_running_loop()
+    next_reconcile = 0.0
+    while True:
+        try:
+            redis = get_redis()
+            if loop.time() >= next_reconcile:
+                conn = await get_conn()
+                try:
+                    n = 0
+                    for fn in (reconcile, *reconcilers):
+                        n += await fn(conn, redis, tz)
+                finally:
+                    await conn.close()
+                next_reconcile = loop.time() + reconcile_every
+                print(f"REMINDER reconcile timers={n}")
+            while items := await claim_due(redis):
+                conn = await get_conn()
+                try:
+                    n = await dispatch(conn, redis, items, send, handlers)
+                finally:
+                    await conn.close()
+                print(f"REMINDER fired={n} claimed={len(items)}")
+                if len(items) < BATCH:
+                    break
+        except Exception as e:
+            print(f"REMINDER_WARN: {e}")
+        await asyncio.sleep(poll)
@@ -0,0 +1,174 @@
+"""
+Почасовые сводки активности (миграция 0008): сообщения по (чат, топик, пользователь, час).
+
+raw_updates читается инкрементально от водяного знака rollup_watermark.last_id,
+агрегат добавляется в activity_hourly, а знак сдвигается в той же транзакции —
+повторный или параллельный проход (бот + manage.py) не посчитает строку дважды.
+
+id выдаются последовательностью до коммита, поэтому строки моложе ROLLUP_LAG_SECONDS
+не берём: транзакция с меньшим id ещё может быть в полёте. last_ts нужен только
+для отсечения старых секций raw_updates по created_at.
+
+Ежедневное уплотнение переносит часы старше ROLLUP_HOURLY_DAYS в activity_daily
+(дни — в TIMEZONE). Каждое сообщение лежит ровно в одной из таблиц, поэтому
+/stats и админка складывают daily + hourly без пересечений.
+
+topic_id / user_id = 0 — «без топика» / «неизвестный отправитель».
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import os
+from dataclasses import dataclass
+from zoneinfo import ZoneInfo
+
+WATERMARK = "activity_hourly"
+BATCH_ROWS = int(os.getenv("ROLLUP_BATCH_ROWS", "50000"))
+LAG_SECONDS = int(os.getenv("ROLLUP_LAG_SECONDS", "60"))
+HOURLY_DAYS = int(os.getenv("ROLLUP_HOURLY_DAYS", "14"))
+ROLLUP_INTERVAL = float(os.getenv("ROLLUP_INTERVAL_SECONDS", "60"))
+COMPACT_INTERVAL = 24 * 3600
+
+SQL_LOCK_WATERMARK = """
+INSERT INTO rollup_watermark (name, last_id, last_ts) VALUES ($1, 0, NULL)
+ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name
+RETURNING last_id, last_ts
+"""
+
+SQL_ROLLUP = """
+WITH src AS (
+    SELECT id, created_at, chat_id,
+           COALESCE(topic_id, 0) AS topic_id,
+           COALESCE(user_id, 0)  AS user_id
+    FROM raw_updates
+    WHERE id > $1
+      AND created_at >= COALESCE($2::timestamptz - interval '1 day', '-infinity')
+      AND created_at < now() - make_interval(secs => $3)
+      AND chat_id IS NOT NULL
+    ORDER BY id
+    LIMIT $4
+), agg AS (
+    INSERT INTO activity_hourly (chat_id, bucket, topic_id, user_id, msg_count)
+    SELECT chat_id, date_trunc('hour', created_at AT TIME ZONE 'UTC') AT TIME ZONE 'UTC',
+           topic_id, user_id, count(*)
+    FROM src
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (chat_id, bucket, topic_id, user_id)
+    DO UPDATE SET msg_count = activity_hourly.msg_count + EXCLUDED.msg_count
+)
+SELECT count(*) AS n, max(id) AS last_id, max(created_at) AS last_ts FROM src
+"""
+
+SQL_ADVANCE = """
+UPDATE rollup_watermark SET last_id = $2, last_ts = GREATEST(last_ts, $3), updated_at = now()
+WHERE name = $1
+"""
+
+SQL_COMPACT = """
+WITH moved AS (
+    DELETE FROM activity_hourly WHERE bucket < $1
+    RETURNING chat_id, bucket, topic_id, user_id, msg_count
+)
+INSERT INTO activity_daily (chat_id, day, topic_id, user_id, msg_count)
+SELECT chat_id, (bucket AT TIME ZONE $2)::date, topic_id, user_id, sum(msg_count)
+FROM moved
+GROUP BY 1, 2, 3, 4
+ON CONFLICT (chat_id, day, topic_id, user_id)
+DO UPDATE SET msg_count = activity_daily.msg_count + EXCLUDED.msg_count
+"""
+
+# Итог, топики и пользователи одним проходом по сводкам (GROUPING SETS)
+SQL_STATS = """
+WITH a AS (
+    SELECT topic_id, user_id, msg_count FROM activity_daily
+    WHERE chat_id = $1 AND day >= $2::date AND ($4::bigint IS NULL OR topic_id = $4)
+    UNION ALL
+    SELECT topic_id, user_id, msg_count FROM activity_hourly
+    WHERE chat_id = $1 AND bucket >= $3 AND ($4::bigint IS NULL OR topic_id = $4)
+)
+SELECT GROUPING(topic_id) AS g_topic, GROUPING(user_id) AS g_user,
+       topic_id, user_id, sum(msg_count)::bigint AS cnt
+FROM a
+GROUP BY GROUPING SETS ((), (topic_id), (user_id))
+"""
+
+
+async def rollup_once(conn, batch_rows: int = BATCH_ROWS, lag_seconds: int = LAG_SECONDS) -> int:
+    """Один пакет от водяного знака. Возвращает число учтённых строк raw_updates"""
+    async with conn.transaction():
+        mark = await conn.fetchrow(SQL_LOCK_WATERMARK, WATERMARK)  # блокирует строку знака
+        res = await conn.fetchrow(SQL_ROLLUP, mark["last_id"], mark["last_ts"], float(lag_seconds), batch_rows)
+        if res["n"]:
+            await conn.execute(SQL_ADVANCE, WATERMARK, res["last_id"], res["last_ts"])
+        return res["n"]
+
+
+async def rollup_pending(conn, batch_rows: int = BATCH_ROWS) -> int:
+    """Догоняет журнал пакетами по batch_rows"""
+    total = 0
+    while True:
+        n = await rollup_once(conn, batch_rows)
+        total += n
+        if n < batch_rows:
+            return total
+
+
+def local_midnight(days_ago: int, tz: str, now: datetime.datetime | None = None) -> datetime.datetime:
+    """Начало локального дня days_ago дней назад (aware, в tz)"""
+    now = (now or datetime.datetime.now(datetime.timezone.utc)).astimezone(ZoneInfo(tz))
+    day = now.date() - datetime.timedelta(days=days_ago)
+    return datetime.datetime.combine(day, datetime.time(), tzinfo=ZoneInfo(tz))
+
+
+async def compact(conn, tz: str, keep_days: int = HOURLY_DAYS) -> str:
+    """Часы старше keep_days локальных суток -> activity_daily (граница по полуночи tz)"""
+    return await conn.execute(SQL_COMPACT, local_midnight(keep_days, tz), tz)
+
+
+@dataclass(slots=True)
+class ChatStats:
+    total: int
+    topics: list[tuple[int, int]]  # (topic_id, сообщений), по убыванию
+    users: list[tuple[int, int]]   # (user_id, сообщений), по убыванию
+    days: int
+
+
+async def chat_stats(conn, chat_id: int, tz: str, days: int = 7, topic_id: int | None = None,
+                     top: int = 5) -> ChatStats:
+    """Сводка за последние days локальных суток (включая сегодня) — только по таблицам сводок"""
+    since = local_midnight(days - 1, tz)
+    rows = await conn.fetch(SQL_STATS, chat_id, since.date(), since, topic_id)
+    total, topics, users_ = 0, [], []
+    for r in rows:
+        if r["g_topic"] and r["g_user"]:
+            total = r["cnt"] or 0
+        elif r["g_user"]:
+            topics.append((r["topic_id"], r["cnt"]))
+        else:
+            users_.append((r["user_id"], r["cnt"]))
+    topics.sort(key=lambda x: (-x[1], x[0]))
+    users_.sort(key=lambda x: (-x[1], x[0]))
+    return ChatStats(total=total, topics=topics[:top], users=users_[:top], days=days)
+
+
+async def rollup_loop(get_conn, tz: str, interval: float = ROLLUP_INTERVAL) -> None:
+    """Фоновый цикл: сводки раз в interval секунд, уплотнение — раз в сутки"""
+    loop = asyncio.get_running_loop()
+    next_compact = 0.0
+    while True:
+        try:
+            conn = await get_conn()
+            try:
+                n = await rollup_pending(conn)
+                if loop.time() >= next_compact:
+                    status = await compact(conn, tz)
+                    next_compact = loop.time() + COMPACT_INTERVAL
+                    print(f"ROLLUP compact: {status}")
+            finally:
+                await conn.close()
+            if n:
+                print(f"ROLLUP +{n} rows")
+        except Exception as e:
+            print(f"ROLLUP_WARN: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,67 @@
+"""
+Полнотекстовый поиск (russian) по журналу сообщений и задачам.
+
+Опирается на генерируемые колонки из миграции 0005:
+- raw_updates.text_tsv  — to_tsvector('russian', text), GIN idx_raw_text_tsv;
+- core_task.search_tsv  — title (вес A) + description (вес B), GIN idx_task_search_tsv.
+
+Запрос разбирается websearch_to_tsquery: работают "фраза в кавычках", OR и -минус.
+"""
+from dataclasses import dataclass
+
+PAGE_SIZE = 5
+MAX_QUERY_LEN = 200
+
+SQL_MESSAGES = """
+SELECT id, message_id, topic_id, user_id, text, created_at,
+       ts_rank_cd(text_tsv, q) AS rank
+FROM raw_updates, websearch_to_tsquery('russian', $1) AS q
+WHERE chat_id = $2
+  AND ($3::bigint IS NULL OR topic_id = $3)
+  AND text_tsv @@ q
+  AND LEFT(text, 1) <> '/'
+ORDER BY rank DESC, created_at DESC
+LIMIT $4 OFFSET $5
+"""
+
+SQL_TASKS = """
+SELECT id, title, status, deadline,
+       ts_rank_cd(search_tsv, q) AS rank
+FROM core_task, websearch_to_tsquery('russian', $1) AS q
+WHERE source_chat_id = $2
+  AND ($3::bigint IS NULL OR source_topic_id = $3)
+  AND search_tsv @@ q
+ORDER BY rank DESC, id DESC
+LIMIT $4
+"""
+
+
+def normalize_query(raw: str | None) -> str:
+    """Схлопывает пробелы и ограничивает длину; пустая строка — искать нечего"""
+    return " ".join((raw or "").split())[:MAX_QUERY_LEN]
+
+
+@dataclass(slots=True)
+class SearchPage:
+    messages: list
+    tasks: list
+    page: int
+    has_next: bool
+
+
+async def search(conn, query: str, chat_id: int, topic_id: int | None, page: int = 0,
+                 page_size: int = PAGE_SIZE) -> SearchPage:
+    """
+    Страница результатов: сообщения по релевантности (+1 строка, чтобы знать,
+    есть ли следующая страница); на первой странице — ещё и подходящие задачи.
+    """
+    rows = await conn.fetch(SQL_MESSAGES, query, chat_id, topic_id, page_size + 1, page * page_size)
+    tasks = []
+    if page == 0:
+        tasks = await conn.fetch(SQL_TASKS, query, chat_id, topic_id, 3)
+    return SearchPage(
+        messages=list(rows[:page_size]),
+        tasks=list(tasks),
+        page=page,
+        has_next=len(rows) > page_size,
+    )
@@ -0,0 +1,169 @@
+"""
+Хранилище состояния диалогов (календарь /newtask и /add, выбор в /checklast).
+
+Два уровня:
+- L1 — in-process TTL-кэш (мгновенно, без сети);
+- L2 — Redis, запись сквозная (write-through).
+
+Чтение идёт из L1, при промахе — из L2 с коротким таймаутом. Если Redis
+недоступен или медленный, хранилище переходит в деградированный режим:
+на время COOLDOWN все операции работают только с L1, диалоги не рвутся.
+Бот работает одним polling-процессом, поэтому L1 можно считать источником истины.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable
+
+_TOMBSTONE = object()  # удалено, пока L2 был недоступен — не читать из L2
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш с TTL на запись"""
+
+    def __init__(self, max_items: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.max_items = max_items
+        self._clock = clock
+        self._data: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: str, default=None):
+        item = self._data.get(key)
+        if item is None:
+            return default
+        expires_at, value = item
+        if expires_at <= self._clock():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        self._data[key] = (self._clock() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def pop(self, key: str) -> None:
+        self._data.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class RedisTier:
+    """L2 поверх redis.asyncio; клиент берётся фабрикой, чтобы не создавать его при импорте"""
+
+    def __init__(self, client_factory: Callable[[], Any]):
+        self._factory = client_factory
+
+    @property
+    def client(self):
+        return self._factory()
+
+    async def get(self, key: str) -> str | None:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: str, ttl: int) -> None:
+        await self.client.set(key, value, ex=ttl)
+
+    async def delete(self, *keys: str) -> None:
+        await self.client.delete(*keys)
+
+    async def smembers(self, key: str) -> set[str]:
+        return set(await self.client.smembers(key))
+
+    async def sadd(self, key: str, member: str, ttl: int) -> None:
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.sadd(key, member)
+            pipe.expire(key, ttl)
+            await pipe.execute()
+
+    async def srem(self, key: str, member: str) -> None:
+        await self.client.srem(key, member)
+
+
+class StateStore:
+    """Единый API состояния для хендлеров: L1 (процесс) + L2 (Redis, write-through)"""
+
+    DEFAULT_TTL = 1200  # 20 минут — как у всех диалоговых ключей
+    COOLDOWN = 30.0     # сколько секунд не трогать L2 после ошибки
+
+    def __init__(self, l2=None, l1: TTLCache | None = None, timeout: float = 0.25,
+                 clock: Callable[[], float] = time.monotonic):
+        self.l1 = l1 or TTLCache(clock=clock)
+        self.l2 = l2
+        self.timeout = timeout
+        self._clock = clock
+        self._down_until = 0.0
+
+    @property
+    def degraded(self) -> bool:
+        return self.l2 is None or self._clock() < self._down_until
+
+    async def _l2(self, op: str, *args):
+        """Вызов L2 с таймаутом; при сбое — деградированный режим. Возвращает (ok, result)"""
+        if self.degraded:
+            return False, None
+        try:
+            return True, await asyncio.wait_for(getattr(self.l2, op)(*args), self.timeout)
+        except Exception as e:
+            self._down_until = self._clock() + self.COOLDOWN
+            print(f"STATE_L2_DEGRADED op={op}: {e!r}")
+            return False, None
+
+    # --- значения (JSON) ---------------------------------------------------
+    async def get(self, key: str) -> Any | None:
+        value = self.l1.get(key)
+        if value is _TOMBSTONE:
+            return None
+        if value is not None:
+            return value
+        ok, raw = await self._l2("get", key)
+        if not ok or raw is None:
+            return None
+        value = json.loads(raw)
+        self.l1.set(key, value, self.DEFAULT_TTL)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: int = DEFAULT_TTL) -> None:
+        self.l1.set(key, value, ttl)
+        await self._l2("set", key, json.dumps(value, ensure_ascii=False), ttl)
+
+    async def delete(self, *keys: str) -> None:
+        ok, _ = await self._l2("delete", *keys)
+        for key in keys:
+            if ok:
+                self.l1.pop(key)
+            else:
+                self.l1.set(key, _TOMBSTONE, self.DEFAULT_TTL)
+
+    # --- множества (выбор в /checklast) -------------------------------------
+    async def members(self, key: str) -> set[str]:
+        value = self.l1.get(key)
+        if value is _TOMBSTONE:
+            return set()
+        if value is not None:
+            return set(value)
+        ok, members = await self._l2("smembers", key)
+        if not ok:
+            return set()
+        self.l1.set(key, frozenset(members), self.DEFAULT_TTL)
+        return set(members)
+
+    async def toggle(self, key: str, member: str, ttl: int = DEFAULT_TTL) -> bool:
+        """Переключает элемент множества. Возвращает True, если элемент теперь выбран"""
+        current = await self.members(key)
+        selected = member not in current
+        if selected:
+            current.add(member)
+        else:
+            current.discard(member)
+        self.l1.set(key, frozenset(current), ttl)
+        if selected:
+            await self._l2("sadd", key, member, ttl)
+        else:
+            await self._l2("srem", key, member)
+        return selected
@@ -0,0 +1,114 @@
+"""
+Поток изменений core_task из Postgres: LISTEN task_changed.
+
+Триггер core_task_notify (миграция 0014) на INSERT/DELETE и на UPDATE видимых
+полей (заголовок, статус, дедлайн, ответственный, проект, чат/топик) шлёт
+pg_notify с id задачи и «областью» до и после изменения. Так кэши бота узнают
+о любых правках — из команд, эскалации и из админки — без опроса таблицы.
+
+Слушатель держит отдельное соединение (LISTEN не переживает get_conn/close),
+копит уведомления TASK_CHANGES_WINDOW секунд (services.coalesce) и отдаёт их
+пачкой подписчикам. Ключ у всех уведомлений один, поэтому при непрерывном
+потоке пачка всё равно уходит не реже TASK_CHANGES_MAX_DELAY секунд и сразу по
+набору TASK_CHANGES_MAX_BATCH уведомлений. Уведомления, пришедшие во время обрыва соединения,
+теряются — подписчики должны переживать это (TTL кэша).
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+from dataclasses import dataclass
+
+from services.coalesce import CoalescingBuffer
+
+CHANNEL = "task_changed"
+WINDOW = float(os.getenv("TASK_CHANGES_WINDOW", "0.2"))
+MAX_DELAY = float(os.getenv("TASK_CHANGES_MAX_DELAY", "1.0"))
+MAX_BATCH = int(os.getenv("TASK_CHANGES_MAX_BATCH", "500"))
+RECONNECT_SECONDS = 5.0
+KEEPALIVE_SECONDS = 60.0
+
+
+@dataclass(frozen=True, slots=True)
+class TaskScope:
+    """Где задача видна: ответственный (telegram_id и username), чат/топик, проект, статус"""
+    user_tg: int | None
+    username: str | None
+    chat_id: int | None
+    topic_id: int | None
+    project_id: int | None
+    status: str | None
+
+
+@dataclass(frozen=True, slots=True)
+class TaskChange:
+    task_id: int
+    old: TaskScope | None  # None — задача создана
+    new: TaskScope | None  # None — задача удалена
+
+    def scopes(self) -> list[TaskScope]:
+        return [s for s in (self.old, self.new) if s is not None]
+
+
+def parse_payload(payload: str) -> TaskChange:
+    data = json.loads(payload)
+    old, new = data.get("old"), data.get("new")
+    return TaskChange(
+        task_id=data["id"],
+        old=TaskScope(*old) if old else None,
+        new=TaskScope(*new) if new else None,
+    )
+
+
+class TaskChangeListener:
+    """LISTEN task_changed -> подписчики async fn(list[TaskChange]) пачками"""
+
+    def __init__(self, get_conn, window: float = WINDOW, max_delay: float = MAX_DELAY, max_batch: int = MAX_BATCH):
+        self._get_conn = get_conn
+        self._subscribers: list = []
+        self._buffer = CoalescingBuffer(
+            self._dispatch, window, key=lambda _: CHANNEL, max_delay=max_delay, max_items=max_batch,
+        )
+
+    def subscribe(self, fn) -> None:
+        self._subscribers.append(fn)
+
+    async def _dispatch(self, changes: list[TaskChange]) -> None:
+        for fn in self._subscribers:
+            try:
+                await fn(changes)
+            except Exception as e:
+                print(f"TASK_CHANGES_WARN {getattr(fn, '__name__', fn)}: {e}")
+
+    def _on_notify(self, conn, pid, channel, payload) -> None:
+        try:
+            self._buffer.add(parse_payload(payload))
+        except Exception as e:
+            print(f"TASK_CHANGES_WARN bad payload: {e}")
+
+    async def run(self) -> None:
+        """Держит LISTEN-соединение; после обрыва переподключается"""
+        while True:
+            conn = None
+            try:
+                conn = await self._get_conn()
+                closed = asyncio.Event()
+                conn.add_termination_listener(lambda _c: closed.set())
+                await conn.add_listener(CHANNEL, self._on_notify)
+                print("TASK_CHANGES listening")
+                while not closed.is_set():
+                    try:
+                        await asyncio.wait_for(closed.wait(), KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        await conn.execute("SELECT 1", timeout=10)  # тихий обрыв сети -> исключение и переподключение
+                print("TASK_CHANGES connection lost")
+            except Exception as e:
+                print(f"TASK_CHANGES_WARN: {e}")
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+            await asyncio.sleep(RECONNECT_SECONDS)
+
+    async def drain(self) -> None:
+        await self._buffer.drain()
@@ -0,0 +1,124 @@
+"""
+Поток задач по проектам (миграция 0016): сколько задач вошло/вышло из каждого
+статуса за день, сколько времени они в нём провели, throughput и cycle time.
+
+task_events (смены статуса, пишет триггер) читается инкрементально от водяного
+знака rollup_watermark['task_flow'] — как raw_updates в services.rollups: пакет
+агрегируется в task_flow_daily, знак сдвигается в той же транзакции. Время в
+статусе известно из самого события (ts - status_since), поэтому сводка не
+перечитывает историю задачи. Дни — в TIMEZONE.
+
+Средние: seconds_in / exited — сколько задача сидит в статусе; для DONE
+entered — throughput, cycle_seconds / entered — от создания до закрытия.
+"""
+from __future__ import annotations
+
+import asyncio
+import datetime
+import os
+from dataclasses import dataclass
+
+from services.rollups import SQL_ADVANCE, SQL_LOCK_WATERMARK
+
+WATERMARK = "task_flow"
+BATCH_ROWS = int(os.getenv("TASK_FLOW_BATCH_ROWS", "10000"))
+LAG_SECONDS = 30
+FLOW_INTERVAL = float(os.getenv("TASK_FLOW_INTERVAL_SECONDS", "300"))
+
+SQL_FLOW = """
+WITH src AS (
+    SELECT id, COALESCE(project_id, 0) AS project_id, (ts AT TIME ZONE $4)::date AS day,
+           from_status, to_status, ts, status_since, task_created_at
+    FROM task_events
+    WHERE id > $1 AND ts < now() - make_interval(secs => $2)
+    ORDER BY id
+    LIMIT $3
+), moves AS (
+    SELECT project_id, day, to_status AS status, 1 AS entered, 0 AS exited, 0::float8 AS seconds_in,
+           CASE WHEN to_status = 'DONE' AND task_created_at IS NOT NULL
+                THEN EXTRACT(EPOCH FROM ts - task_created_at)::float8 ELSE 0 END AS cycle_seconds
+    FROM src
+    UNION ALL
+    SELECT project_id, day, from_status, 0, 1,
+           GREATEST(EXTRACT(EPOCH FROM ts - status_since)::float8, 0), 0
+    FROM src
+    WHERE from_status IS NOT NULL AND status_since IS NOT NULL
+), agg AS (
+    INSERT INTO task_flow_daily (project_id, day, status, entered, exited, seconds_in, cycle_seconds)
+    SELECT project_id, day, status, sum(entered), sum(exited), sum(seconds_in), sum(cycle_seconds)
+    FROM moves
+    GROUP BY 1, 2, 3
+    ON CONFLICT (project_id, day, status) DO UPDATE
+    SET entered = task_flow_daily.entered + EXCLUDED.entered,
+        exited = task_flow_daily.exited + EXCLUDED.exited,
+        seconds_in = task_flow_daily.seconds_in + EXCLUDED.seconds_in,
+        cycle_seconds = task_flow_daily.cycle_seconds + EXCLUDED.cycle_seconds
+)
+SELECT count(*) AS n, max(id) AS last_id FROM src
+"""
+
+SQL_PROJECT_FLOW = """
+SELECT status, sum(entered)::bigint AS entered, sum(exited)::bigint AS exited,
+       sum(seconds_in) AS seconds_in, sum(cycle_seconds) AS cycle_seconds
+FROM task_flow_daily
+WHERE project_id = $1 AND day >= $2
+GROUP BY status
+"""
+
+
+async def flow_once(conn, tz: str, batch_rows: int = BATCH_ROWS, lag_seconds: int = LAG_SECONDS) -> int:
+    """Один пакет событий от водяного знака. Возвращает число учтённых событий"""
+    async with conn.transaction():
+        mark = await conn.fetchrow(SQL_LOCK_WATERMARK, WATERMARK)  # блокирует строку знака
+        res = await conn.fetchrow(SQL_FLOW, mark["last_id"], float(lag_seconds), batch_rows, tz)
+        if res["n"]:
+            await conn.execute(SQL_ADVANCE, WATERMARK, res["last_id"], None)
+        return res["n"]
+
+
+async def flow_pending(conn, tz: str, batch_rows: int = BATCH_ROWS) -> int:
+    total = 0
+    while True:
+        n = await flow_once(conn, tz, batch_rows)
+        total += n
+        if n < batch_rows:
+            return total
+
+
+@dataclass(slots=True)
+class StatusFlow:
+    status: str
+    entered: int
+    exited: int
+    avg_seconds_in: float | None   # среднее время в статусе у вышедших
+    avg_cycle_seconds: float | None  # для DONE: от создания до закрытия
+
+
+async def project_flow(conn, project_id: int | None, since: datetime.date) -> dict[str, StatusFlow]:
+    """Сводка по проекту с даты since — только по task_flow_daily"""
+    out = {}
+    for r in await conn.fetch(SQL_PROJECT_FLOW, project_id or 0, since):
+        out[r["status"]] = StatusFlow(
+            status=r["status"],
+            entered=r["entered"],
+            exited=r["exited"],
+            avg_seconds_in=r["seconds_in"] / r["exited"] if r["exited"] else None,
+            avg_cycle_seconds=r["cycle_seconds"] / r["entered"] if r["status"] == "DONE" and r["entered"] else None,
+        )
+    return out
+
+
+async def flow_loop(get_conn, tz: str, interval: float = FLOW_INTERVAL) -> None:
+    """Фоновая агрегация task_events -> task_flow_daily"""
+    while True:
+        try:
+            conn = await get_conn()
+            try:
+                n = await flow_pending(conn, tz)
+            finally:
+                await conn.close()
+            if n:
+                print(f"TASK_FLOW events={n}")
+        except Exception as e:
+            print(f"TASK_FLOW_WARN: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,217 @@
+"""
+Единый сервис создания задач (core_task).
+
+Все пути создания (/newtask, /add, выбор времени в календаре, /checklast)
+идут через TaskService:
+- автор и проект резолвятся подзапросами внутри INSERT (без отдельных SELECT);
+- повторы одного запроса на соединении берёт кэш подготовленных выражений asyncpg;
+- пачка задач вставляется одним INSERT ... SELECT FROM unnest(...);
+- (source_chat_id, source_message_id) — ключ идемпотентности: повторное
+  нажатие возвращает id уже созданной задачи вместо дубля; (xmax = 0) в
+  RETURNING отличает созданные от уже существовавших.
+
+Смена статуса (/closetask, /status, меню закрытия) — тоже здесь: пачка id
+одним UPDATE ... WHERE id = ANY($1) RETURNING id; чего нет в RETURNING — не найдено.
+Кто сменил — app.actor в той же транзакции, его читает триггер task_events (0016).
+"""
+from dataclasses import dataclass
+from datetime import datetime
+
+
+@dataclass(slots=True)
+class NewTask:
+    title: str
+    description: str = ""
+    responsible_user_id: int | None = None
+    responsible_username: str | None = None
+    deadline: datetime | None = None
+    author_telegram_id: int | None = None
+    source_chat_id: int | None = None
+    source_message_id: int | None = None
+    source_topic_id: int | None = None
+
+    def key(self) -> tuple[int, int] | None:
+        if self.source_chat_id is None or self.source_message_id is None:
+            return None
+        return (self.source_chat_id, self.source_message_id)
+
+
+@dataclass(slots=True)
+class Created:
+    id: int
+    created: bool  # False — задача по этому сообщению уже была
+
+
+TITLE_MAX = 256
+
+# Повторная вставка по ключу источника — no-op UPDATE, чтобы RETURNING отдал
+# id существующей строки; xmax = 0 только у реально вставленных строк.
+_ON_CONFLICT = """
+ON CONFLICT (source_chat_id, source_message_id)
+DO UPDATE SET updated_at = core_task.updated_at
+"""
+
+SQL_INSERT_ONE = """
+INSERT INTO core_task (
+    title, description, responsible_user_id, responsible_username,
+    author_user_id, project_id, deadline,
+    status, created_at, updated_at,
+    source_chat_id, source_message_id, source_topic_id
+)
+VALUES (
+    $1::varchar, $2::text, $3::bigint, $4::varchar,
+    (SELECT id FROM core_user WHERE telegram_id = $5::bigint),
+    (SELECT project_id FROM core_tggroup WHERE telegram_id = $6::bigint),
+    $7::timestamp with time zone,
+    'TODO', NOW(), NOW(),
+    $6::bigint, $8::bigint, $9::bigint
+)
+""" + _ON_CONFLICT + """
+RETURNING id, (xmax = 0) AS created
+"""
+
+SQL_INSERT_MANY = """
+INSERT INTO core_task (
+    title, description, responsible_user_id, responsible_username,
+    author_user_id, project_id, deadline,
+    status, created_at, updated_at,
+    source_chat_id, source_message_id, source_topic_id
+)
+SELECT t.title, t.description, t.responsible_user_id, t.responsible_username,
+       (SELECT id FROM core_user WHERE telegram_id = t.author_tg),
+       (SELECT project_id FROM core_tggroup WHERE telegram_id = t.chat_id),
+       t.deadline,
+       'TODO', NOW(), NOW(),
+       t.chat_id, t.message_id, t.topic_id
+FROM unnest(
+    $1::varchar[], $2::text[], $3::bigint[], $4::varchar[],
+    $5::bigint[], $6::bigint[], $7::timestamptz[], $8::bigint[], $9::bigint[]
+) WITH ORDINALITY AS t(
+    title, description, responsible_user_id, responsible_username,
+    author_tg, chat_id, deadline, message_id, topic_id, ord
+)
+ORDER BY t.ord
+""" + _ON_CONFLICT + """
+RETURNING id, source_chat_id, source_message_id, (xmax = 0) AS created
+"""
+
+
+STATUSES = ("TODO", "IN_PROGRESS", "ON_REVIEW", "DONE", "ARCHIVED")
+MAX_BULK = 100  # больше — отказ с подсказкой, а не молчаливая обрезка
+MAX_TASK_ID = 2**63 - 1  # bigint: больше asyncpg не передаст
+
+# updated_at не трогаем, если статус уже такой (повторное закрытие)
+SQL_SET_STATUS = """
+UPDATE core_task
+   SET status = $2,
+       updated_at = CASE WHEN status = $2 THEN updated_at ELSE NOW() END
+ WHERE id = ANY($1::bigint[])
+RETURNING id
+"""
+
+SQL_SET_ACTOR = "SELECT set_config('app.actor', $1, true)"
+
+
+@dataclass(slots=True)
+class StatusResult:
+    updated: list[int]
+    missing: list[int]
+
+
+def parse_task_ids(args: str | None) -> tuple[list[int], list[str]]:
+    """
+    '#1 #2, 3 DONE' -> ([1, 2, 3], ['DONE']): id без повторов в порядке ввода и прочие слова.
+    Числа вне 1..MAX_TASK_ID — не id, а прочие слова (обработчик ответит подсказкой)
+    """
+    ids: list[int] = []
+    rest: list[str] = []
+    for token in (args or "").replace(",", " ").split():
+        raw = token.lstrip("#")
+        if raw.isdigit() and 0 < int(raw) <= MAX_TASK_ID:
+            if int(raw) not in ids:
+                ids.append(int(raw))
+        else:
+            rest.append(token)
+    return ids, rest
+
+
+def _row_args(t: NewTask) -> tuple:
+    return (
+        (t.title or "")[:TITLE_MAX],
+        t.description or "",
+        t.responsible_user_id,
+        t.responsible_username or "unknown",
+        t.author_telegram_id,
+        t.source_chat_id,
+        t.deadline,
+        t.source_message_id,
+        t.source_topic_id,
+    )
+
+
+class TaskService:
+    """Создание задач поверх одного asyncpg-соединения"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    async def create(self, task: NewTask) -> Created | None:
+        """Создаёт одну задачу; по ключу источника может вернуться уже существующая (created=False)"""
+        row = await self.conn.fetchrow(SQL_INSERT_ONE, *_row_args(task))
+        return Created(row["id"], row["created"]) if row else None
+
+    async def create_many(self, tasks: list[NewTask]) -> list[Created | None]:
+        """
+        Создаёт пачку задач одним запросом. Результат выровнен по входному списку;
+        дубликаты по ключу источника внутри пачки получают одну и ту же задачу.
+        """
+        if not tasks:
+            return []
+        if len(tasks) == 1:
+            return [await self.create(tasks[0])]
+
+        # ON CONFLICT DO UPDATE не может затронуть одну строку дважды за запрос
+        unique: list[NewTask] = []
+        seen: set[tuple[int, int]] = set()
+        for t in tasks:
+            k = t.key()
+            if k is not None:
+                if k in seen:
+                    continue
+                seen.add(k)
+            unique.append(t)
+
+        columns = list(zip(*(_row_args(t) for t in unique)))
+        rows = await self.conn.fetch(SQL_INSERT_MANY, *(list(c) for c in columns))
+
+        by_key = {
+            (r["source_chat_id"], r["source_message_id"]): Created(r["id"], r["created"])
+            for r in rows if r["source_message_id"] is not None
+        }
+        # строки без ключа источника сопоставляем по порядку RETURNING
+        unkeyed = iter(Created(r["id"], r["created"]) for r in rows if r["source_message_id"] is None)
+        return [by_key.get(t.key()) if t.key() is not None else next(unkeyed, None) for t in tasks]
+
+    async def set_status(self, task_ids: list[int], status: str, actor: str | None = None) -> StatusResult:
+        """
+        Один UPDATE на пачку; возвращает обновлённые и не найденные id (в порядке ввода).
+        actor ('tg:<telegram_id>') попадает в task_events
+        """
+        if status not in STATUSES:
+            raise ValueError(f"unknown status {status}")
+        ids = list(dict.fromkeys(task_ids))
+        if len(ids) > MAX_BULK:
+            raise ValueError(f"too many tasks: {len(ids)} > {MAX_BULK}")
+        if not ids:
+            return StatusResult([], [])
+        if actor:
+            async with self.conn.transaction():
+                await self.conn.execute(SQL_SET_ACTOR, actor)
+                rows = await self.conn.fetch(SQL_SET_STATUS, ids, status)
+        else:
+            rows = await self.conn.fetch(SQL_SET_STATUS, ids, status)
+        found = {r["id"] for r in rows}
+        return StatusResult(
+            updated=[i for i in ids if i in found],
+            missing=[i for i in ids if i not in found],
+        )
@@ -0,0 +1,76 @@
+"""
+Каталог пользователей бота: username <-> строка core_user в памяти процесса.
+
+Двунаправленный LRU с TTL: username -> UserRow и telegram_id -> username.
+Пополняется при ingest-апсерте (log_raw_update) и при промахах поиска; если
+пользователь сменил username, старое имя вытесняется через обратный индекс.
+Отрицательные ответы не кэшируются — пользователь мог появиться через админку.
+
+Промах идёт в БД по функциональному индексу idx_user_username_lower
+(миграция 0006), поэтому сравнение строго lower(username) = $1.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+
+from services.state import TTLCache
+
+SQL_BY_USERNAME = "SELECT id, username, telegram_id FROM core_user WHERE lower(username) = $1"
+
+
+@dataclass(frozen=True, slots=True)
+class UserRow:
+    id: int
+    username: str
+    telegram_id: int
+
+    @property
+    def display(self) -> str:
+        return self.username or f"id:{self.telegram_id}"
+
+
+def normalize_username(username: str | None) -> str:
+    return (username or "").lstrip("@").strip().lower()
+
+
+class UserDirectory:
+    TTL = 600  # 10 минут: правки из админки доживают до TTL
+
+    def __init__(self, max_items: int = 5000):
+        self._by_username = TTLCache(max_items=max_items)
+        self._by_tg = TTLCache(max_items=max_items)
+
+    def get(self, username: str) -> UserRow | None:
+        return self._by_username.get(normalize_username(username))
+
+    def put(self, row: UserRow) -> None:
+        key = normalize_username(row.username)
+        old = self._by_tg.get(row.telegram_id)
+        if old is not None and old != key:
+            self._by_username.pop(old)  # username сменился
+        if key:
+            self._by_username.set(key, row, self.TTL)
+            self._by_tg.set(row.telegram_id, key, self.TTL)
+        else:
+            self._by_tg.pop(row.telegram_id)
+
+    def put_record(self, record) -> UserRow | None:
+        """Из строки asyncpg (id, username, telegram_id)"""
+        if record is None:
+            return None
+        row = UserRow(record["id"], record["username"] or "", record["telegram_id"])
+        self.put(row)
+        return row
+
+    async def lookup(self, conn, username: str | None) -> UserRow | None:
+        key = normalize_username(username)
+        if not key:
+            return None
+        row = self._by_username.get(key)
+        if row is not None:
+            return row
+        return self.put_record(await conn.fetchrow(SQL_BY_USERNAME, key))
+
+
+users = UserDirectory(max_items=int(os.getenv("USER_CACHE_SIZE", "5000")))
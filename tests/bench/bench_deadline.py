@@ -0,0 +1,54 @@
+"""
+Микробенчмарк парсера дедлайнов.
+
+Запуск: python tests/bench/bench_deadline.py
+Печатает parses/sec для:
+  - cold   — каждый вызов без LRU-кэша (токенизация + грамматика);
+  - warm   — повторяющиеся фразы из кэша.
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'bot'))
+
+from services.datetime import _scan, find_deadline
+
+TZ = "Europe/Moscow"
+PHRASES = [
+    "Подготовить отчёт для клиента завтра в 10:30",
+    "Созвон с подрядчиком в пятницу",
+    "Сдать макеты 15 марта",
+    "Проверить правки через 2 дня",
+    "Залить билд 15.03 в 18:00",
+    "Купить молоко",
+    "Обновить презентацию к пт в 7 вечера",
+    "Согласовать смету через неделю в 10",
+]
+
+
+def _bench(name: str, fn, rounds: int) -> None:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for p in PHRASES:
+            fn(p)
+    dt = time.perf_counter() - t0
+    n = rounds * len(PHRASES)
+    print(f"{name:<8} {n / dt:>12,.0f} parses/sec  ({n} parses, {dt:.3f}s)")
+
+
+def _cold(text: str):
+    _scan.cache_clear()
+    return find_deadline(text, TZ)
+
+
+def _warm(text: str):
+    return find_deadline(text, TZ)
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    _bench("cold", _cold, rounds)
+    _scan.cache_clear()
+    _bench("warm", _warm, rounds)
+    print(f"cache: {_scan.cache_info()}")
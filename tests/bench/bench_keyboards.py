@@ -0,0 +1,36 @@
+"""
+Микробенчмарк клавиатур календаря и выбора времени.
+
+Запуск: python tests/bench/bench_keyboards.py
+Сравнивает построение с нуля (_render_*) и кэшированные build_*.
+"""
+import os
+import sys
+import time
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'bot'))
+
+from handlers.calendar import (
+    _render_calendar_kb, _render_time_kb, build_calendar_kb, build_time_kb,
+)
+
+TZ = ZoneInfo("Europe/Moscow")
+
+
+def _bench(name: str, fn, rounds: int) -> None:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    dt = time.perf_counter() - t0
+    print(f"{name:<16} {rounds / dt:>12,.0f} ops/sec  ({dt * 1e6 / rounds:.1f} µs/op)")
+
+
+if __name__ == "__main__":
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    now = datetime.now(TZ)
+    _bench("calendar:render", lambda: _render_calendar_kb(now.year, now.month, now.date()), rounds)
+    _bench("calendar:cached", lambda: build_calendar_kb(now), rounds)
+    _bench("time:render", lambda: _render_time_kb(30), rounds)
+    _bench("time:cached", lambda: build_time_kb(30), rounds)
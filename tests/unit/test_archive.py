@@ -0,0 +1,160 @@
+"""
+Тесты холодного архива raw_updates (сегменты zstd + разреженный индекс)
+"""
+
+import datetime
+import json
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.archive import ArchiveReader, SegmentReader, SegmentWriter, archive_partition
+from services.payloads import PayloadCodec
+
+UTC = datetime.timezone.utc
+T0 = datetime.datetime(2025, 3, 1, tzinfo=UTC)
+
+
+def _row(i, chat_id, minutes, text=None, topic_id=None):
+    return {
+        "id": i, "chat_id": chat_id, "message_id": i, "user_id": 7, "username": "u",
+        "text": text if text is not None else f"msg {i}", "topic_id": topic_id, "payload": {"n": i}, "media": None,
+        "created_at": (T0 + datetime.timedelta(minutes=minutes)).isoformat(),
+    }
+
+
+def _segment(path, rows, block_rows=3):
+    w = SegmentWriter(str(path), block_rows=block_rows)
+    for r in sorted(rows, key=lambda r: (r["chat_id"], r["created_at"])):
+        w.add(r)
+    return w.close()
+
+
+class TestSegments:
+
+    def test_roundtrip_and_block_pruning(self, tmp_path):
+        rows = [_row(i, -100 - (i % 3), i) for i in range(30)]
+        path = _segment(tmp_path / "raw_updates_p202503.seg", rows)
+        with SegmentReader(path) as seg:
+            assert seg.rows == 30
+            got = list(seg.scan(-101))
+            assert [r["id"] for r in got] == [i for i in range(30) if -100 - (i % 3) == -101]
+            # 10 строк чата лежат в 4 блоках из 10 — остальные не распаковываем
+            assert len(seg._candidate_blocks(-101, float("-inf"), float("inf"))) == 4
+
+            since = T0 + datetime.timedelta(minutes=10)
+            until = T0 + datetime.timedelta(minutes=20)
+            window = [r["id"] for r in seg.scan(-101, since, until)]
+            assert window == [10, 13, 16, 19]
+            assert [r["id"] for r in seg.scan(-101, since, until, reverse=True)] == [19, 16, 13, 10]
+            assert got[0]["payload"] == {"n": 1}
+
+    def test_unsorted_rows_rejected(self, tmp_path):
+        w = SegmentWriter(str(tmp_path / "x.seg"))
+        w.add(_row(1, -100, 5))
+        with pytest.raises(ValueError):
+            w.add(_row(2, -100, 1))
+        w.abort()
+        assert not os.listdir(tmp_path)
+
+    def test_latest_across_segments(self, tmp_path):
+        _segment(tmp_path / "raw_updates_p202502.seg", [_row(1, -100, -100), _row(2, -100, -50, text="/cmd")])
+        _segment(tmp_path / "raw_updates_p202503.seg", [_row(3, -100, 10, topic_id=5), _row(4, -100, 20)])
+        reader = ArchiveReader(str(tmp_path))
+        assert [r["id"] for r in reader.latest(-100, 10)] == [4, 3, 1]
+        assert [r["id"] for r in reader.latest(-100, 2)] == [4, 3]
+        assert [r["id"] for r in reader.latest(-100, 10, topic_id=5)] == [3]
+
+
+class FakeTx:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __aiter__(self):
+        self._it = iter(self.rows)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeConn:
+    def __init__(self, rows, count=None):
+        self.rows = rows
+        self.count = len(rows) if count is None else count
+        self.executed = []
+
+    def transaction(self):
+        return FakeTx()
+
+    async def fetch(self, sql):
+        return []  # raw_payload_dicts: словарей нет
+
+    def cursor(self, sql, prefetch=None):
+        return FakeCursor(self.rows)
+
+    async def fetchval(self, sql):
+        return self.count
+
+    async def execute(self, sql):
+        self.executed.append(sql)
+
+
+class TestArchivePartition:
+
+    def _db_rows(self, codec=None):
+        rows = []
+        for i in range(5):
+            r = _row(i, -100, i)
+            r["created_at"] = datetime.datetime.fromisoformat(r["created_at"])
+            r["payload"] = json.dumps(r["payload"])
+            r["dict_id"], r["body"] = codec.encode({"message_id": i}) if codec and i % 2 == 0 else (None, None)
+            rows.append(r)
+        return rows
+
+    @pytest.mark.asyncio
+    async def test_archive_then_drop(self, tmp_path):
+        conn = FakeConn(self._db_rows())
+        path = await archive_partition(conn, "raw_updates_p202503", str(tmp_path), block_rows=2)
+        assert conn.executed == [
+            'DELETE FROM raw_payloads WHERE raw_id IN (SELECT id FROM "raw_updates_p202503")',
+            'DROP TABLE "raw_updates_p202503"',
+        ]
+        with SegmentReader(path) as seg:
+            assert [r["id"] for r in seg.scan(-100)] == [0, 1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_payloads_go_into_segment(self, tmp_path):
+        codec = PayloadCodec()
+        conn = FakeConn(self._db_rows(codec))
+        path = await archive_partition(conn, "raw_updates_p202503", str(tmp_path), payload_codec=codec)
+        with SegmentReader(path) as seg:
+            assert [r.get("update") for r in seg.scan(-100)] == [
+                {"message_id": 0}, None, {"message_id": 2}, None, {"message_id": 4},
+            ]
+
+    @pytest.mark.asyncio
+    async def test_count_mismatch_keeps_table(self, tmp_path):
+        conn = FakeConn(self._db_rows(), count=6)
+        with pytest.raises(RuntimeError):
+            await archive_partition(conn, "raw_updates_p202503", str(tmp_path))
+        assert conn.executed == []
+        assert os.listdir(tmp_path) == []
+
+    @pytest.mark.asyncio
+    async def test_rejects_foreign_tables(self, tmp_path):
+        with pytest.raises(ValueError):
+            await archive_partition(FakeConn([]), "core_task", str(tmp_path))
@@ -0,0 +1,95 @@
+"""
+Тесты закреплённой доски задач топика
+"""
+
+import asyncio
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from aiogram.exceptions import TelegramBadRequest
+
+from services.boards import BoardManager, board_key, content_hash, render
+from services.task_changes import TaskChange, TaskScope
+
+
+def _rows(n, total=None):
+    return [{"id": i, "title": f"Задача {i}", "status": "TODO", "deadline": None,
+             "responsible_username": "ivan", "total": total or n} for i in range(1, n + 1)]
+
+
+def _manager(rows, state=None, window=0.01):
+    conn = AsyncMock()
+    conn.fetch.return_value = rows
+    redis = AsyncMock()
+    redis.hgetall.return_value = state or {}
+    edit = AsyncMock()
+    return BoardManager(lambda: redis, AsyncMock(return_value=conn), edit, window=window), redis, conn, edit
+
+
+def _change(task_id, chat=-100, topic=7):
+    return TaskChange(task_id, None, TaskScope(None, "ivan", chat, topic, None, "TODO"))
+
+
+class TestRender:
+
+    def test_lists_and_mentions_rest(self):
+        text = render(_rows(2, total=5))
+        assert "⚪ #1 «Задача 1» — @ivan" in text and text.endswith("…и ещё 3")
+
+    def test_empty(self):
+        assert "Нет открытых задач" in render([])
+
+
+class TestRefresh:
+
+    @pytest.mark.asyncio
+    async def test_unchanged_content_skips_edit(self):
+        rows = _rows(2)
+        manager, redis, _, edit = _manager(rows, {b"message_id": b"55", b"hash": content_hash(render(rows)).encode()})
+        assert await manager.refresh(-100, 7) is False
+        edit.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_changed_content_edits_and_stores_hash(self):
+        rows = _rows(3)
+        manager, redis, _, edit = _manager(rows, {b"message_id": b"55", b"hash": b"old"})
+        assert await manager.refresh(-100, 7) is True
+        assert edit.await_args.args[:2] == (-100, 55)
+        redis.hset.assert_awaited_once_with(board_key(-100, 7), "hash", content_hash(render(rows)))
+
+    @pytest.mark.asyncio
+    async def test_no_board_no_query(self):
+        manager, _, conn, edit = _manager(_rows(1))
+        assert await manager.refresh(-100, 7) is False
+        conn.fetch.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_deleted_message_drops_board(self):
+        manager, redis, _, edit = _manager(_rows(1), {b"message_id": b"55", b"hash": b"old"})
+        edit.side_effect = TelegramBadRequest(method=MagicMock(), message="Bad Request: message to edit not found")
+        assert await manager.refresh(-100, 7) is False
+        redis.delete.assert_awaited_once_with(board_key(-100, 7))
+
+
+class TestDebounce:
+
+    @pytest.mark.asyncio
+    async def test_burst_of_creations_is_one_edit(self):
+        manager, redis, conn, edit = _manager(_rows(20), {b"message_id": b"55", b"hash": b"old"})
+        await manager.on_changes([_change(i) for i in range(1, 21)])
+        await asyncio.sleep(0.05)
+        await manager.drain()
+        assert conn.fetch.await_count == 1 and edit.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_create_stores_state(self):
+        manager, redis, _, _ = _manager(_rows(1))
+        send = AsyncMock(return_value=MagicMock(message_id=77))
+        assert await manager.create(-100, 7, send) == 77
+        assert redis.hset.await_args.kwargs["mapping"]["message_id"] == 77
+        send_shadow = AsyncMock(return_value=None)
+        assert await manager.create(-100, 7, send_shadow) is None
@@ -0,0 +1,42 @@
+"""
+Тесты кэша клавиатур календаря и выбора времени
+"""
+
+import pytest
+from datetime import date, datetime
+from zoneinfo import ZoneInfo
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+import handlers.calendar as cal
+
+
+class TestKeyboardCache:
+    """Клавиатуры строятся один раз на ключ и не меняются"""
+
+    def test_time_kb_is_cached_and_frozen(self):
+        kb = cal.build_time_kb(30)
+        assert cal.build_time_kb(30) is kb
+        assert len(kb.inline_keyboard) == 48 // 4 + 2
+        with pytest.raises(Exception):
+            kb.inline_keyboard[0][0].text = "00:15"
+
+    def test_calendar_kb_cached_per_month(self):
+        tz = ZoneInfo("Europe/Moscow")
+        d = datetime(2030, 5, 1, tzinfo=tz)
+        kb = cal.build_calendar_kb(d)
+        assert cal.build_calendar_kb(d.replace(day=20)) is kb
+        assert cal.build_calendar_kb(datetime(2030, 6, 1, tzinfo=tz)) is not kb
+
+    def test_calendar_rolls_over_at_midnight(self):
+        """Смена локальной даты меняет ключ — «сегодня» и прошедшие дни пересчитываются"""
+        before = cal._calendar_kb_cached(2030, 5, date(2030, 5, 10), "Europe/Moscow")
+        after = cal._calendar_kb_cached(2030, 5, date(2030, 5, 11), "Europe/Moscow")
+        assert before is not after
+        cells = [b for row in after.inline_keyboard for b in row]
+        assert any(b.text == "[11]" for b in cells)
+        assert any(b.callback_data == "cal:2030-05-10" for b in
+                   (b for row in before.inline_keyboard for b in row))
+        assert not any(b.callback_data == "cal:2030-05-10" and b.text == "10" for b in cells)
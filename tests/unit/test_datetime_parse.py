@@ -10,7 +10,7 @@ import os
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
 
-from services.datetime import parse_deadline
+from services.datetime import parse_deadline, find_deadline, strip_deadline
 
 
 class TestDeadlineParsing:
@@ -82,4 +82,79 @@ class TestDeadlineParsing:
         result = parse_deadline("2025-02-01 12:00", "UTC")
         assert result is not None
         assert result.tzinfo == ZoneInfo("UTC")
-        assert result.hour == 12
\ No newline at end of file
+        assert result.hour == 12
+
+
+# Понедельник, 19 октября 2026, полдень
+NOW = datetime(2026, 10, 19, 12, 0, tzinfo=ZoneInfo("Europe/Moscow"))
+
+
+class TestRussianDeadlines:
+    """Тесты русской грамматики дедлайнов (README: Парсинг дат)"""
+
+    @pytest.mark.parametrize("phrase, expected", [
+        ("сегодня", (2026, 10, 19, 23, 59)),
+        ("завтра", (2026, 10, 20, 23, 59)),
+        ("послезавтра", (2026, 10, 21, 23, 59)),
+        ("через час", (2026, 10, 19, 13, 0)),
+        ("через 2 дня", (2026, 10, 21, 23, 59)),
+        ("через неделю", (2026, 10, 26, 23, 59)),
+        ("в понедельник", (2026, 10, 19, 23, 59)),
+        ("в пятницу", (2026, 10, 23, 23, 59)),
+        ("15 марта", (2027, 3, 15, 23, 59)),
+        ("1 января 2025", (2025, 1, 1, 23, 59)),
+        ("15.03", (2027, 3, 15, 23, 59)),
+        ("01.01.2025", (2025, 1, 1, 23, 59)),
+        ("в 14:00", (2026, 10, 19, 14, 0)),
+        ("завтра в 10:30", (2026, 10, 20, 10, 30)),
+        ("в 10:30 завтра", (2026, 10, 20, 10, 30)),
+        ("в 7 вечера", (2026, 10, 19, 19, 0)),
+        ("послезавтра утром", (2026, 10, 21, 9, 0)),
+        ("вечером", (2026, 10, 19, 19, 0)),
+    ])
+    def test_phrases(self, phrase, expected):
+        result = parse_deadline(phrase, "Europe/Moscow", now=NOW)
+        assert result is not None
+        assert (result.year, result.month, result.day, result.hour, result.minute) == expected
+
+    def test_longest_span_anywhere(self):
+        """Дедлайн ищется в любом месте текста, берётся самый длинный фрагмент"""
+        text = "Сделать отчёт завтра в 10:30 для клиента"
+        m = find_deadline(text, "Europe/Moscow", now=NOW)
+        assert text[m.start:m.end] == "завтра в 10:30"
+        assert strip_deadline(text, m) == "Сделать отчёт для клиента"
+
+    def test_no_false_positives(self):
+        assert find_deadline("купить 3 молока", "Europe/Moscow", now=NOW) is None
+        assert find_deadline("в 3 задачах ошибка", "Europe/Moscow", now=NOW) is None
+        assert find_deadline("через 2 вечера", "Europe/Moscow", now=NOW) is None
+        # parse_deadline требует, чтобы вся строка была дедлайном
+        assert parse_deadline("отчёт завтра", "Europe/Moscow", now=NOW) is None
+
+    @pytest.mark.parametrize("text", [
+        "Обновить Python до 3.11",
+        "Поднять лимит до 1.5 раз",
+        "Встреча в 3",
+        "Купить 2 штуки в 5",
+        "обсудили в понедельник баг",
+        "Версия 15.03 сломала сборку",
+        "Поздравить с днем рождения Машу",
+        "Сервер падает ночью, разобраться",
+        "Утром обсудили релиз",
+        "Позвонить вечером",
+    ])
+    def test_ordinary_text_is_not_deadline(self, text):
+        assert find_deadline(text, "Europe/Moscow", now=NOW) is None
+
+    @pytest.mark.parametrize("text, fragment", [
+        ("Сдать смету до 15.03", "до 15.03"),
+        ("Сдать смету к 5.03", "к 5.03"),
+        ("Созвон в пятницу", "в пятницу"),
+        ("В пятницу созвон", "В пятницу"),
+        ("Созвон в пятницу в 10 утра с клиентом", "в пятницу в 10 утра"),
+        ("Позвонить завтра утром", "завтра утром"),
+        ("Сегодня вечером выкатить релиз", "Сегодня вечером"),
+    ])
+    def test_deadline_in_text(self, text, fragment):
+        m = find_deadline(text, "Europe/Moscow", now=NOW)
+        assert m is not None and text[m.start:m.end] == fragment
@@ -0,0 +1,90 @@
+"""
+Тесты утреннего дайджеста просроченных задач
+"""
+
+import asyncio
+import datetime
+import json
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from services import digest
+from services.digest import SendPacer, next_run, render, run_digest, send_all
+
+TODAY = datetime.date(2025, 3, 14)
+
+
+def _item(task_id, deadline, title="Отчёт", who="ivan"):
+    return json.dumps({"id": task_id, "title": title, "deadline": deadline.isoformat(), "who": who})
+
+
+def _row(chat=-100, topic=7, overdue=1, today=1, items=None):
+    items = items if items is not None else [
+        _item(1, TODAY - datetime.timedelta(days=2), "Сервер <prod>"),
+        _item(2, TODAY, who="unknown"),
+    ]
+    return {"chat_id": chat, "topic_id": topic, "overdue": overdue, "today": today, "items": items}
+
+
+class TestRender:
+
+    def test_overdue_and_today_lines(self):
+        text = render(_row(), TODAY)
+        lines = text.split("\n")
+        assert lines[0] == "📋 Задачи на 14.03: просрочено 1, сегодня 1"
+        assert lines[1] == "🔴 #1 «Сервер &lt;prod&gt;» — @ivan (до 12.03)"
+        assert lines[2] == "🟡 #2 «Отчёт»"
+
+    def test_truncated_list_mentions_rest(self):
+        text = render(_row(overdue=40, today=2, items=[_item(1, TODAY)]), TODAY)
+        assert text.endswith("…и ещё 41")
+
+
+class TestPacer:
+
+    def test_global_and_per_chat_spacing(self):
+        pacer = SendPacer(rate=10, chat_interval=3)
+        assert pacer.reserve(1, 0.0) == 0.0
+        assert pacer.reserve(2, 0.0) == pytest.approx(0.1)
+        assert pacer.reserve(1, 0.0) == 3.0  # второй топик того же чата
+        assert pacer.reserve(3, 0.0) == pytest.approx(0.3)  # остальные чаты не ждут
+
+
+class TestSend:
+
+    @pytest.mark.asyncio
+    async def test_retry_after_then_success(self, monkeypatch):
+        monkeypatch.setattr(asyncio, "sleep", AsyncMock())
+        send = AsyncMock(side_effect=[TelegramRetryAfter(method=None, message="flood", retry_after=1), None, None])
+        sent = await send_all([(-1, None, "a"), (-2, None, "b")], send, SendPacer(rate=1000, chat_interval=0))
+        assert sent == 2 and send.await_count == 3
+
+    @pytest.mark.asyncio
+    async def test_one_query_for_all_chats(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [_row(chat=-1), _row(chat=-1, topic=None), _row(chat=-2)]
+        send = AsyncMock()
+        pacer = SendPacer(rate=1000, chat_interval=0)
+        assert await run_digest(conn, send, "Europe/Moscow", shadow_default=True, pacer=pacer) == 3
+        conn.fetch.assert_awaited_once()
+        assert conn.fetch.await_args.args[4] is True
+        assert {c.args[:2] for c in send.await_args_list} == {(-1, 7), (-1, None), (-2, 7)}
+
+
+class TestSchedule:
+
+    def test_next_run_today_tomorrow_and_catchup(self):
+        tz = datetime.timezone.utc
+        hour = digest.DIGEST_HOUR
+        before = datetime.datetime(2025, 3, 14, hour - 1, 30, tzinfo=tz)
+        late = datetime.datetime(2025, 3, 14, hour, 30, tzinfo=tz)
+        after = datetime.datetime(2025, 3, 14, hour + 3, tzinfo=tz)
+        assert next_run(before).day == 14
+        assert next_run(late) == late.replace(minute=0)  # рестарт вскоре после — догоняем
+        assert next_run(after).day == 15
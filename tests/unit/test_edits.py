@@ -0,0 +1,77 @@
+"""
+Тесты склейки правок и истории версий
+"""
+
+import asyncio
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from aiogram.types import Chat, Message, PhotoSize, User
+
+from services.edits import SQL_APPLY_EDIT, EditBuffer, apply_edit, latest_edit
+
+CHAT = Chat(id=-1001, type="supergroup")
+USER = User(id=42, is_bot=False, first_name="Иван")
+SENT = datetime.datetime(2025, 3, 11, 10, 0, tzinfo=datetime.timezone.utc)
+
+
+def _edit(message_id, text, edited_after, **kw):
+    return Message(message_id=message_id, date=SENT, chat=CHAT, from_user=USER, text=text,
+                   edit_date=int(SENT.timestamp()) + edited_after, **kw)
+
+
+class TestEditBuffer:
+
+    @pytest.mark.asyncio
+    async def test_burst_of_edits_applied_once_with_latest(self):
+        applied = []
+
+        async def flush(msg):
+            applied.append((msg.message_id, msg.text))
+
+        buf = EditBuffer(flush, window=0.05)
+        buf.add(_edit(1, "опечтка", 1))
+        buf.add(_edit(1, "опечатка", 2))
+        buf.add(_edit(2, "другое", 1))
+        await asyncio.sleep(0.02)
+        buf.add(_edit(1, "опечатка!", 3))
+        await buf.drain()
+        assert sorted(applied) == [(1, "опечатка!"), (2, "другое")]
+
+    def test_latest_by_edit_date_not_arrival(self):
+        late, early = _edit(1, "v3", 3), _edit(1, "v2", 2)
+        assert latest_edit([late, early]).text == "v3"
+
+
+class TestApplyEdit:
+
+    @pytest.mark.asyncio
+    async def test_single_statement(self):
+        conn = AsyncMock()
+        await apply_edit(conn, _edit(7, "новый текст", 5, message_thread_id=3))
+        conn.execute.assert_awaited_once()
+        sql, chat_id, message_id, text, topic_id, since, media, user_id, payload = conn.execute.await_args.args
+        assert "INSERT INTO raw_update_versions" in sql and "FOR UPDATE" in sql
+        assert "ON CONFLICT (chat_id, message_id, version)" in sql
+        assert "album_ids" not in sql
+        assert (chat_id, message_id, text, topic_id, media, user_id) == (-1001, 7, "новый текст", 3, None, 42)
+        assert since == SENT - datetime.timedelta(hours=1)
+
+    @pytest.mark.asyncio
+    async def test_album_caption_edit_keeps_album_media(self):
+        conn = AsyncMock()
+        photo = [PhotoSize(file_id="f", file_unique_id="u", width=10, height=10)]
+        msg = Message(message_id=12, date=SENT, chat=CHAT, photo=photo, caption="подпись",
+                      media_group_id="alb", edit_date=int(SENT.timestamp()) + 1)
+        await apply_edit(conn, msg)
+        args = conn.execute.await_args.args
+        assert "payload->'album_ids'" in args[0]
+        assert args[3] == "подпись" and args[6] is None
+
+    def test_template_has_single_match_slot(self):
+        assert SQL_APPLY_EDIT.count("{match}") == 1
@@ -0,0 +1,130 @@
+"""
+Тесты эскалации по цепочке привязок топика
+"""
+
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services import escalation, reminders
+from services.escalation import escalate, initial_timers, next_in_chain, resolve_chain
+from services.reminders import dispatch, member
+from services.users import UserRow
+
+CHAIN = [UserRow(10, "lead", 1000), UserRow(20, "tech", 2000), UserRow(30, "boss", 3000)]
+
+
+def _task(task_id=1, status="TODO", level=0, responsible=10, acked=None, topic=7):
+    return {"id": task_id, "title": "Сервер <prod>", "status": status, "acknowledged_at": acked,
+            "escalation_level": level, "responsible_user_id": responsible,
+            "responsible_username": "lead", "source_chat_id": -100, "source_topic_id": topic}
+
+
+def _chain_rows():
+    return [{"priority": i, "id": u.id, "username": u.username, "telegram_id": u.telegram_id}
+            for i, u in enumerate(CHAIN)]
+
+
+class TestChain:
+
+    def test_next_after_current(self):
+        assert next_in_chain(CHAIN, 10) == CHAIN[1]
+        assert next_in_chain(CHAIN, 30) is None
+
+    def test_unknown_responsible_starts_from_head(self):
+        assert next_in_chain(CHAIN, None) == CHAIN[0]
+        assert next_in_chain([], 10) is None
+
+    @pytest.mark.asyncio
+    async def test_resolve_dedups_users(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = _chain_rows() + [{"priority": 9, "id": 10, "username": None, "telegram_id": 1000}]
+        assert await resolve_chain(conn, -100, 7) == CHAIN
+
+    def test_initial_timers_only_topic_todo(self):
+        rows = [_task(1), _task(2, topic=None), _task(3, status="DONE")]
+        timers = initial_timers(rows, now=1000.0)
+        assert timers == {"1:esc:1": 1000.0 + escalation.ESCALATION_SECONDS}
+
+
+class TestEscalate:
+
+    @pytest.mark.asyncio
+    async def test_moves_to_next_and_schedules_next_level(self):
+        conn = AsyncMock()
+        conn.fetch.side_effect = [[_task(1)], _chain_rows()]
+        conn.fetchval.return_value = 1
+        send = AsyncMock()
+        follow = await escalate(conn, [(1, "1")], send)
+        assert list(follow) == ["1:esc:2"]
+        assert conn.fetchval.await_args.args[1:] == (1, 20, "tech", 1)
+        chat, topic, text = send.await_args.args
+        assert (chat, topic) == (-100, 7) and "@tech" in text and "&lt;prod&gt;" in text
+        assert send.await_args.kwargs["reply_markup"].inline_keyboard[0][0].callback_data == "task:ack:1"
+
+    @pytest.mark.asyncio
+    async def test_stale_timers_dropped(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [
+            _task(1, acked=datetime.datetime.now()), _task(2, status="IN_PROGRESS"), _task(3, level=1),
+        ]
+        send = AsyncMock()
+        assert await escalate(conn, [(1, "1"), (2, "1"), (3, "1"), (4, "1")], send) == {}
+        send.assert_not_awaited()
+        conn.fetchval.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_user_without_username_not_stored_as_id(self):
+        conn = AsyncMock()
+        rows = _chain_rows()
+        rows[1] = {"priority": 1, "id": 20, "username": None, "telegram_id": 2000}
+        conn.fetch.side_effect = [[_task(1)], rows]
+        conn.fetchval.return_value = 1
+        send = AsyncMock()
+        await escalate(conn, [(1, "1")], send)
+        assert conn.fetchval.await_args.args[1:] == (1, 20, "unknown", 1)
+        text = send.await_args.args[2]
+        assert "Ответственный: id:2000 (был @lead)" in text and "@id:" not in text
+
+    @pytest.mark.asyncio
+    async def test_exhausted_chain_marks_task(self):
+        conn = AsyncMock()
+        conn.fetch.side_effect = [[_task(1, responsible=30, level=2)], _chain_rows()]
+        send = AsyncMock()
+        assert await escalate(conn, [(1, "3")], send) == {}
+        conn.execute.assert_awaited_once_with(escalation.SQL_EXHAUST, 1, 3, escalation.EXHAUSTED)
+        send.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_reconcile_skips_exhausted(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = []
+        assert await escalation.reconcile(conn, AsyncMock(), "UTC") == 0
+        assert conn.fetch.await_args.args == (escalation.SQL_OPEN, escalation.EXHAUSTED)
+
+    @pytest.mark.asyncio
+    async def test_lost_race_does_not_notify(self):
+        conn = AsyncMock()
+        conn.fetch.side_effect = [[_task(1)], _chain_rows()]
+        conn.fetchval.return_value = None  # приняли между чтением и UPDATE
+        send = AsyncMock()
+        assert await escalate(conn, [(1, "1")], send) == {}
+        send.assert_not_awaited()
+
+
+class TestDispatch:
+
+    @pytest.mark.asyncio
+    async def test_routes_kinds_and_adds_follow_ups(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = []
+        redis = AsyncMock()
+        handler = AsyncMock(return_value={"5:esc:3": 42.0})
+        items = [member(5, "esc", 2).encode(), member(6, "due", datetime.date(2025, 3, 14)).encode()]
+        await dispatch(conn, redis, items, AsyncMock(), {"esc": handler})
+        assert handler.await_args.args[1] == [(5, "2")]
+        redis.zadd.assert_awaited_once_with(reminders.ZSET_KEY, {"5:esc:3": 42.0})
@@ -0,0 +1,66 @@
+"""
+Тесты inline-поиска задач
+"""
+
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services import inline
+from services.inline import ScopeCache, UserScope, build_sql, parse_query, search_tasks, to_results
+
+SCOPE = UserScope(user_id=9, projects=(1, 2))
+
+
+def _row(task_id=12, title="Смета <площадка>", status="TODO", who="ivan"):
+    return {"id": task_id, "title": title, "status": status, "deadline": datetime.date(2025, 3, 14),
+            "responsible_username": who}
+
+
+class TestQuery:
+
+    def test_parse_parts(self):
+        q = parse_query("#12 @Ivan смета  площадка")
+        assert (q.task_id, q.username, q.words) == (12, "ivan", "смета площадка")
+
+    def test_title_uses_lower_like_and_prefix_order(self):
+        sql, args = build_sql(SCOPE, parse_query("50%_Смета"))
+        assert "lower(title) LIKE $3" in sql and "(lower(title) LIKE $4) DESC" in sql
+        assert args[2] == "%50\\%\\_смета%" and args[3] == "50\\%\\_смета%"
+        assert args[:2] == [[1, 2], 9]
+
+    def test_empty_query_lists_open(self):
+        sql, args = build_sql(SCOPE, parse_query(""), offset=20)
+        assert "status = ANY($3::varchar[])" in sql
+        assert args[-2:] == [inline.INLINE_LIMIT, 20]
+
+
+class TestResults:
+
+    def test_article_and_reference(self):
+        [article] = to_results([_row()])
+        assert article.id == "12" and article.title == "#12 Смета <площадка>"
+        assert article.description == "к выполнению · @ivan · до 14.03.2025"
+        assert article.input_message_content.message_text == "#12 «Смета &lt;площадка&gt;» — @ivan (к выполнению)"
+
+    @pytest.mark.asyncio
+    async def test_scope_cached_between_queries(self):
+        conn = AsyncMock()
+        conn.fetchrow.return_value = {"id": 9, "projects": [1, 2]}
+        conn.fetch.return_value = [_row(i) for i in range(inline.INLINE_LIMIT)]
+        scopes = ScopeCache()
+        _, next_offset = await search_tasks(conn, scopes, 555, "смета")
+        await search_tasks(conn, scopes, 555, "счёт")
+        assert conn.fetchrow.await_count == 1 and conn.fetch.await_count == 2
+        assert next_offset == str(inline.INLINE_LIMIT)
+
+    @pytest.mark.asyncio
+    async def test_unknown_user_gets_nothing(self):
+        conn = AsyncMock()
+        conn.fetchrow.return_value = None
+        assert await search_tasks(conn, ScopeCache(), 555, "смета") == ([], "")
+        conn.fetch.assert_not_awaited()
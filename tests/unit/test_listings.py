@@ -0,0 +1,133 @@
+"""
+Тесты списков задач (/mytasks, /tasks) и их инвалидации по task_changed
+"""
+
+import asyncio
+import datetime
+import json
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services import listings
+from services.listings import TaskQuery, build_sql, change_scopes, get_page, invalidate, parse_filter
+from services.task_changes import TaskChangeListener, parse_payload
+
+
+def _rows(n):
+    return [{"id": i, "title": f"Задача <{i}>", "status": "TODO", "deadline": datetime.date(2025, 3, 14),
+             "responsible_username": "ivan"} for i in range(1, n + 1)]
+
+
+def _payload(task_id=5, old=None, new=None):
+    return json.dumps({"id": task_id, "old": old, "new": new})
+
+
+class TestQuery:
+
+    def test_parse_filter(self):
+        assert parse_filter(None) == (list(listings.OPEN_STATUSES), None)
+        assert parse_filter("@Ivan review") == (["ON_REVIEW"], "Ivan")
+        assert parse_filter("DONE") == (["DONE"], None)
+        assert parse_filter("завтра") is None
+
+    def test_my_sql_uses_user_and_username_fallback(self):
+        sql, args = build_sql(TaskQuery("my", 111, ["TODO"], username="ivan"), page=2)
+        assert "telegram_id = $2" in sql and "lower(responsible_username) = lower($3)" in sql
+        assert "LIMIT $4 OFFSET $5" in sql
+        assert args == [["TODO"], 111, "ivan", listings.PAGE_SIZE + 1, 2 * listings.PAGE_SIZE]
+
+    def test_project_sql_with_user_filter(self):
+        sql, args = build_sql(TaskQuery("project", 3, ["TODO"], user_id=42), page=0)
+        assert "project_id = $2" in sql and "responsible_user_id = $3" in sql
+        assert "ORDER BY deadline ASC NULLS LAST" in sql
+        assert args[:3] == [["TODO"], 3, 42]
+
+    def test_username_filter_ignores_case(self):
+        sql, args = build_sql(TaskQuery("chat", -100, ["TODO"], username="Ivan"), page=0)
+        assert "lower(responsible_username) = lower($3)" in sql and args[2] == "Ivan"
+
+    def test_scopes(self):
+        assert TaskQuery("my", 111, username="Ivan").scopes() == ["tg:111", "name:ivan"]
+        assert TaskQuery("chat", -100).scopes() == ["chat:-100"]
+
+
+class TestCache:
+
+    @pytest.mark.asyncio
+    async def test_hit_skips_db(self):
+        redis = AsyncMock()
+        redis.mget.return_value = [b"4"]
+        redis.get.return_value = json.dumps({"text": "cached", "has_next": True})
+        get_conn = AsyncMock()
+        page = await get_page(redis, get_conn, TaskQuery("chat", -100), "📋", page=1)
+        assert (page.text, page.page, page.has_next) == ("cached", 1, True)
+        get_conn.assert_not_awaited()
+        assert ":4:" in redis.get.await_args.args[0]
+
+    @pytest.mark.asyncio
+    async def test_miss_renders_and_stores(self):
+        redis = AsyncMock()
+        redis.mget.return_value = [None]
+        redis.get.return_value = None
+        conn = AsyncMock()
+        conn.fetch.return_value = _rows(listings.PAGE_SIZE + 1)
+        page = await get_page(redis, AsyncMock(return_value=conn), TaskQuery("chat", -100), "📋")
+        assert page.has_next
+        assert "«Задача &lt;1&gt;» — @ivan · до 14.03" in page.text
+        assert f"#{listings.PAGE_SIZE + 1} " not in page.text
+        key = redis.set.await_args.args[0]
+        assert key.startswith("tasks:page:chat:-100:0:") and redis.set.await_args.kwargs["ex"] == listings.CACHE_TTL
+        conn.close.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_redis_down_falls_back_to_db(self):
+        redis = AsyncMock()
+        redis.mget.side_effect = ConnectionError("down")
+        conn = AsyncMock()
+        conn.fetch.return_value = []
+        page = await get_page(redis, AsyncMock(return_value=conn), TaskQuery("chat", -100), "📋")
+        assert page.text.endswith("Задач нет")
+        redis.set.assert_not_awaited()
+
+
+class TestInvalidation:
+
+    def test_reassignment_touches_old_and_new_scopes(self):
+        change = parse_payload(_payload(
+            old=[111, "Ivan", -100, 7, 3, "TODO"], new=[222, "petr", -100, 7, 3, "TODO"],
+        ))
+        assert change_scopes([change]) == {"tg:111", "name:ivan", "tg:222", "name:petr", "chat:-100", "project:3"}
+
+    def test_insert_has_no_old(self):
+        change = parse_payload(_payload(new=[None, "unknown", -100, None, None, "TODO"]))
+        assert change.old is None and change_scopes([change]) == {"name:unknown", "chat:-100"}
+
+    @pytest.mark.asyncio
+    async def test_invalidate_incr_in_one_pipeline(self):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        ctx = MagicMock()
+        ctx.__aenter__ = AsyncMock(return_value=pipe)
+        ctx.__aexit__ = AsyncMock(return_value=False)
+        redis = MagicMock()
+        redis.pipeline.return_value = ctx
+        change = parse_payload(_payload(new=[111, None, -100, None, None, "DONE"]))
+        assert await invalidate(redis, [change]) == 2
+        assert {c.args[0] for c in pipe.incr.call_args_list} == {"tasks:ver:tg:111", "tasks:ver:chat:-100"}
+        pipe.execute.assert_awaited_once()
+
+    @pytest.mark.asyncio
+    async def test_listener_batches_notifications(self):
+        listener = TaskChangeListener(AsyncMock(), window=0.01)
+        seen = []
+        listener.subscribe(AsyncMock(side_effect=lambda changes: seen.append([c.task_id for c in changes])))
+        for task_id in (1, 2, 3):
+            listener._on_notify(None, 0, "task_changed", _payload(task_id, new=[None, None, -1, None, None, "TODO"]))
+        listener._on_notify(None, 0, "task_changed", "not json")
+        await asyncio.sleep(0.05)
+        await listener.drain()
+        assert seen == [[1, 2, 3]]
@@ -0,0 +1,105 @@
+"""
+Тесты приёма медиа: метаданные вложений и склейка альбомов
+"""
+
+import asyncio
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock, patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from aiogram.types import Animation, Chat, Document, Message, PhotoSize, User, Voice
+
+from services.media import AlbumBuffer, extract_media, media_summary
+
+CHAT = Chat(id=-1001, type="supergroup", title="Проект")
+USER = User(id=42, is_bot=False, first_name="Иван")
+NOW = datetime.datetime(2025, 3, 11, 10, 0, tzinfo=datetime.timezone.utc)
+
+
+def _photo(message_id, caption=None, group="alb1"):
+    sizes = [
+        PhotoSize(file_id=f"s{message_id}", file_unique_id=f"us{message_id}", width=90, height=60),
+        PhotoSize(file_id=f"b{message_id}", file_unique_id=f"ub{message_id}", width=1280, height=853, file_size=120_000),
+    ]
+    return Message(message_id=message_id, date=NOW, chat=CHAT, from_user=USER, photo=sizes,
+                   caption=caption, media_group_id=group)
+
+
+class TestExtract:
+
+    def test_largest_photo_size(self):
+        assert extract_media(_photo(1)) == [{
+            "type": "photo", "file_unique_id": "ub1", "file_id": "b1", "size": 120_000, "w": 1280, "h": 853,
+        }]
+
+    def test_animation_wins_over_document(self):
+        anim = Animation(file_id="a", file_unique_id="ua", width=1, height=1, duration=3)
+        doc = Document(file_id="a", file_unique_id="ua", mime_type="video/mp4")
+        msg = Message(message_id=2, date=NOW, chat=CHAT, animation=anim, document=doc)
+        assert [m["type"] for m in extract_media(msg)] == ["animation"]
+
+    def test_voice_and_text(self):
+        voice = Message(message_id=3, date=NOW, chat=CHAT,
+                        voice=Voice(file_id="v", file_unique_id="uv", duration=7, mime_type="audio/ogg"))
+        assert extract_media(voice)[0] == {"type": "voice", "file_unique_id": "uv", "file_id": "v",
+                                           "mime": "audio/ogg", "duration": 7}
+        assert extract_media(Message(message_id=4, date=NOW, chat=CHAT, text="hi")) == []
+
+    def test_summary(self):
+        media = [{"type": "photo"}, {"type": "photo"}, {"type": "document"}]
+        assert media_summary(media) == "📷 фото ×2, 📄 документ"
+        assert media_summary(None) == ""
+
+
+class TestAlbumBuffer:
+
+    @pytest.mark.asyncio
+    async def test_album_flushed_once_after_quiet_window(self):
+        flushed = []
+
+        async def flush(items):
+            flushed.append([m.message_id for m in items])
+
+        buf = AlbumBuffer(flush, window=0.05)
+        buf.add(_photo(12))
+        buf.add(_photo(11, caption="скрин ошибки"))
+        await asyncio.sleep(0.03)
+        buf.add(_photo(13))  # окно продлевается
+        await asyncio.sleep(0.03)
+        assert flushed == []
+        buf.add(_photo(20, group="alb2"))
+        await buf.drain()
+        assert sorted(flushed) == [[11, 12, 13], [20]]
+        assert len(buf) == 0
+
+    @pytest.mark.asyncio
+    async def test_flush_error_does_not_leak(self):
+        buf = AlbumBuffer(AsyncMock(side_effect=RuntimeError("db down")), window=0)
+        buf.add(_photo(1))
+        await buf.drain()
+        assert len(buf) == 0
+
+
+class TestAlbumIngest:
+
+    @pytest.mark.asyncio
+    async def test_album_is_one_row_with_caption_and_all_media(self):
+        from main import log_raw_update
+        conn = AsyncMock()
+        album = [_photo(11), _photo(12, caption="скрин ошибки"), _photo(13)]
+        with patch('main.get_conn', AsyncMock(return_value=conn)), \
+             patch('main.get_redis'), \
+             patch('main._maybe_route_to_forward', new_callable=AsyncMock) as route:
+            await log_raw_update(album[0], album=album)
+
+        ingest = [c.args for c in conn.execute.call_args_list if "INSERT INTO raw_updates" in c.args[0]]
+        assert len(ingest) == 1
+        args = ingest[0]
+        assert args[2] == 11 and args[4] == "скрин ошибки"
+        assert '"album_ids": [11, 12, 13]' in args[5]
+        assert args[9].count('"type": "photo"') == 3
+        assert route.await_count == 3
@@ -0,0 +1,74 @@
+"""
+Тесты инкрементального состава групп (chat_member -> tg_chat_member)
+"""
+
+import datetime
+import pytest
+import sys
+import os
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.membership import (
+    SQL_ADD_PROJECT_MEMBERS, SQL_RECONCILE, SQL_UPSERT_MEMBERS, SQL_UPSERT_USERS,
+    MemberEvent, apply_events, event_from_update, latest, reconcile,
+)
+
+T0 = datetime.datetime(2025, 3, 14, 10, 0, tzinfo=datetime.timezone.utc)
+
+
+def _event(user_id=1, status="member", minutes=0, chat_id=-100, is_bot=False):
+    return MemberEvent(chat_id, user_id, status, is_bot, T0 + datetime.timedelta(minutes=minutes), f"u{user_id}")
+
+
+def _conn(add_status="INSERT 0 1"):
+    conn = AsyncMock()
+    conn.transaction = MagicMock(return_value=AsyncMock())
+    conn.fetchrow.return_value = {"id": 3}
+    conn.execute.side_effect = lambda sql, *args: add_status if sql == SQL_ADD_PROJECT_MEMBERS else "INSERT 0 0"
+    return conn
+
+
+class TestEvents:
+
+    def test_from_update_restricted_non_member_is_left(self):
+        user = SimpleNamespace(id=5, is_bot=False, username=None, first_name="Иван", last_name=None)
+        update = SimpleNamespace(chat=SimpleNamespace(id=-100), date=T0, new_chat_member=SimpleNamespace(
+            status="restricted", is_member=False, user=user))
+        e = event_from_update(update)
+        assert (e.chat_id, e.user_id, e.status, e.username, e.first_name) == (-100, 5, "left", "", "Иван")
+        assert not e.active
+
+    def test_latest_per_pair(self):
+        events = latest([_event(1, "member", 0), _event(1, "left", 5), _event(1, "member", 2), _event(2)])
+        assert [(e.user_id, e.status) for e in events] == [(1, "left"), (2, "member")]
+
+
+class TestApply:
+
+    @pytest.mark.asyncio
+    async def test_batch_is_three_statements(self):
+        conn = _conn()
+        added = await apply_events(conn, [_event(i) for i in range(1, 51)] + [_event(99, is_bot=True)])
+        assert added == 1
+        sqls = [c.args[0] for c in conn.execute.await_args_list]
+        assert sqls == [SQL_UPSERT_MEMBERS, SQL_UPSERT_USERS, SQL_ADD_PROJECT_MEMBERS]
+        members, users, joined = (c.args for c in conn.execute.await_args_list)
+        assert len(members[2]) == 51 and 99 not in users[1] and 99 not in joined[2]
+        assert joined[3] == 3
+
+    @pytest.mark.asyncio
+    async def test_only_leaves_skip_project_members(self):
+        conn = _conn()
+        assert await apply_events(conn, [_event(1, "left"), _event(2, "kicked")]) == 0
+        assert [c.args[0] for c in conn.execute.await_args_list] == [SQL_UPSERT_MEMBERS, SQL_UPSERT_USERS]
+        conn.fetchrow.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_reconcile_is_one_query(self):
+        conn = AsyncMock()
+        conn.fetchrow.side_effect = [{"id": 3}, {"present": 40, "added": 2}]
+        assert await reconcile(conn, [-100]) == (40, 2)
+        assert conn.fetchrow.await_args.args == (SQL_RECONCILE, [-100], 3)
@@ -0,0 +1,138 @@
+"""
+Тесты outbox-реле событий задач; webhook проверяется на локальном HTTP-сервере
+"""
+
+import datetime
+import hashlib
+import hmac
+import json
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from aiohttp import web
+
+from services.outbox import (
+    SQL_BATCH, SQL_DELETE, SQL_RETRY, FileSink, OutboxEvent, RedisStreamSink, WebhookSink, relay_once,
+)
+
+
+class StandIn:
+    """Локальный приёмник webhook: складывает тела запросов, отвечает status"""
+
+    def __init__(self, status=200):
+        self.status = status
+        self.requests = []
+
+    async def handle(self, request):
+        self.requests.append((await request.read(), request.headers.get("X-Signature")))
+        return web.Response(status=self.status)
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_post("/hook", self.handle)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/hook"
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.runner.cleanup()
+
+
+def _row(i, task_id=7, event="task.created"):
+    return {"id": i, "task_id": task_id, "event": event, "attempts": 0,
+            "payload": json.dumps({"task_id": task_id, "title": "Смета"}),
+            "created_at": datetime.datetime(2025, 3, 14, 10, 0, tzinfo=datetime.timezone.utc)}
+
+
+def _conn(rows, locked=True):
+    conn = AsyncMock()
+    conn.transaction = MagicMock(return_value=AsyncMock())
+    conn.fetchval.return_value = locked
+    conn.fetch.return_value = rows
+    return conn
+
+
+def _events(n=2):
+    return [OutboxEvent(i, 7, "task.created", {"task_id": 7}, "2025-03-14T10:00:00+00:00") for i in range(1, n + 1)]
+
+
+class TestSinks:
+
+    @pytest.mark.asyncio
+    async def test_webhook_posts_signed_batch(self):
+        async with StandIn() as hook:
+            sink = WebhookSink(hook.url, secret="s3cret")
+            try:
+                await sink.send(_events())
+            finally:
+                await sink.close()
+        [(body, signature)] = hook.requests
+        assert [e["id"] for e in json.loads(body)["events"]] == [1, 2]
+        assert signature == hmac.new(b"s3cret", body, hashlib.sha256).hexdigest()
+
+    @pytest.mark.asyncio
+    async def test_webhook_error_status_raises(self):
+        async with StandIn(status=503) as hook:
+            sink = WebhookSink(hook.url)
+            try:
+                with pytest.raises(RuntimeError):
+                    await sink.send(_events(1))
+            finally:
+                await sink.close()
+
+    @pytest.mark.asyncio
+    async def test_file_sink_appends_json_lines(self, tmp_path):
+        path = tmp_path / "events.jsonl"
+        sink = FileSink(str(path))
+        await sink.send(_events(1))
+        await sink.send(_events(2))
+        lines = path.read_text(encoding="utf-8").splitlines()
+        assert [json.loads(x)["id"] for x in lines] == [1, 1, 2]
+
+    @pytest.mark.asyncio
+    async def test_redis_stream_one_pipeline(self):
+        pipe = MagicMock()
+        pipe.execute = AsyncMock()
+        redis = MagicMock()
+        redis.pipeline.return_value = pipe
+        await RedisStreamSink(lambda: redis, "tasks:events").send(_events(3))
+        assert pipe.xadd.call_count == 3
+        pipe.execute.assert_awaited_once()
+
+
+class TestRelay:
+
+    @pytest.mark.asyncio
+    async def test_delivered_batch_is_deleted_in_order(self):
+        conn = _conn([_row(1), _row(2, event="task.closed")])
+        sink = AsyncMock()
+        assert await relay_once(conn, [sink], batch_size=50) == (2, 0)
+        assert [e.event for e in sink.send.await_args.args[0]] == ["task.created", "task.closed"]
+        conn.fetch.assert_awaited_once_with(SQL_BATCH, 50)
+        conn.execute.assert_awaited_once_with(SQL_DELETE, [1, 2])
+
+    @pytest.mark.asyncio
+    async def test_failed_sink_defers_whole_batch(self):
+        async with StandIn(status=500) as hook:
+            sink = WebhookSink(hook.url)
+            conn = _conn([_row(1), _row(2)])
+            try:
+                assert await relay_once(conn, [sink]) == (0, 2)
+            finally:
+                await sink.close()
+        sql, ids, _, error = conn.execute.await_args.args
+        assert sql == SQL_RETRY and ids == [1, 2] and "HTTP 500" in error
+
+    @pytest.mark.asyncio
+    async def test_other_relay_holds_lock(self):
+        conn = _conn([_row(1)], locked=False)
+        assert await relay_once(conn, [AsyncMock()]) == (0, 0)
+        conn.fetch.assert_not_awaited()
@@ -0,0 +1,40 @@
+"""
+Тесты обслуживания секций raw_updates
+"""
+
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.partitions import maintain_raw_updates, month_start
+
+
+class TestPartitions:
+
+    def test_month_start_is_utc(self):
+        msk = datetime.timezone(datetime.timedelta(hours=3))
+        # 1 ноября 01:00 MSK — ещё октябрь по UTC
+        ts = datetime.datetime(2026, 11, 1, 1, 0, tzinfo=msk)
+        assert month_start(ts) == datetime.datetime(2026, 10, 1, tzinfo=datetime.timezone.utc)
+
+    @pytest.mark.asyncio
+    async def test_maintain_calls_sql_function(self):
+        conn = AsyncMock()
+        conn.fetch = AsyncMock(return_value=[
+            {"action": "created raw_updates_p202612"},
+            {"action": "detached raw_updates_p202509"},
+        ])
+        actions = await maintain_raw_updates(conn, months_ahead=2, retention_months=12, mode="detach")
+        assert actions == ["created raw_updates_p202612", "detached raw_updates_p202509"]
+        sql, *args = conn.fetch.call_args[0]
+        assert "raw_updates_maintain" in sql
+        assert args == [2, 12, "detach"]
+
+    @pytest.mark.asyncio
+    async def test_unknown_mode_rejected(self):
+        with pytest.raises(ValueError):
+            await maintain_raw_updates(AsyncMock(), mode="truncate")
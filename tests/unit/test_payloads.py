@@ -0,0 +1,118 @@
+"""
+Тесты хранения полного апдейта (msgpack + zstd со словарём)
+"""
+
+import datetime
+import json
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from aiogram.types import Chat, Message, MessageEntity, User
+
+from services.payloads import (
+    MIN_SAMPLES, PayloadCodec, load_payload, maintain_payloads, message_to_dict, prune_sql, train_dictionary,
+)
+
+
+def _message(i: int) -> Message:
+    return Message(
+        message_id=1000 + i,
+        date=datetime.datetime(2025, 3, 11, 10, i % 60, tzinfo=datetime.timezone.utc),
+        chat=Chat(id=-1001234567890, type="supergroup", title="Проект Альфа", is_forum=True),
+        from_user=User(id=500 + i % 20, is_bot=False, first_name=f"Пользователь {i % 20}", username=f"user{i % 20}"),
+        message_thread_id=7 + i % 3,
+        text=f"@user{i % 7} посмотри задачу {i}, нужно до пятницы",
+        entities=[MessageEntity(type="mention", offset=0, length=6)],
+    )
+
+
+class FakeDictConn:
+    """raw_payloads / raw_payload_dicts в памяти"""
+
+    def __init__(self, codec: PayloadCodec, n: int):
+        self.bodies = {}
+        self.dicts = {}
+        for i in range(n):
+            self.bodies[i + 1] = codec.encode(message_to_dict(_message(i)))
+        self.execute = AsyncMock(return_value="DELETE 0")
+
+    async def fetch(self, sql, *args):
+        if "raw_payload_dicts" in sql:
+            return [{"id": k, "dict": v} for k, v in sorted(self.dicts.items())]
+        rows = sorted(self.bodies.items(), reverse=True)[:args[0]]
+        return [{"dict_id": d, "body": b} for _, (d, b) in rows]
+
+    async def fetchrow(self, sql, raw_id):
+        if raw_id not in self.bodies:
+            return None
+        d, b = self.bodies[raw_id]
+        return {"dict_id": d, "body": b}
+
+    async def fetchval(self, sql, data, samples):
+        dict_id = len(self.dicts) + 1
+        self.dicts[dict_id] = data
+        return dict_id
+
+
+class TestCodec:
+
+    def test_roundtrip_keeps_full_update(self):
+        codec = PayloadCodec()
+        doc = message_to_dict(_message(1))
+        dict_id, body = codec.encode(doc)
+        assert dict_id == 0
+        assert codec.decode(dict_id, body) == doc
+        assert doc["entities"][0]["type"] == "mention" and "reply_to_message" not in doc
+
+    @pytest.mark.asyncio
+    async def test_trained_dictionary_shrinks_messages(self):
+        codec = PayloadCodec()
+        conn = FakeDictConn(codec, MIN_SAMPLES * 2)
+        dict_id = await train_dictionary(conn, codec, size=4096)
+        assert dict_id == 1 and codec.current_id == 1
+
+        doc = message_to_dict(_message(3))
+        plain = len(PayloadCodec().encode(doc)[1])
+        with_dict = codec.encode(doc)
+        assert with_dict[0] == 1
+        assert len(with_dict[1]) < plain / 2
+        assert len(with_dict[1]) < len(json.dumps(doc, ensure_ascii=False).encode()) / 4
+
+    @pytest.mark.asyncio
+    async def test_too_few_samples(self):
+        codec = PayloadCodec()
+        conn = FakeDictConn(codec, 10)
+        assert await train_dictionary(conn, codec) is None
+        assert codec.current_id == 0
+
+
+class TestLoad:
+
+    @pytest.mark.asyncio
+    async def test_unknown_dictionary_loaded_lazily(self):
+        writer = PayloadCodec()
+        conn = FakeDictConn(writer, MIN_SAMPLES)
+        await train_dictionary(conn, writer, size=4096)
+        conn.bodies[10_000] = writer.encode(message_to_dict(_message(5)))
+
+        reader = PayloadCodec()  # другой процесс: словаря ещё нет
+        doc = await load_payload(conn, 10_000, reader)
+        assert doc["message_id"] == 1005 and reader.has(1)
+        assert await load_payload(conn, 99_999, reader) is None
+
+    @pytest.mark.asyncio
+    async def test_maintain_trains_first_dictionary_once(self):
+        codec = PayloadCodec()
+        conn = FakeDictConn(codec, MIN_SAMPLES)
+        assert await maintain_payloads(conn, [], codec) == ["trained payload dict 1"]
+        assert await maintain_payloads(conn, [], codec) == []
+        assert "raw_payloads" in conn.execute.await_args.args[0]
+
+    def test_prune_keeps_detached_partitions(self):
+        sql = prune_sql(["raw_updates_p202501"])
+        assert "(SELECT min(id) FROM raw_updates)" in sql
+        assert 'LEAST((SELECT min(id) FROM raw_updates), (SELECT min(id) FROM "raw_updates_p202501"))' in sql
@@ -0,0 +1,137 @@
+"""
+Тесты слоя Redis: метрики латентности, пакетные операции, клиентский кэш
+"""
+
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.redis_client import LatencyMetrics, ClientSideCache, get_many, set_many
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.ops = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def set(self, key, value, ex=None):
+        self.ops.append((key, value, ex))
+
+    async def execute(self):
+        self.client.round_trips += 1
+        for key, value, _ in self.ops:
+            self.client.data[key] = value
+        return [True] * len(self.ops)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.round_trips = 0
+        self.on_get = None
+
+    async def get(self, key):
+        self.round_trips += 1
+        if self.on_get:
+            self.on_get(key)
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        self.round_trips += 1
+        return [self.data.get(k) for k in keys]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class TestLatencyMetrics:
+
+    def test_snapshot(self):
+        m = LatencyMetrics()
+        for _ in range(19):
+            m.record("GET", 0.0008)
+        m.record("GET", 0.2)
+        s = m.snapshot()["GET"]
+        assert s["count"] == 20
+        assert s["p95_ms"] == 1
+        assert s["max_ms"] == 200.0
+        assert "GET n=20" in m.format()
+        m.reset()
+        assert m.format() == "no commands"
+
+
+class TestBatching:
+
+    @pytest.mark.asyncio
+    async def test_set_many_and_get_many_single_round_trip(self):
+        r = FakeRedis()
+        await set_many(r, {"responsible:1:1": "5:bob", "responsible:1:2": "None:None"}, ttl=300)
+        assert r.round_trips == 1
+        assert await get_many(r, ["responsible:1:1", "responsible:1:2", "x"]) == ["5:bob", "None:None", None]
+        assert r.round_trips == 2
+        assert await get_many(r, []) == []
+        assert r.round_trips == 2
+
+
+class TestClientSideCache:
+
+    @pytest.mark.asyncio
+    async def test_inactive_cache_always_reads_redis(self):
+        r = FakeRedis()
+        r.data["perm:1:2"] = "1:0"
+        cache = ClientSideCache(r)
+        assert await cache.get("perm:1:2") == "1:0"
+        assert await cache.get("perm:1:2") == "1:0"
+        assert r.round_trips == 2
+
+    @pytest.mark.asyncio
+    async def test_hits_and_invalidation(self):
+        r = FakeRedis()
+        r.data["perm:1:2"] = "1:0"
+        cache = ClientSideCache(r)
+        cache._active = True
+        await cache.get("perm:1:2")
+        assert await cache.get("perm:1:2") == "1:0"
+        assert r.round_trips == 1 and cache.hits == 1
+
+        r.data["perm:1:2"] = "1:1"
+        cache.invalidate(["perm:1:2"])
+        assert await cache.get("perm:1:2") == "1:1"
+
+        # ключи вне отслеживаемых префиксов не кэшируются
+        await cache.get("newtask:1:2")
+        await cache.get("newtask:1:2")
+        assert r.round_trips == 4
+
+    @pytest.mark.asyncio
+    async def test_invalidation_during_read_is_not_cached(self):
+        r = FakeRedis()
+        r.data["responsible:1:1"] = "old"
+        cache = ClientSideCache(r)
+        cache._active = True
+        # инвалидация прилетела, пока GET был в полёте
+        r.on_get = lambda key: cache.invalidate([key])
+        assert await cache.get("responsible:1:1") == "old"
+        r.on_get = None
+        r.data["responsible:1:1"] = "new"
+        assert await cache.get("responsible:1:1") == "new"
+
+    @pytest.mark.asyncio
+    async def test_get_many_mixes_hits_and_misses(self):
+        r = FakeRedis()
+        r.data.update({"responsible:1:1": "a", "responsible:1:2": "b"})
+        cache = ClientSideCache(r)
+        cache._active = True
+        await cache.get("responsible:1:1")
+        assert await cache.get_many(["responsible:1:1", "responsible:1:2"]) == ["a", "b"]
+        assert r.round_trips == 2
+        assert await cache.get_many(["responsible:1:2", "responsible:1:1"]) == ["b", "a"]
+        assert r.round_trips == 2
@@ -0,0 +1,80 @@
+"""
+Тесты планировщика напоминаний о дедлайнах (таймеры в ZSET)
+"""
+
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services import reminders
+from services.reminders import fire, member, parse_member, reminder_times, schedule_tasks, timers_for
+
+TZ = "Europe/Moscow"
+DEADLINE = datetime.date(2025, 3, 14)
+
+
+def _task(task_id=1, status="TODO", deadline=DEADLINE, chat=-100, topic=7, title="Отчёт <Q1>"):
+    return {"id": task_id, "title": title, "status": status, "deadline": deadline,
+            "source_chat_id": chat, "source_topic_id": topic, "responsible_username": "ivan"}
+
+
+class TestTimers:
+
+    def test_warn_and_due_at_local_hour(self):
+        (k1, warn), (k2, due) = reminder_times(DEADLINE, TZ)
+        assert (k1, k2) == ("warn", "due")
+        assert warn.date() == datetime.date(2025, 3, 13) and due.date() == DEADLINE
+        assert due.hour == reminders.REMINDER_HOUR
+        assert due.astimezone(datetime.timezone.utc).hour == reminders.REMINDER_HOUR - 3
+
+    def test_member_roundtrip(self):
+        m = member(42, "due", DEADLINE)
+        assert parse_member(m.encode()) == (42, "due", "2025-03-14")
+
+    def test_past_moments_skipped(self):
+        _, due = reminder_times(DEADLINE, TZ)[1]
+        now = due.timestamp() - 60  # warn уже прошёл, due — через минуту
+        assert timers_for([{"id": 1, "deadline": DEADLINE}, {"id": 2, "deadline": None}], TZ, now) == {
+            "1:due:2025-03-14": due.timestamp(),
+        }
+
+    @pytest.mark.asyncio
+    async def test_schedule_reads_stored_deadline(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [{"id": 5, "deadline": datetime.date.today() + datetime.timedelta(days=10)}]
+        redis = AsyncMock()
+        assert await schedule_tasks(conn, redis, [5, None], TZ) == 2
+        key, mapping = redis.zadd.await_args.args
+        assert key == reminders.ZSET_KEY and set(k.split(":")[1] for k in mapping) == {"warn", "due"}
+        assert conn.fetch.await_args.args[1] == [5]
+
+
+class TestFire:
+
+    @pytest.mark.asyncio
+    async def test_sends_to_source_topic_and_drops_stale(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [
+            _task(1),
+            _task(2, status="DONE"),
+            _task(3, deadline=DEADLINE + datetime.timedelta(days=2)),  # дедлайн перенесли
+        ]
+        send = AsyncMock()
+        items = [member(1, "due", DEADLINE), member(2, "due", DEADLINE), member(3, "warn", DEADLINE),
+                 member(4, "due", DEADLINE)]
+        assert await fire(conn, items, send) == 1
+        chat, topic, text = send.await_args.args
+        assert (chat, topic) == (-100, 7)
+        assert "Сегодня дедлайн" in text and "&lt;Q1&gt;" in text and "@ivan" in text
+        assert conn.fetch.await_args.args[1] == [1, 2, 3, 4]
+
+    @pytest.mark.asyncio
+    async def test_send_failure_does_not_stop_batch(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [_task(1), _task(2)]
+        send = AsyncMock(side_effect=[RuntimeError("blocked"), None])
+        assert await fire(conn, [member(1, "warn", DEADLINE), member(2, "warn", DEADLINE)], send) == 1
@@ -0,0 +1,105 @@
+"""
+Тесты почасовых сводок активности (водяной знак, уплотнение, /stats)
+"""
+
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services import rollups
+from services.rollups import chat_stats, compact, local_midnight, rollup_once, rollup_pending
+
+
+class FakeTx:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def _conn(batches, mark=(0, None)):
+    """fetchrow: знак, затем результат пакета — по очереди для каждого прохода"""
+    conn = AsyncMock()
+    conn.transaction = lambda: FakeTx()
+    seq = []
+    last_id, last_ts = mark
+    for n, new_id in batches:
+        seq.append({"last_id": last_id, "last_ts": last_ts})
+        seq.append({"n": n, "last_id": new_id if n else None, "last_ts": None})
+        if n:
+            last_id = new_id
+    conn.fetchrow.side_effect = seq
+    return conn
+
+
+class TestRollup:
+
+    @pytest.mark.asyncio
+    async def test_advances_watermark_in_same_transaction(self):
+        conn = _conn([(3, 42)], mark=(10, None))
+        assert await rollup_once(conn, batch_rows=100) == 3
+        sql, last_id, last_ts, lag, limit = conn.fetchrow.await_args_list[1].args
+        assert sql == rollups.SQL_ROLLUP and last_id == 10 and limit == 100
+        conn.execute.assert_awaited_once()
+        assert conn.execute.await_args.args[:3] == (rollups.SQL_ADVANCE, rollups.WATERMARK, 42)
+
+    @pytest.mark.asyncio
+    async def test_empty_batch_keeps_watermark(self):
+        conn = _conn([(0, None)])
+        assert await rollup_once(conn) == 0
+        conn.execute.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_pending_loops_until_short_batch(self):
+        conn = _conn([(2, 2), (2, 4), (1, 5)])
+        assert await rollup_pending(conn, batch_rows=2) == 5
+        ids = [c.args[1] for c in conn.fetchrow.await_args_list if c.args[0] == rollups.SQL_ROLLUP]
+        assert ids == [0, 2, 4]
+
+
+class TestCompactAndStats:
+
+    def test_local_midnight(self):
+        now = datetime.datetime(2025, 3, 10, 22, 30, tzinfo=datetime.timezone.utc)  # 11.03 01:30 МСК
+        m = local_midnight(0, "Europe/Moscow", now)
+        assert m.date() == datetime.date(2025, 3, 11)
+        assert m.astimezone(datetime.timezone.utc).hour == 21
+        assert local_midnight(7, "Europe/Moscow", now).date() == datetime.date(2025, 3, 4)
+
+    @pytest.mark.asyncio
+    async def test_compact_boundary_is_local_midnight(self):
+        conn = AsyncMock()
+        await compact(conn, "Europe/Moscow", keep_days=14)
+        sql, cutoff, tz = conn.execute.await_args.args
+        assert sql == rollups.SQL_COMPACT and tz == "Europe/Moscow"
+        assert cutoff.hour == 0 and cutoff.minute == 0
+
+    @pytest.mark.asyncio
+    async def test_chat_stats_splits_grouping_sets(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [
+            {"g_topic": 1, "g_user": 1, "topic_id": None, "user_id": None, "cnt": 10},
+            {"g_topic": 0, "g_user": 1, "topic_id": 0, "user_id": None, "cnt": 3},
+            {"g_topic": 0, "g_user": 1, "topic_id": 5, "user_id": None, "cnt": 7},
+            {"g_topic": 1, "g_user": 0, "topic_id": None, "user_id": 100, "cnt": 4},
+            {"g_topic": 1, "g_user": 0, "topic_id": None, "user_id": 200, "cnt": 6},
+        ]
+        stats = await chat_stats(conn, -100, "Europe/Moscow", days=7, top=1)
+        assert stats.total == 10
+        assert stats.topics == [(5, 7)]
+        assert stats.users == [(200, 6)]
+        _, chat_id, since_day, since_ts, topic_id = conn.fetch.await_args.args
+        assert chat_id == -100 and topic_id is None
+        assert since_day == since_ts.date()
+
+    @pytest.mark.asyncio
+    async def test_chat_stats_empty(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [{"g_topic": 1, "g_user": 1, "topic_id": None, "user_id": None, "cnt": None}]
+        stats = await chat_stats(conn, -100, "Europe/Moscow", topic_id=5)
+        assert (stats.total, stats.topics, stats.users) == (0, [], [])
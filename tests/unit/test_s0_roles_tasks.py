@@ -63,6 +63,38 @@ class TestS0Commands:
                 await checklast_command(msg, command)
                 mock_do.assert_called_once_with(msg, 5)
 
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("created, reply", [
+        (True, "📌 Задача добавлена в планировщик, id #7"),
+        (False, "ℹ️ Уже задача #7"),
+    ])
+    async def test_add_repeat_reports_existing_task(self, created, reply):
+        """Повторный /add на то же сообщение: без новых таймеров эскалации и кнопки «Принял»"""
+        from main import add_task
+        from aiogram.filters import CommandObject
+        from services.tasks import Created
+
+        msg = AsyncMock()
+        msg.chat.id = -100
+        msg.message_thread_id = 3
+        msg.reply_to_message.text = "Смета"
+        msg.reply_to_message.message_id = 10
+        service = MagicMock()
+        service.return_value.create = AsyncMock(return_value=Created(7, created))
+
+        with patch('main.log_raw_update', new_callable=AsyncMock), \
+             patch('main._require_can_assign_msg', AsyncMock(return_value=True)), \
+             patch('main.get_conn', AsyncMock(return_value=AsyncMock())), \
+             patch('main._resolve_responsible', AsyncMock(return_value=(5, "ivan"))), \
+             patch('main.TaskService', service), \
+             patch('main._schedule_followups', new_callable=AsyncMock) as followups, \
+             patch('main.safe_reply', new_callable=AsyncMock) as mock_reply:
+            await add_task(msg, CommandObject(command="add", args="завтра"))
+
+        assert mock_reply.await_args.args == (msg, reply)
+        assert (mock_reply.await_args.kwargs["reply_markup"] is not None) == created
+        assert followups.await_count == (1 if created else 0)
+
 
 class TestS0Database:
     """Тесты работы с БД для S0"""
@@ -0,0 +1,48 @@
+"""
+Тесты полнотекстового поиска (/search)
+"""
+
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.search import normalize_query, search, SQL_MESSAGES, SQL_TASKS
+
+
+def _msg(i):
+    return {"id": i, "message_id": i, "topic_id": None, "user_id": 1, "text": f"отчёт {i}", "created_at": None}
+
+
+class TestSearch:
+
+    def test_normalize_query(self):
+        assert normalize_query("  отчёт   для\nклиента ") == "отчёт для клиента"
+        assert normalize_query(None) == ""
+        assert len(normalize_query("я" * 1000)) == 200
+
+    @pytest.mark.asyncio
+    async def test_first_page_includes_tasks_and_detects_next(self):
+        conn = AsyncMock()
+        conn.fetch = AsyncMock(side_effect=[[_msg(i) for i in range(6)], [{"id": 9, "title": "Отчёт"}]])
+        page = await search(conn, "отчёт", -100, 7, page=0, page_size=5)
+        assert len(page.messages) == 5 and page.has_next
+        assert page.tasks == [{"id": 9, "title": "Отчёт"}]
+        sql, *args = conn.fetch.call_args_list[0][0]
+        assert sql is SQL_MESSAGES and args == ["отчёт", -100, 7, 6, 0]
+        assert conn.fetch.call_args_list[1][0][0] is SQL_TASKS
+
+    @pytest.mark.asyncio
+    async def test_later_pages_skip_tasks(self):
+        conn = AsyncMock()
+        conn.fetch = AsyncMock(return_value=[_msg(1), _msg(2)])
+        page = await search(conn, "отчёт", -100, None, page=2, page_size=5)
+        assert conn.fetch.call_count == 1
+        assert conn.fetch.call_args[0][-1] == 10  # OFFSET
+        assert not page.has_next and page.tasks == []
+
+    def test_queries_use_gin_columns(self):
+        assert "text_tsv @@ q" in SQL_MESSAGES
+        assert "search_tsv @@ q" in SQL_TASKS
@@ -0,0 +1,138 @@
+"""
+Тесты хранилища состояния диалогов (L1 в процессе + Redis L2)
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.state import StateStore, TTLCache
+
+
+class FakeL2:
+    """L2 в памяти; down=True имитирует недоступный Redis, slow — медленный"""
+
+    def __init__(self):
+        self.data = {}
+        self.sets = {}
+        self.down = False
+        self.slow = False
+        self.calls = 0
+
+    async def _hit(self):
+        self.calls += 1
+        if self.down:
+            raise ConnectionError("redis down")
+        if self.slow:
+            await asyncio.sleep(1)
+
+    async def get(self, key):
+        await self._hit()
+        return self.data.get(key)
+
+    async def set(self, key, value, ttl):
+        await self._hit()
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        await self._hit()
+        for k in keys:
+            self.data.pop(k, None)
+            self.sets.pop(k, None)
+
+    async def smembers(self, key):
+        await self._hit()
+        return set(self.sets.get(key, set()))
+
+    async def sadd(self, key, member, ttl):
+        await self._hit()
+        self.sets.setdefault(key, set()).add(member)
+
+    async def srem(self, key, member):
+        await self._hit()
+        self.sets.get(key, set()).discard(member)
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+class TestStateStore:
+
+    @pytest.mark.asyncio
+    async def test_write_through_and_l1_reads(self):
+        l2 = FakeL2()
+        store = StateStore(l2=l2)
+        await store.set("newtask:1:2", {"text": "x"}, ttl=60)
+        assert json.loads(l2.data["newtask:1:2"]) == {"text": "x"}
+
+        calls = l2.calls
+        assert await store.get("newtask:1:2") == {"text": "x"}
+        assert l2.calls == calls  # чтение из L1, без сети
+
+    @pytest.mark.asyncio
+    async def test_l1_miss_falls_back_to_l2(self):
+        l2 = FakeL2()
+        l2.data["k"] = json.dumps([1, 2])
+        store = StateStore(l2=l2)
+        assert await store.get("k") == [1, 2]
+
+    @pytest.mark.asyncio
+    async def test_degraded_mode_keeps_flow_alive(self):
+        clock = Clock()
+        l2 = FakeL2()
+        store = StateStore(l2=l2, clock=clock)
+        l2.down = True
+
+        await store.set("k", {"a": 1})
+        assert store.degraded
+        assert await store.get("k") == {"a": 1}
+        assert await store.toggle("sel", "5") is True
+        assert await store.members("sel") == {"5"}
+
+        # после cooldown снова пробуем L2
+        calls = l2.calls
+        clock.t += StateStore.COOLDOWN + 1
+        l2.down = False
+        assert not store.degraded
+        await store.set("k2", 1)
+        assert l2.calls == calls + 1
+
+    @pytest.mark.asyncio
+    async def test_slow_l2_times_out(self):
+        l2 = FakeL2()
+        l2.slow = True
+        store = StateStore(l2=l2, timeout=0.01)
+        await store.set("k", 1)
+        assert store.degraded
+        assert await store.get("k") == 1
+
+    @pytest.mark.asyncio
+    async def test_delete_while_degraded_is_not_resurrected(self):
+        clock = Clock()
+        l2 = FakeL2()
+        store = StateStore(l2=l2, clock=clock)
+        await store.set("k", 1)
+        l2.down = True
+        await store.delete("k")
+        clock.t += StateStore.COOLDOWN + 1
+        l2.down = False
+        assert await store.get("k") is None  # в L2 осталось старое значение
+
+    def test_ttl_cache_expiry_and_bound(self):
+        clock = Clock()
+        c = TTLCache(max_items=2, clock=clock)
+        c.set("a", 1, ttl=10)
+        c.set("b", 2, ttl=10)
+        c.set("c", 3, ttl=10)
+        assert c.get("a") is None and len(c) == 2
+        clock.t += 11
+        assert c.get("b") is None
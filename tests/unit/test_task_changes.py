@@ -0,0 +1,55 @@
+"""
+Тесты потока изменений задач: разбор pg_notify и склейка уведомлений в пачки
+"""
+
+import asyncio
+import json
+import pytest
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.task_changes import TaskChangeListener, parse_payload
+
+
+def _payload(task_id, status="TODO"):
+    return json.dumps({"id": task_id, "old": None, "new": [111, "ivan", -100, None, 3, status]})
+
+
+class TestTaskChanges:
+
+    def test_parse_created(self):
+        change = parse_payload(_payload(7))
+        assert change.task_id == 7 and change.old is None
+        assert (change.new.username, change.new.chat_id, change.new.status) == ("ivan", -100, "TODO")
+
+    @pytest.mark.asyncio
+    async def test_steady_stream_flushed_by_max_delay(self):
+        batches = []
+
+        async def subscriber(changes):
+            batches.append([c.task_id for c in changes])
+
+        listener = TaskChangeListener(None, window=0.05, max_delay=0.15, max_batch=1000)
+        listener.subscribe(subscriber)
+        for i in range(15):  # паузы короче window — тишины нет
+            listener._on_notify(None, 0, "task_changed", _payload(i))
+            await asyncio.sleep(0.02)
+        assert batches and batches[0][0] == 0  # ушла хотя бы одна пачка, не дожидаясь конца потока
+        await listener.drain()
+        assert [i for b in batches for i in b] == list(range(15))
+
+    @pytest.mark.asyncio
+    async def test_full_batch_flushed_at_once(self):
+        batches = []
+
+        async def subscriber(changes):
+            batches.append(len(changes))
+
+        listener = TaskChangeListener(None, window=10, max_delay=10, max_batch=3)
+        listener.subscribe(subscriber)
+        for i in range(3):
+            listener._on_notify(None, 0, "task_changed", _payload(i))
+        await asyncio.wait_for(listener.drain(), 1)
+        assert batches == [3]
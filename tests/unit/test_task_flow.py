@@ -0,0 +1,59 @@
+"""
+Тесты агрегации потока задач (task_events -> task_flow_daily)
+"""
+
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.rollups import SQL_ADVANCE
+from services.task_flow import WATERMARK, flow_once, flow_pending, project_flow
+
+
+def _conn(*results):
+    conn = AsyncMock()
+    conn.transaction = MagicMock(return_value=AsyncMock())
+    conn.fetchrow.side_effect = [r for pair in results for r in ({"last_id": pair[0]}, pair[1])]
+    return conn
+
+
+class TestFlowOnce:
+
+    @pytest.mark.asyncio
+    async def test_advances_watermark(self):
+        conn = _conn((10, {"n": 3, "last_id": 13}))
+        assert await flow_once(conn, "Europe/Moscow", batch_rows=100) == 3
+        args = conn.fetchrow.await_args_list[1].args
+        assert args[1:] == (10, 30.0, 100, "Europe/Moscow")
+        conn.execute.assert_awaited_once_with(SQL_ADVANCE, WATERMARK, 13, None)
+
+    @pytest.mark.asyncio
+    async def test_empty_batch_keeps_watermark(self):
+        conn = _conn((10, {"n": 0, "last_id": None}))
+        assert await flow_once(conn, "UTC") == 0
+        conn.execute.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_pending_reads_until_short_batch(self):
+        conn = _conn((0, {"n": 2, "last_id": 2}), (2, {"n": 1, "last_id": 3}))
+        assert await flow_pending(conn, "UTC", batch_rows=2) == 3
+        assert conn.execute.await_count == 2
+
+
+class TestProjectFlow:
+
+    @pytest.mark.asyncio
+    async def test_averages(self):
+        conn = AsyncMock()
+        conn.fetch.return_value = [
+            {"status": "IN_PROGRESS", "entered": 4, "exited": 2, "seconds_in": 7200.0, "cycle_seconds": 0.0},
+            {"status": "DONE", "entered": 2, "exited": 0, "seconds_in": 0.0, "cycle_seconds": 172800.0},
+        ]
+        flow = await project_flow(conn, None, datetime.date(2025, 3, 1))
+        assert conn.fetch.await_args.args[1:] == (0, datetime.date(2025, 3, 1))
+        assert flow["IN_PROGRESS"].avg_seconds_in == 3600.0 and flow["IN_PROGRESS"].avg_cycle_seconds is None
+        assert flow["DONE"].avg_cycle_seconds == 86400.0 and flow["DONE"].avg_seconds_in is None
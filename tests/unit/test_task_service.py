@@ -0,0 +1,108 @@
+"""
+Тесты единого сервиса создания задач (TaskService)
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.tasks import Created, TaskService, NewTask, SQL_INSERT_ONE, SQL_INSERT_MANY, SQL_SET_STATUS, SQL_SET_ACTOR, MAX_BULK, parse_task_ids
+
+
+def _conn():
+    conn = MagicMock()
+    conn.fetchrow = AsyncMock()
+    conn.fetch = AsyncMock()
+    return conn
+
+
+class TestTaskService:
+    """Создание задач: подзапросы автора/проекта, пачки, идемпотентность"""
+
+    def test_insert_resolves_author_and_project_inline(self):
+        """Автор и проект резолвятся подзапросами внутри INSERT"""
+        for sql in (SQL_INSERT_ONE, SQL_INSERT_MANY):
+            assert "SELECT id FROM core_user WHERE telegram_id" in sql
+            assert "SELECT project_id FROM core_tggroup WHERE telegram_id" in sql
+            assert "ON CONFLICT (source_chat_id, source_message_id)" in sql
+
+    @pytest.mark.asyncio
+    async def test_create_single(self):
+        conn = _conn()
+        conn.fetchrow.return_value = {"id": 7, "created": True}
+
+        task = NewTask(title="x" * 300, source_chat_id=-100, source_message_id=5)
+        assert await TaskService(conn).create(task) == Created(7, True)
+
+        args = conn.fetchrow.call_args[0]
+        assert args[0] == SQL_INSERT_ONE
+        assert len(args[1]) == 256  # title обрезан
+        assert args[4] == "unknown"  # responsible_username по умолчанию
+
+    @pytest.mark.asyncio
+    async def test_create_many_single_statement_and_dedup(self):
+        """Пачка — один запрос; дубли по ключу источника схлопываются, created — из RETURNING"""
+        conn = _conn()
+        conn.fetch.return_value = [
+            {"id": 11, "source_chat_id": -100, "source_message_id": 1, "created": True},
+            {"id": 12, "source_chat_id": -100, "source_message_id": 2, "created": False},
+        ]
+
+        results = await TaskService(conn).create_many([
+            NewTask(title="a", source_chat_id=-100, source_message_id=1),
+            NewTask(title="b", source_chat_id=-100, source_message_id=2),
+            NewTask(title="a again", source_chat_id=-100, source_message_id=1),
+        ])
+
+        assert results == [Created(11, True), Created(12, False), Created(11, True)]
+        conn.fetch.assert_awaited_once()
+        sql, titles = conn.fetch.call_args[0][:2]
+        assert sql == SQL_INSERT_MANY and titles == ["a", "b"]
+
+
+class TestBulkStatus:
+    """Смена статуса пачкой: один UPDATE ... = ANY, отчёт о ненайденных"""
+
+    def test_parse_ids(self):
+        assert parse_task_ids("#1 #2, 3 #2 review") == ([1, 2, 3], ["review"])
+        assert parse_task_ids(None) == ([], [])
+        # вне bigint и ноль — не id: обработчик ответит подсказкой, а не ошибкой asyncpg
+        assert parse_task_ids("#99999999999999999999 #0 #5") == ([5], ["#99999999999999999999", "#0"])
+
+    @pytest.mark.asyncio
+    async def test_too_many_ids_rejected_not_truncated(self):
+        conn = _conn()
+        with pytest.raises(ValueError):
+            await TaskService(conn).set_status(list(range(1, MAX_BULK + 2)), "DONE")
+        conn.fetch.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_one_update_reports_missing(self):
+        conn = _conn()
+        conn.fetch.return_value = [{"id": 3}, {"id": 1}]
+
+        result = await TaskService(conn).set_status([1, 2, 3, 1], "DONE")
+
+        assert (result.updated, result.missing) == ([1, 3], [2])
+        conn.fetch.assert_awaited_once_with(SQL_SET_STATUS, [1, 2, 3], "DONE")
+
+    @pytest.mark.asyncio
+    async def test_actor_set_in_same_transaction(self):
+        conn = _conn()
+        conn.fetch.return_value = [{"id": 5}]
+        conn.transaction = MagicMock(return_value=AsyncMock())
+        conn.execute = AsyncMock()
+
+        result = await TaskService(conn).set_status([5], "DONE", actor="tg:555")
+
+        assert result.updated == [5]
+        conn.transaction.assert_called_once()
+        conn.execute.assert_awaited_once_with(SQL_SET_ACTOR, "tg:555")
+
+    @pytest.mark.asyncio
+    async def test_unknown_status_rejected(self):
+        with pytest.raises(ValueError):
+            await TaskService(MagicMock()).set_status([1], "LOST")
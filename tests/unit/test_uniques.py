@@ -0,0 +1,94 @@
+"""
+Тесты DAU/WAU на HyperLogLog (ключи, PFADD при ingest, снимки в Postgres)
+"""
+
+import datetime
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock, MagicMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services import uniques
+from services.uniques import counts, day_key, index_key, local_day, record, snapshot
+
+DAY = datetime.date(2025, 3, 11)
+
+
+class FakePipeline:
+    def __init__(self, results=None):
+        self.calls = []
+        self.results = results or []
+
+    def __getattr__(self, name):
+        def cmd(*args):
+            self.calls.append((name, *args))
+            return self
+        return cmd
+
+    async def execute(self):
+        return self.results
+
+
+def _redis(pipe, members=()):
+    redis = MagicMock()
+    redis.pipeline.return_value = pipe
+    redis.smembers = AsyncMock(return_value=set(members))
+    return redis
+
+
+class TestKeys:
+
+    def test_local_day_uses_timezone(self):
+        ts = datetime.datetime(2025, 3, 10, 22, 30, tzinfo=datetime.timezone.utc)
+        assert local_day(ts, "Europe/Moscow") == DAY
+        assert day_key(-100, 0, DAY) == "hll:-100:0:20250311"
+        assert index_key(DAY) == "hll:idx:20250311"
+
+
+class TestRecord:
+
+    @pytest.mark.asyncio
+    async def test_chat_and_topic_counters(self):
+        pipe = FakePipeline()
+        await record(_redis(pipe), -100, 5, 42, DAY)
+        pfadds = [c for c in pipe.calls if c[0] == "pfadd"]
+        assert pfadds == [("pfadd", "hll:-100:0:20250311", 42), ("pfadd", "hll:-100:5:20250311", 42)]
+        assert ("sadd", "hll:idx:20250311", "-100:0", "-100:5") in pipe.calls
+        assert all(c[2] == uniques.KEEP_DAYS * 86400 for c in pipe.calls if c[0] == "expire")
+
+    @pytest.mark.asyncio
+    async def test_without_topic_only_chat(self):
+        pipe = FakePipeline()
+        await record(_redis(pipe), -100, None, 42, DAY)
+        assert [c[1] for c in pipe.calls if c[0] == "pfadd"] == ["hll:-100:0:20250311"]
+
+
+class TestSnapshot:
+
+    @pytest.mark.asyncio
+    async def test_wau_unions_seven_days(self):
+        pipe = FakePipeline(results=[3, 10])
+        got = await counts(_redis(pipe, members=[b"-100:5"]), DAY)
+        assert got == [(-100, 5, 3, 10)]
+        day_count, week_count = pipe.calls
+        assert day_count == ("pfcount", "hll:-100:5:20250311")
+        assert len(week_count) == 1 + 7 and week_count[-1] == "hll:-100:5:20250305"
+
+    @pytest.mark.asyncio
+    async def test_snapshot_writes_yesterday_and_today(self):
+        redis = _redis(FakePipeline(results=[2, 4]))
+        redis.smembers = AsyncMock(side_effect=[{b"-100:0"}, set()])
+        conn = AsyncMock()
+        now = datetime.datetime(2025, 3, 11, 9, 0, tzinfo=datetime.timezone.utc)
+        assert await snapshot(redis, conn, "Europe/Moscow", now) == 1
+        sql, rows = conn.executemany.await_args.args
+        assert sql == uniques.SQL_UPSERT
+        assert rows == [(-100, 0, datetime.date(2025, 3, 10), 2, 4)]
+
+    @pytest.mark.asyncio
+    async def test_nothing_active(self):
+        conn = AsyncMock()
+        assert await snapshot(_redis(FakePipeline()), conn, "Europe/Moscow") == 0
+        conn.executemany.assert_not_awaited()
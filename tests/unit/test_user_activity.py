@@ -0,0 +1,49 @@
+"""
+Тесты сводки активности user_chat_activity (ведётся при ingest)
+"""
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+import sys
+import os
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.media import MEDIA_TYPES
+
+
+def _private_msg(from_id=555):
+    msg = MagicMock()
+    msg.chat.id = 555
+    msg.chat.type = "private"
+    msg.message_id = 10
+    msg.text = "привет"
+    msg.caption = None
+    for kind in MEDIA_TYPES:
+        setattr(msg, kind, None)
+    msg.message_thread_id = None
+    msg.date = None
+    msg.from_user.id = from_id
+    msg.from_user.is_bot = False
+    msg.from_user.username = "Ivan"
+    msg.from_user.first_name = "Иван"
+    msg.from_user.last_name = ""
+    return msg
+
+
+class TestUserChatActivity:
+
+    @pytest.mark.asyncio
+    async def test_ingest_updates_activity_in_same_statement(self):
+        from main import log_raw_update
+        conn = AsyncMock()
+        conn.fetchrow = AsyncMock(return_value={"id": 1, "username": "ivan", "telegram_id": 555})
+        with patch('main.get_conn', AsyncMock(return_value=conn)), \
+             patch('main._maybe_route_to_forward', new_callable=AsyncMock):
+            await log_raw_update(_private_msg())
+
+        statements = [c[0][0] for c in conn.execute.call_args_list]
+        ingest = [s for s in statements if "INSERT INTO raw_updates" in s]
+        assert len(ingest) == 1
+        assert "INSERT INTO user_chat_activity" in ingest[0]
+        assert "msg_count = user_chat_activity.msg_count + 1" in ingest[0]
@@ -0,0 +1,47 @@
+"""
+Тесты каталога пользователей (username <-> пользователь)
+"""
+
+import pytest
+import sys
+import os
+from unittest.mock import AsyncMock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bot'))
+
+from services.users import UserDirectory, UserRow, SQL_BY_USERNAME
+
+
+class TestUserDirectory:
+
+    @pytest.mark.asyncio
+    async def test_lookup_hits_db_once(self):
+        d = UserDirectory()
+        conn = AsyncMock()
+        conn.fetchrow = AsyncMock(return_value={"id": 5, "username": "ivan", "telegram_id": 111})
+        row = await d.lookup(conn, "@Ivan")
+        assert row == UserRow(5, "ivan", 111)
+        assert conn.fetchrow.call_args[0] == (SQL_BY_USERNAME, "ivan")
+        assert await d.lookup(conn, "IVAN") == row
+        assert conn.fetchrow.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_misses_are_not_cached(self):
+        d = UserDirectory()
+        conn = AsyncMock()
+        conn.fetchrow = AsyncMock(return_value=None)
+        assert await d.lookup(conn, "ghost") is None
+        assert await d.lookup(conn, "ghost") is None
+        assert conn.fetchrow.call_count == 2
+        assert await d.lookup(conn, "") is None
+        assert conn.fetchrow.call_count == 2
+
+    def test_rename_evicts_old_username(self):
+        d = UserDirectory()
+        d.put(UserRow(5, "ivan", 111))
+        d.put(UserRow(5, "ivan_new", 111))
+        assert d.get("ivan") is None
+        assert d.get("ivan_new").id == 5
+
+    def test_display_falls_back_to_id(self):
+        assert UserRow(1, "", 42).display == "id:42"